@@ -1,12 +1,287 @@
+"""Run the research agent from the command line, for one question or a batch.
+
+    python examples/cli_research.py "A comic about the first moon landing"
+    python examples/cli_research.py --batch topics.jsonl --out comics/ --workers 4 --images
+
+A batch file has one JSON object per line with a "topic" (or "question") and
+optionally an "id" and per-item overrides (initial_queries, max_loops,
+reasoning_model, language, aspect_ratio, image_size). Each item is written to
+`<out>/<id>/` as soon as it is done and recorded in `<out>/progress.jsonl`, so
+running the same command again resumes an interrupted batch without redoing
+finished items.
+"""
+
 import argparse
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import pathlib
+import statistics
+import time
+from typing import Optional
+
 from langchain_core.messages import HumanMessage
 from agent.graph import graph
 
+PROGRESS_FILE = "progress.jsonl"
+STORYBOARD_FILE = "storyboard.json"
+
+
+def build_state(
+    question: str,
+    initial_queries: int,
+    max_loops: int,
+    reasoning_model: Optional[str],
+    **extra,
+) -> dict:
+    """Input state of one graph run."""
+    state = {
+        "messages": [HumanMessage(content=question)],
+        "initial_search_query_count": initial_queries,
+        "max_research_loops": max_loops,
+    }
+    extra["reasoning_model"] = reasoning_model
+    state.update({key: value for key, value in extra.items() if value is not None})
+    return state
+
+
+def read_batch(path: str) -> list[dict]:
+    """Read batch items, giving items without an "id" one derived from their topic."""
+    items = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"topic": item}
+            topic = item.get("topic") or item.get("question")
+            if not topic:
+                raise SystemExit(f"{path}:{line_number}: item has no topic")
+            item["topic"] = topic
+            # Derived from the topic rather than the line, so resuming does not
+            # depend on the order of the file
+            item_id = str(item.get("id") or hashlib.sha1(topic.encode("utf-8")).hexdigest()[:12])
+            if item_id in seen:
+                raise SystemExit(f"{path}:{line_number}: duplicate item id {item_id}")
+            seen.add(item_id)
+            item["id"] = item_id
+            items.append(item)
+    return items
+
+
+def read_progress(out_dir: pathlib.Path) -> dict[str, dict]:
+    """Latest progress record per item id."""
+    progress = {}
+    path = out_dir / PROGRESS_FILE
+    if path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short when the batch was interrupted
+            progress[record["id"]] = record
+    return progress
+
+
+def write_json(path: pathlib.Path, value) -> None:
+    """Write `value` atomically, so an interrupted batch never leaves half a file."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(value, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class BatchRunner:
+    """Run batch items on `workers` concurrent graphs and record each one when done."""
+
+    def __init__(self, args: argparse.Namespace, out_dir: pathlib.Path):
+        self.args = args
+        self.out_dir = out_dir
+        self.results: list[dict] = []
+        self.total = 0
+        self._progress = open(out_dir / PROGRESS_FILE, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        self._progress.close()
+
+    def _record(self, record: dict) -> None:
+        self._progress.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._progress.flush()
+        os.fsync(self._progress.fileno())
+        self.results.append(record)
+        status = record["status"]
+        detail = record.get("error") or f"{record['pages']} pages, {record['images']} images"
+        print(
+            f"[{len(self.results)}/{self.total}] {status:<6} {record['id']} "
+            f"({record['seconds']:.1f}s): {detail}"
+        )
+
+    async def _storyboard(self, item: dict, item_dir: pathlib.Path) -> dict:
+        """Run the graph for `item`, or reuse the storyboard an earlier attempt wrote."""
+        path = item_dir / STORYBOARD_FILE
+        if path.exists():
+            return json.loads(path.read_text(encoding="utf-8"))
+        args = self.args
+        state = build_state(
+            item["topic"],
+            item.get("initial_queries", args.initial_queries),
+            item.get("max_loops", args.max_loops),
+            item.get("reasoning_model", args.reasoning_model),
+            language=item.get("language", args.language),
+            aspect_ratio=item.get("aspect_ratio", args.aspect_ratio),
+            image_size=item.get("image_size", args.image_size),
+        )
+        result = await graph.ainvoke(state, {"configurable": {"thread_id": item["id"]}})
+        messages = result.get("messages", [])
+        node_metrics = result.get("node_metrics") or []
+        storyboard = {
+            "id": item["id"],
+            "topic": item["topic"],
+            "pages": messages[-1].content if messages else [],
+            "search_queries": result.get("search_query", []),
+            "tokens": sum(
+                (m.get("prompt_tokens") or 0) + (m.get("completion_tokens") or 0)
+                for m in node_metrics
+            ),
+            "model_calls": sum(m.get("model_calls") or 0 for m in node_metrics),
+        }
+        write_json(path, storyboard)
+        return storyboard
 
-def main() -> None:
+    async def _images(self, item: dict, item_dir: pathlib.Path, pages: list) -> int:
+        """Generate missing page images; returns how many pages have one.
+
+        Raises:
+            RuntimeError: Some drawable pages are still without an image
+        """
+        from agent.images import ImageOptions, get_or_generate_images
+
+        async def page_image(page: dict) -> int:
+            stem = f"page-{page['id']}"
+            if any(path.suffix != ".tmp" for path in item_dir.glob(f"{stem}.*")):
+                return 1
+            options = ImageOptions(
+                prompt=str(page["detail"]).strip(),
+                aspect_ratio=item.get("aspect_ratio", self.args.aspect_ratio),
+                image_size=item.get("image_size", self.args.image_size),
+            )
+            stored, _, _ = await get_or_generate_images(options, item["id"])
+            if not stored:
+                return 0
+            image = stored[0]
+            extension = mimetypes.guess_extension(image.mime_type) or ".png"
+            tmp = item_dir / f"{stem}{extension}.tmp"
+            tmp.write_bytes(image.read_bytes())
+            os.replace(tmp, item_dir / f"{stem}{extension}")
+            return 1
+
+        drawable = [p for p in pages if isinstance(p, dict) and "id" in p and p.get("detail")]
+        results = await asyncio.gather(
+            *(page_image(page) for page in drawable), return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        drawn = sum(r for r in results if not isinstance(r, BaseException))
+        # Pages without an id or a detail have nothing to draw
+        if drawn < len(drawable):
+            reason = f": {errors[0]}" if errors else ""
+            raise RuntimeError(f"{drawn} of {len(drawable)} page images{reason}")
+        return drawn
+
+    async def _run_item(self, item: dict) -> None:
+        started = time.monotonic()
+        item_dir = self.out_dir / item["id"]
+        item_dir.mkdir(exist_ok=True)
+        record = {"id": item["id"], "topic": item["topic"], "pages": 0, "images": 0}
+        try:
+            storyboard = await self._storyboard(item, item_dir)
+            pages = storyboard["pages"] if isinstance(storyboard["pages"], list) else []
+            record.update(
+                pages=len(pages),
+                tokens=storyboard.get("tokens", 0),
+                model_calls=storyboard.get("model_calls", 0),
+            )
+            if self.args.images:
+                record["images"] = await self._images(item, item_dir, pages)
+            record["status"] = "done"
+        except Exception as exc:
+            record.update(status="failed", error=f"{type(exc).__name__}: {exc}")
+        record["seconds"] = round(time.monotonic() - started, 2)
+        self._record(record)
+
+    async def run(self, items: list[dict]) -> None:
+        self.total = len(items)
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+
+        async def worker() -> None:
+            while not queue.empty():
+                await self._run_item(queue.get_nowait())
+
+        await asyncio.gather(*(worker() for _ in range(max(1, self.args.workers))))
+
+
+def summarize(results: list[dict], skipped: int, elapsed: float) -> dict:
+    """Throughput of the items run in this invocation."""
+    done = [r for r in results if r["status"] == "done"]
+    latencies = sorted(r["seconds"] for r in done)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None
+    return {
+        "done": len(done),
+        "failed": len(results) - len(done),
+        "skipped": skipped,
+        "elapsed_seconds": round(elapsed, 1),
+        "items_per_minute": round(len(done) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "pages": sum(r["pages"] for r in done),
+        "images": sum(r["images"] for r in done),
+        "tokens": sum(r.get("tokens", 0) for r in done),
+        "model_calls": sum(r.get("model_calls", 0) for r in done),
+        "item_seconds_p50": round(statistics.median(latencies), 1) if latencies else None,
+        "item_seconds_p95": round(p95, 1) if p95 is not None else None,
+    }
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    """Run every unfinished item of `args.batch`; returns the process exit status."""
+    out_dir = pathlib.Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    items = read_batch(args.batch)
+    progress = read_progress(out_dir)
+    todo = [item for item in items if progress.get(item["id"], {}).get("status") != "done"]
+    skipped = len(items) - len(todo)
+    if skipped:
+        print(f"Resuming: {skipped} of {len(items)} items already done")
+
+    runner = BatchRunner(args, out_dir)
+    started = time.monotonic()
+    try:
+        asyncio.run(runner.run(todo))
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume")
+    finally:
+        runner.close()
+    summary = summarize(runner.results, skipped, time.monotonic() - started)
+    write_json(out_dir / "summary.json", summary)
+    print(
+        f"{summary['done']} done, {summary['failed']} failed, {summary['skipped']} skipped "
+        f"in {summary['elapsed_seconds']}s ({summary['items_per_minute']} items/min); "
+        f"{summary['pages']} pages, {summary['images']} images, {summary['tokens']} tokens"
+    )
+    if summary["item_seconds_p50"] is not None:
+        print(
+            f"Seconds per item: p50 {summary['item_seconds_p50']}, "
+            f"p95 {summary['item_seconds_p95']}"
+        )
+    return 1 if summary["failed"] else 0
+
+
+def main() -> Optional[int]:
     """Run the research agent from the command line."""
     parser = argparse.ArgumentParser(description="Run the LangGraph research agent")
-    parser.add_argument("question", help="Research question")
+    parser.add_argument("question", nargs="?", help="Research question")
     parser.add_argument(
         "--initial-queries",
         type=int,
@@ -21,23 +296,37 @@ def main() -> None:
     )
     parser.add_argument(
         "--reasoning-model",
-        default="gemini-2.5-pro-preview-05-06",
-        help="Model for the final answer",
+        help=(
+            "Model for reflection and the final answer (default: the graph's configured "
+            "models, or routed per step when model_routing is on)"
+        ),
     )
+    batch = parser.add_argument_group("batch mode")
+    batch.add_argument("--batch", help="JSONL file of topics to run instead of one question")
+    batch.add_argument("--out", default="comics", help="Output directory of a batch")
+    batch.add_argument("--workers", type=int, default=4, help="Items run at the same time")
+    batch.add_argument("--images", action="store_true", help="Also generate page images")
+    batch.add_argument("--language", help="Storyboard language (default: the graph's)")
+    batch.add_argument("--aspect-ratio", default="16:9", help="Page image aspect ratio")
+    batch.add_argument("--image-size", default="1K", help="Page image size")
     args = parser.parse_args()
 
-    state = {
-        "messages": [HumanMessage(content=args.question)],
-        "initial_search_query_count": args.initial_queries,
-        "max_research_loops": args.max_loops,
-        "reasoning_model": args.reasoning_model,
-    }
+    if args.batch:
+        return run_batch(args)
+    if not args.question:
+        parser.error("a question or --batch is required")
+
+    state = build_state(
+        args.question, args.initial_queries, args.max_loops, args.reasoning_model
+    )
 
-    result = graph.invoke(state)
+    # The graph nodes are async, so drive the graph with ainvoke
+    result = asyncio.run(graph.ainvoke(state))
     messages = result.get("messages", [])
     if messages:
         print(messages[-1].content)
+    return None
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,68 @@
+"""Measure per-node chat model setup overhead with and without the model registry.
+
+Before the registry every node invocation built a fresh `ChatGoogleGenerativeAI`
+(plus a `with_structured_output` wrapper); now nodes fetch a shared instance from
+`agent.clients.get_chat_model`. No requests are sent, so a dummy key is enough:
+
+    python scripts/bench_model_registry.py --iterations 200
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+
+from langchain_google_genai import ChatGoogleGenerativeAI  # noqa: E402
+
+from agent.clients import get_chat_model  # noqa: E402
+from agent.tools_and_schemas import Reflection, SearchQueryList  # noqa: E402
+
+# (node, model, temperature, schema) as used by the research graph
+NODES = [
+    ("generate_query", "gemini-2.0-flash", 1.0, SearchQueryList),
+    ("reflection", "gemini-2.5-flash", 1.0, Reflection),
+    ("finalize_answer", "gemini-2.5-pro", 0.0, None),
+]
+
+
+def build_fresh(model, temperature, schema):
+    llm = ChatGoogleGenerativeAI(
+        model=model,
+        temperature=temperature,
+        max_retries=2,
+        api_key=os.getenv("GEMINI_API_KEY"),
+    )
+    return llm.with_structured_output(schema) if schema is not None else llm
+
+
+def time_calls(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.mean(samples), statistics.median(samples)
+
+
+def main() -> None:
+    """Print setup cost per node invocation in microseconds."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'node':<16}{'fresh mean':>12}{'fresh p50':>12}{'registry mean':>15}{'registry p50':>14}")
+    for node, model, temperature, schema in NODES:
+        fresh = time_calls(lambda: build_fresh(model, temperature, schema), args.iterations)
+        get_chat_model(model, temperature, schema)  # first call pays the setup once
+        shared = time_calls(
+            lambda: get_chat_model(model, temperature, schema), args.iterations
+        )
+        print(
+            f"{node:<16}{fresh[0]:>10.1f}us{fresh[1]:>10.1f}us{shared[0]:>13.1f}us{shared[1]:>12.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Offline throughput benchmark for the research graph and the image endpoints.
+
+The Gemini backends (the shared google-genai client and the chat model class that
+`agent.clients` hands out) are replaced by local fakes with configurable latency, jitter, failure rate and
+payload size. No network access or API key is needed, so the numbers can be
+tracked in CI to catch scheduling and memory regressions:
+
+    python scripts/bench_offline.py --runs 50 --concurrency 10 --batches 20
+    python scripts/bench_offline.py --json --max-p95 5 --max-rss-mb 800
+
+Caches are disabled by default so every run exercises the full call path.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+import types
+import uuid
+
+# Configure the app and graph before they are imported.
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage  # noqa: E402
+
+import agent.clients as clients  # noqa: E402
+
+
+class FakeBackend:
+    """Latency, failure and payload settings shared by every fake model."""
+
+    def __init__(self, latency, jitter, failure_rate, payload_bytes, pages, seed):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.payload_bytes = payload_bytes
+        self.pages = pages
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    async def call(self, latency_scale: float = 1.0) -> None:
+        """Sleep for one simulated round trip and fail at the configured rate."""
+        self.calls += 1
+        delay = self.rng.gauss(self.latency, self.jitter) * latency_scale
+        await asyncio.sleep(max(0.0, delay))
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            raise RuntimeError("503 UNAVAILABLE (simulated)")
+
+    def text(self, size: int | None = None) -> str:
+        size = self.payload_bytes if size is None else size
+        return ("lorem ipsum " * (size // 12 + 1))[:size]
+
+    def storyboard(self) -> str:
+        pages = [
+            {"id": i + 1, "detail": f"page {i + 1}: " + self.text()} for i in range(self.pages)
+        ]
+        return "```json\n" + json.dumps(pages, ensure_ascii=False) + "\n```"
+
+
+BACKEND: FakeBackend
+
+
+def _usage(prompt, text):
+    return {
+        "input_tokens": len(str(prompt)) // 4,
+        "output_tokens": len(text) // 4,
+        "total_tokens": (len(str(prompt)) + len(text)) // 4,
+    }
+
+
+class FakeStructuredModel:
+    """Stands in for `with_structured_output(schema, include_raw=True)`."""
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def _parse(self):
+        name = self.schema.__name__
+        if name == "SearchQueryList":
+            queries = [f"topic {uuid.uuid4().hex[:8]} facet {i}" for i in range(3)]
+            return self.schema(query=queries, rationale="benchmark")
+        if name == "Reflection":
+            return self.schema(
+                is_sufficient=False,
+                knowledge_gap="benchmark gap",
+                follow_up_queries=[f"follow up {uuid.uuid4().hex[:8]}"],
+            )
+        if name == "FactSheet":
+            entry = {"name": f"character {uuid.uuid4().hex[:4]}", "facts": [BACKEND.text(120)]}
+            return self.schema(characters=[entry], settings=[], objects=[])
+        return self.schema.model_validate({})
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        await BACKEND.call(0.5)
+        parsed = self._parse()
+        raw = AIMessage(content="", usage_metadata=_usage(prompt, parsed.model_dump_json()))
+        return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+
+class FakeChatModel:
+    """Stands in for `ChatGoogleGenerativeAI`."""
+
+    def __init__(self, **kwargs):
+        self.client = None
+
+    def with_structured_output(self, schema, **kwargs):
+        return FakeStructuredModel(schema)
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        await BACKEND.call()
+        text = BACKEND.storyboard()
+        return AIMessage(content=text, usage_metadata=_usage(prompt, text))
+
+    async def astream(self, prompt, *args, **kwargs):
+        await BACKEND.call(0.25)
+        text = BACKEND.storyboard()
+        step = max(1, len(text) // 20)
+        for i in range(0, len(text), step):
+            await asyncio.sleep(BACKEND.latency * 0.75 / 20)
+            yield AIMessageChunk(content=text[i : i + step])
+        yield AIMessageChunk(content="", usage_metadata=_usage(prompt, text))
+
+
+class _FakeModels:
+    async def generate_content(self, model, contents, config=None, **kwargs):
+        if "image" in model:
+            await BACKEND.call(2.0)
+            data = os.urandom(BACKEND.payload_bytes * 16)
+            part = types.SimpleNamespace(
+                inline_data=types.SimpleNamespace(mime_type="image/png", data=data)
+            )
+            candidate = types.SimpleNamespace(
+                finish_reason="STOP", content=types.SimpleNamespace(parts=[part])
+            )
+            return types.SimpleNamespace(
+                parts=[part], candidates=[candidate], prompt_feedback=None, usage_metadata=None
+            )
+        await BACKEND.call()
+        text = BACKEND.text()
+        return types.SimpleNamespace(
+            text=text,
+            candidates=[],
+            usage_metadata=types.SimpleNamespace(
+                prompt_token_count=len(str(contents)) // 4,
+                candidates_token_count=len(text) // 4,
+            ),
+        )
+
+
+class FakeGenaiClient:
+    """Stands in for `google.genai.Client`; only the async surface is used."""
+
+    def __init__(self):
+        self.aio = types.SimpleNamespace(models=_FakeModels())
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty sample."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(name: str, latencies: list[float], errors: int, wall: float) -> dict:
+    return {
+        "name": name,
+        "count": len(latencies),
+        "errors": errors,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "per_sec": len(latencies) / wall if wall else 0.0,
+        "wall_seconds": wall,
+    }
+
+
+async def bench_graph(graph, runs: int, concurrency: int, loops: int) -> dict:
+    """Run `runs` comic generations, at most `concurrency` at a time."""
+    gate = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        state = {
+            "messages": [HumanMessage(content=f"A comic about benchmark topic {i}")],
+            "initial_search_query_count": 3,
+            "max_research_loops": loops,
+        }
+        async with gate:
+            started = time.perf_counter()
+            try:
+                await graph.ainvoke(state, {"configurable": {"max_research_loops": loops}})
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(runs)))
+    return summarize("graph run", latencies, errors, time.perf_counter() - started)
+
+
+async def bench_images(app, batches: int, concurrency: int, pages: int) -> list[dict]:
+    """POST `batches` storyboard batches to /generate_images and time each page."""
+    import httpx
+
+    gate = asyncio.Semaphore(concurrency)
+    batch_latencies: list[float] = []
+    page_latencies: list[float] = []
+    errors = 0
+
+    async def one(client: httpx.AsyncClient, i: int) -> None:
+        nonlocal errors
+        body = {
+            "pages": [{"id": p + 1, "detail": f"batch {i} page {p + 1}"} for p in range(pages)],
+            "thread_id": f"bench-{i}",
+            "bypass_cache": True,
+        }
+        async with gate:
+            started = time.perf_counter()
+            async with client.stream("POST", "/generate_images", json=body) as response:
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if "error" in event:
+                        errors += 1
+                    elif "id" in event:
+                        page_latencies.append(time.perf_counter() - started)
+            batch_latencies.append(time.perf_counter() - started)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(batches)))
+        wall = time.perf_counter() - started
+    return [
+        summarize("image batch", batch_latencies, 0, wall),
+        summarize("image page", page_latencies, errors, wall),
+    ]
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def main() -> None:
+    """Run the benchmark and print (or emit as JSON) latency, throughput and RSS."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20, help="graph runs (0 to skip)")
+    parser.add_argument("--batches", type=int, default=10, help="image batches (0 to skip)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--loops", type=int, default=2, help="max research loops per run")
+    parser.add_argument("--pages", type=int, default=6, help="storyboard pages per answer/batch")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean fake call latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="latency std deviation (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--payload-bytes", type=int, default=2048, help="text size per response")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--with-cache", action="store_true", help="keep LLM and image caches on")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--max-p95", type=float, help="fail if any p95 exceeds this (s)")
+    parser.add_argument("--max-rss-mb", type=float, help="fail if peak RSS exceeds this")
+    args = parser.parse_args()
+
+    global BACKEND
+    BACKEND = FakeBackend(
+        args.latency, args.jitter, args.failure_rate, args.payload_bytes, args.pages, args.seed
+    )
+    if not args.with_cache:
+        os.environ["LLM_CACHE"] = "none"
+        os.environ["IMAGE_CACHE_MAX_BYTES"] = "0"
+        # Notes recalled from an earlier bench run would skip searches
+        os.environ["RESEARCH_MEMORY_PATH"] = ""
+
+    # Every Gemini call goes through these factories, so swapping them is enough.
+    clients._chat_model_class = lambda: FakeChatModel
+    clients._genai_client = FakeGenaiClient()
+    clients._chat_models.clear()
+
+    import importlib
+
+    # `agent.graph` the attribute is the compiled graph; fetch the modules instead.
+    app_module = importlib.import_module("agent.app")
+    graph_module = importlib.import_module("agent.graph")
+    # The app defers this import to the first image call; keep it out of the timings
+    importlib.import_module("google.genai.types")
+
+    async def run() -> list[dict]:
+        results = []
+        if args.runs:
+            results.append(await bench_graph(graph_module.graph, args.runs, args.concurrency, args.loops))
+        if args.batches:
+            results.extend(
+                await bench_images(app_module.app, args.batches, args.concurrency, args.pages)
+            )
+        return results
+
+    results = asyncio.run(run())
+    rss = peak_rss_mb()
+    if args.json:
+        print(json.dumps({"results": results, "peak_rss_mb": rss, "fake_calls": BACKEND.calls}))
+    else:
+        print(f"{'scenario':<14}{'count':>7}{'errors':>8}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'per sec':>10}")
+        for r in results:
+            print(
+                f"{r['name']:<14}{r['count']:>7}{r['errors']:>8}{r['p50']:>9.3f}"
+                f"{r['p95']:>9.3f}{r['p99']:>9.3f}{r['per_sec']:>10.2f}"
+            )
+        print(f"fake calls: {BACKEND.calls} ({BACKEND.failures} failed)  peak RSS: {rss:.1f} MiB")
+
+    failed = []
+    if args.max_p95 is not None:
+        failed += [r["name"] for r in results if r["p95"] > args.max_p95]
+    if args.max_rss_mb is not None and rss > args.max_rss_mb:
+        failed.append("peak RSS")
+    if failed:
+        print(f"threshold exceeded: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Measure how long importing the agent modules takes, using `python -X importtime`.
+
+Each module is imported in a fresh interpreter (so nothing is cached in
+`sys.modules`) without Gemini credentials, which also checks that importing and
+compiling the graph does not need them:
+
+    python scripts/import_time.py
+    python scripts/import_time.py agent.graph --repeat 5 --top 20
+    python scripts/import_time.py --json --max-ms 1500
+
+The report lists the median cumulative import time of each module and the
+packages that contribute most to it.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+SRC = pathlib.Path(__file__).resolve().parent.parent / "src"
+DEFAULT_MODULES = ["agent.graph", "agent.app", "agent.image_worker"]
+# Stripped from the child environment: imports must not depend on them
+CREDENTIALS = ("GEMINI_API_KEY", "GOOGLE_API_KEY")
+
+
+def measure(module: str) -> tuple[float, dict[str, float]]:
+    """Import `module` once; return its cumulative time and self time per top-level package (ms)."""
+    env = {k: v for k, v in os.environ.items() if k not in CREDENTIALS}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC), env.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    total = 0.0
+    by_package: dict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[12:].split("|"))
+        if not self_us.isdigit():
+            continue  # header line
+        by_package[name.split(".")[0]] += int(self_us) / 1000
+        if name == module:
+            total = int(cumulative_us) / 1000
+    return total, dict(by_package)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=3, help="Imports per module")
+    parser.add_argument("--top", type=int, default=10, help="Packages listed per module")
+    parser.add_argument("--json", action="store_true", help="Print a JSON report")
+    parser.add_argument(
+        "--max-ms", type=float, help="Exit with status 1 if a module takes longer"
+    )
+    args = parser.parse_args()
+
+    report = {}
+    for module in args.modules:
+        runs = [measure(module) for _ in range(args.repeat)]
+        packages: dict[str, list[float]] = defaultdict(list)
+        for _, by_package in runs:
+            for package, ms in by_package.items():
+                packages[package].append(ms)
+        top = sorted(
+            ((package, statistics.median(ms)) for package, ms in packages.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )[: args.top]
+        report[module] = {
+            "median_ms": round(statistics.median(total for total, _ in runs), 1),
+            "packages_ms": {package: round(ms, 1) for package, ms in top},
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for module, entry in report.items():
+            print(f"{module}: {entry['median_ms']:.0f} ms (median of {args.repeat})")
+            for package, ms in entry["packages_ms"].items():
+                print(f"    {package:<28} {ms:8.1f} ms")
+
+    if args.max_ms is not None:
+        slow = [m for m, entry in report.items() if entry["median_ms"] > args.max_ms]
+        if slow:
+            print(f"Slower than {args.max_ms:.0f} ms: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
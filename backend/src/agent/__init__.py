@@ -1,3 +1,30 @@
-from agent.graph import graph
+"""NanoComic research agent and image generation service."""
+
+import sys
+import types
 
 __all__ = ["graph"]
+
+
+class _AgentPackage(types.ModuleType):
+    """The `agent` package, which compiles the research graph on first access.
+
+    Importing a submodule (e.g. the image worker or the clients) therefore does
+    not load and build the graph. Python binds an imported submodule to an
+    attribute of its package; the setter ignores that binding, so `agent.graph`
+    and `from agent import graph` always give the compiled graph.
+    """
+
+    @property
+    def graph(self):
+        """The compiled research graph."""
+        from agent.graph import graph
+
+        return graph
+
+    @graph.setter
+    def graph(self, _module) -> None:
+        pass
+
+
+sys.modules[__name__].__class__ = _AgentPackage
@@ -1,19 +1,61 @@
 # mypy: disable - error - code = "no-untyped-def,misc"
+import asyncio
 import base64
-import io
+import json
 import os
 import pathlib
-import logging
-from fastapi import FastAPI, Response, HTTPException
-from fastapi.staticfiles import StaticFiles
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
+
+from agent.image_cache import StoredImage
+from agent.image_jobs import SUCCEEDED, IdempotencyConflict, ImageJob
+from agent.image_worker import ImageJobWorker, job_request
+from agent.images import (
+    IMAGE_MODEL,
+    ImageGenerationError,
+    ImageOptions,
+    get_image_cache,
+    get_image_jobs,
+    get_image_scheduler,
+    get_or_generate_images,
+    get_speculative_images,
+)
+from agent.instrumentation import metrics
+from agent.rate_limit import rate_limiter
+from agent.retry import get_circuit_breaker
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Run an image job worker inside the API unless IMAGE_JOB_WORKERS=0.
+
+    Set it to 0 when dedicated `python -m agent.image_worker` processes run the jobs.
+    """
+    concurrency = int(os.getenv("IMAGE_JOB_WORKERS", "4"))
+    if concurrency <= 0:
+        yield
+        return
+    stop = asyncio.Event()
+    worker = asyncio.create_task(
+        ImageJobWorker(get_image_jobs(), concurrency=concurrency).run(stop)
+    )
+    try:
+        yield
+    finally:
+        stop.set()
+        await worker
+
 
 # Define the FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Allow local dev origins (Vite + LangGraph dev)
 app.add_middleware(
@@ -24,15 +66,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY is None:
-    raise ValueError("GEMINI_API_KEY is not set")
-
-image_client = genai.Client(api_key=GEMINI_API_KEY)
-# Per request: use Gemini 3 image preview model
-IMAGE_MODEL = "gemini-3-pro-image-preview"
-
 
 class ImageRequest(BaseModel):
     prompt: str
@@ -40,78 +73,410 @@ class ImageRequest(BaseModel):
     aspect_ratio: str = "3:4"
     image_size: str = "1K"
     use_search: bool = True
+    # Fairness key for the image scheduler; falls back to the client address.
+    thread_id: str | None = None
+    # Skip the image cache and ask the model for a fresh sample.
+    bypass_cache: bool = False
+    # "url" returns short /images/{digest} links instead of inline data URLs.
+    response_format: Literal["data_url", "url"] = "data_url"
+
+
+class StoryboardPage(BaseModel):
+    """One storyboard page to illustrate."""
+
+    id: int
+    detail: str
+
+
+class BatchImageRequest(BaseModel):
+    """Illustrate several storyboard pages in one streamed request."""
+
+    pages: list[StoryboardPage]
+    number_of_images: int = 1
+    aspect_ratio: str = "3:4"
+    image_size: str = "1K"
+    use_search: bool = True
+    thread_id: str | None = None
+    bypass_cache: bool = False
+    response_format: Literal["data_url", "url"] = "data_url"
+
+
+def _scheduler_key(req: ImageRequest | BatchImageRequest, request: Request) -> str:
+    if req.thread_id:
+        return req.thread_id
+    return request.client.host if request.client else "anonymous"
+
+
+@app.get("/generate_image/stats")
+async def generate_image_stats():
+    """Report image queue depth, wait times, cache counters and circuit state."""
+    return {
+        "scheduler": get_image_scheduler().stats(),
+        "cache": get_image_cache().stats(),
+        "circuit": get_circuit_breaker(IMAGE_MODEL).state,
+        "jobs": get_image_jobs().stats(),
+    }
+
+
+@app.get("/agent/rate_limits")
+async def agent_rate_limits():
+    """Report how much of each model's per-minute quota is in use and who is waiting."""
+    return rate_limiter.stats()
+
+
+@app.get("/agent/metrics")
+async def agent_metrics():
+    """Expose node, token, retry and image metrics in Prometheus text format.
+
+    Served under /agent because the LangGraph server already owns /metrics.
+    """
+    scheduler_stats = get_image_scheduler().stats()
+    for name in ("in_flight", "queued"):
+        metrics.set(
+            f"agent_image_scheduler_{name}",
+            scheduler_stats[name],
+            help_text=f"Image scheduler {name.replace('_', ' ')} requests.",
+        )
+    for name, value in get_image_cache().stats().items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics.set(
+                f"agent_image_cache_{name}",
+                value,
+                help_text=f"Image cache {name.replace('_', ' ')}.",
+            )
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _to_data_url(image: StoredImage) -> str:
+    b64 = base64.b64encode(image.read_bytes()).decode("ascii")
+    return f"data:{image.mime_type};base64,{b64}"
+
+
+def _render_images(
+    stored: list[StoredImage], response_format: str, request: Request
+) -> dict:
+    if response_format != "url":
+        return {"images": [_to_data_url(image) for image in stored]}
+    urls = [request.url_for("get_image", digest=image.digest) for image in stored]
+    return {
+        "images": [str(url) for url in urls],
+        # Per image: links to its variants, e.g. {"thumb": ..., "web": ...}
+        "variants": [
+            {name: str(url.include_query_params(variant=name)) for name in image.variants}
+            for url, image in zip(urls, stored)
+        ],
+    }
+
+
+async def _generate_images(
+    req: ImageRequest, key: str, request: Request
+) -> tuple[dict, float, str]:
+    """Serve images from the cache or the model.
+
+    Returns the response payload (`images` in the requested format, plus `variants`
+    links for URL responses), the time spent queued for the model and the cache
+    outcome.
+    """
+    if req.response_format == "url" and not get_image_cache().enabled:
+        raise HTTPException(
+            status_code=400,
+            detail="response_format=url needs the image store (IMAGE_CACHE_MAX_BYTES > 0)",
+        )
+    options = ImageOptions(
+        prompt=req.prompt,
+        aspect_ratio=req.aspect_ratio,
+        image_size=req.image_size,
+        use_search=req.use_search,
+    )
+    try:
+        stored, queue_wait, cache_status = await get_or_generate_images(
+            options, key, bypass_cache=req.bypass_cache
+        )
+    except ImageGenerationError as exc:
+        raise HTTPException(
+            status_code=exc.status_code, detail=exc.detail, headers=exc.headers
+        )
+    stored = stored[: req.number_of_images]
+    if req.response_format == "url":
+        payload = _render_images(stored, "url", request)
+    else:
+        # Inlining reads every image from disk and base64-encodes it; keep that
+        # off the event loop
+        payload = await asyncio.to_thread(
+            _render_images, stored, req.response_format, request
+        )
+    return payload, queue_wait, cache_status
 
 
 @app.post("/generate_image")
-def generate_image(req: ImageRequest):
-    """Generate an image for a given prompt and return base64 data URLs."""
-    prompt = req.prompt.replace("\n", " ")
-    tools = [{"google_search": {}}] if req.use_search else []
-    last_error: Exception | HTTPException | None = None
+async def generate_image(
+    req: ImageRequest, request: Request, http_response: Response
+):
+    """Generate an image for a given prompt and return data URLs or image links."""
+    payload, queue_wait, cache_status = await _generate_images(
+        req, _scheduler_key(req, request), request
+    )
+    http_response.headers["X-Queue-Wait-Ms"] = str(int(queue_wait * 1000))
+    http_response.headers["X-Image-Cache"] = cache_status
+    return payload
+
+
+@app.post("/generate_images")
+async def generate_images(req: BatchImageRequest, request: Request):
+    """Generate images for a whole storyboard and stream them back as NDJSON.
+
+    Pages are submitted to the image scheduler in page order and each finished page
+    is written as one JSON line (`{"id", "images", ...}` or `{"id", "error"}`) as soon as
+    it lands, followed by a final `{"done": true}` line.
+    """
+    key = _scheduler_key(req, request)
+    shared = req.model_dump(exclude={"pages", "thread_id"})
 
-    for attempt in range(3):
+    async def run_page(page: StoryboardPage) -> dict:
+        page_req = ImageRequest(prompt=page.detail, thread_id=key, **shared)
         try:
-            response = image_client.models.generate_content(
-                model=IMAGE_MODEL,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    tools=tools,
-                    image_config=types.ImageConfig(
-                        aspect_ratio=req.aspect_ratio,
-                        image_size=req.image_size,
-                    ),
-                ),
+            payload, queue_wait, cache_status = await _generate_images(
+                page_req, key, request
             )
-            logging.info(
-                "Image prompt_feedback (attempt %s): %s",
-                attempt + 1,
-                getattr(response, "prompt_feedback", None),
+        except HTTPException as exc:
+            return {"id": page.id, "error": exc.detail}
+        return {
+            "id": page.id,
+            **payload,
+            "queue_wait_ms": int(queue_wait * 1000),
+            "cache": cache_status,
+        }
+
+    async def stream():
+        tasks = [
+            asyncio.create_task(run_page(page))
+            for page in sorted(req.pages, key=lambda p: p.id)
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished, default=str) + "\n"
+            yield json.dumps({"done": True}) + "\n"
+        finally:
+            # Client went away mid-batch: stop paying for pages nobody will read.
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+class ImageJobRequest(BaseModel):
+    """Options of a durable image job."""
+
+    prompt: str
+    aspect_ratio: str = "3:4"
+    image_size: str = "1K"
+    use_search: bool = True
+    thread_id: str | None = None
+    bypass_cache: bool = False
+
+
+def _job_view(job: ImageJob, request: Request) -> dict:
+    """Public view of a job; finished jobs carry image links or the error."""
+    view = {
+        "id": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+    if job.error is not None:
+        view["error"] = job.error
+    if job.status == SUCCEEDED:
+        stored = get_image_cache().get(job.result["cache_key"])
+        if stored is None:
+            view.update(status="expired", error="The images were evicted from the image store")
+        else:
+            view.update(
+                _render_images(stored, "url", request),
+                queue_wait_ms=job.result["queue_wait_ms"],
+                cache=job.result["cache"],
             )
-            if getattr(response, "candidates", None):
-                logging.info(
-                    "Image finish_reason (attempt %s): %s",
-                    attempt + 1,
-                    getattr(response.candidates[0], "finish_reason", None),
-                )
-
-            # Collect inline image parts
-            parts = []
-            if getattr(response, "parts", None):
-                parts = [part for part in response.parts if getattr(part, "inline_data", None)]
-            if not parts and getattr(response, "candidates", None):
-                for candidate in response.candidates:
-                    if getattr(candidate, "content", None) and getattr(candidate.content, "parts", None):
-                        for part in candidate.content.parts:
-                            if getattr(part, "inline_data", None):
-                                parts.append(part)
-
-            if not parts:
-                detail = {
-                    "error": "No image content returned",
-                    "prompt_feedback": getattr(response, "prompt_feedback", None),
-                    "finish_reason": getattr(response.candidates[0], "finish_reason", None)
-                    if getattr(response, "candidates", None)
-                    else None,
+    return view
+
+
+async def _get_job(job_id: str) -> ImageJob:
+    job = await asyncio.to_thread(get_image_jobs().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown image job")
+    return job
+
+
+@app.post("/image_jobs", status_code=202)
+async def submit_image_job(
+    req: ImageJobRequest,
+    request: Request,
+    http_response: Response,
+    idempotency_key: str | None = Header(default=None),
+):
+    """Queue an image generation that survives disconnects and restarts.
+
+    Returns the job (202, or 200 when the `Idempotency-Key` header matches an earlier
+    submit). Follow it with `GET /image_jobs/{id}` or `GET /image_jobs/{id}/events`.
+    """
+    if not get_image_cache().enabled:
+        raise HTTPException(
+            status_code=400,
+            detail="Image jobs need the image store (IMAGE_CACHE_MAX_BYTES > 0)",
+        )
+    options = ImageOptions(
+        prompt=req.prompt,
+        aspect_ratio=req.aspect_ratio,
+        image_size=req.image_size,
+        use_search=req.use_search,
+    )
+    payload = job_request(options, _scheduler_key(req, request), req.bypass_cache)
+    try:
+        job, created = await asyncio.to_thread(get_image_jobs().submit, payload, idempotency_key)
+    except IdempotencyConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    if not created:
+        http_response.status_code = 200
+    http_response.headers["Location"] = str(request.url_for("get_image_job", job_id=job.id))
+    return _job_view(job, request)
+
+
+@app.get("/image_jobs/{job_id}", name="get_image_job")
+async def get_image_job(job_id: str, request: Request):
+    """Return the status of an image job, with image links once it succeeded."""
+    return _job_view(await _get_job(job_id), request)
+
+
+@app.get("/image_jobs/{job_id}/events")
+async def image_job_events(job_id: str, request: Request):
+    """Stream status changes of an image job as server-sent events.
+
+    Each change is a `status` event with the job view; the stream ends once the job
+    has finished. Reconnecting is safe: the current state is sent first.
+    """
+    job = await _get_job(job_id)
+
+    async def stream():
+        nonlocal job
+        last = None
+        last_sent = time.monotonic()
+        while True:
+            view = _job_view(job, request)
+            marker = (view["status"], view["attempts"], view["updated_at"])
+            if marker != last:
+                last = marker
+                last_sent = time.monotonic()
+                yield f"event: status\ndata: {json.dumps(view, default=str)}\n\n"
+            if job.finished:
+                return
+            if time.monotonic() - last_sent > 15:
+                # Comment line, keeps proxies from closing an idle connection
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(0.5)
+            job = await asyncio.to_thread(get_image_jobs().get, job_id) or job
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.get("/storyboards/{storyboard_id}/images")
+async def storyboard_images(storyboard_id: str, request: Request):
+    """Stream the images the graph started speculatively for a storyboard.
+
+    `storyboard_id` is the id of the answer message. Lines have the same shape as
+    `/generate_images` (URL format) and end with `{"done": true}`; pages that never
+    show up should be requested through `/generate_images`. 404 means the run did
+    not generate images speculatively.
+    """
+    if storyboard_id not in get_speculative_images():
+        raise HTTPException(status_code=404, detail="No speculative images for this storyboard")
+
+    async def stream():
+        async for page_id, result in get_speculative_images().subscribe(storyboard_id):
+            if "error" in result:
+                line = {"id": page_id, "error": result["error"]}
+            else:
+                line = {
+                    "id": page_id,
+                    **_render_images(result["images"], "url", request),
+                    "queue_wait_ms": result["queue_wait_ms"],
+                    "cache": result["cache"],
                 }
-                last_error = HTTPException(status_code=500, detail=detail)
-                continue
-
-            images = []
-            for part in parts[: req.number_of_images]:
-                data_bytes = part.inline_data.data
-                b64 = base64.b64encode(data_bytes).decode("ascii")
-                mime_type = part.inline_data.mime_type or "image/png"
-                images.append(f"data:{mime_type};base64,{b64}")
-            return {"images": images}
-        except HTTPException as exc:
-            last_error = exc
-        except Exception as exc:  # pragma: no cover
-            last_error = exc
-
-    # If all retries failed, propagate the last error
-    if isinstance(last_error, HTTPException):
-        raise last_error
-    raise HTTPException(status_code=500, detail=str(last_error))
+            yield json.dumps(line, default=str) + "\n"
+        yield json.dumps({"done": True}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _read_range(path: pathlib.Path, start: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+
+@app.get("/images/{digest}", name="get_image")
+async def get_image(
+    digest: str, request: Request, variant: Literal["thumb", "web"] | None = None
+):
+    """Serve a stored image by content digest, or one of its variants.
+
+    The digest is the sha256 of the bytes, so responses are immutable: they carry a
+    strong ETag and a one-year cache lifetime, and single byte ranges are honoured.
+    An image stored before variants existed is served as the original instead,
+    without the long cache lifetime.
+    """
+    image = get_image_cache().blob(digest)
+    if image is None or not image.path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    cache_control = "public, max-age=31536000, immutable"
+    if variant is not None:
+        variant_image = image.variants.get(variant)
+        if variant_image is not None and variant_image.path.is_file():
+            image = variant_image
+        else:
+            cache_control = "no-cache"
+
+    etag = f'"{image.digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    start, end = 0, image.size - 1
+    status_code = 200
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        match = _RANGE_RE.match(range_header.strip())
+        if match is None or match.groups() == ("", ""):
+            return Response(
+                status_code=416, headers={**headers, "Content-Range": f"bytes */{image.size}"}
+            )
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), end) if last else end
+        else:
+            # Suffix range: the last N bytes.
+            start = max(image.size - int(last), 0)
+        if start > end:
+            return Response(
+                status_code=416, headers={**headers, "Content-Range": f"bytes */{image.size}"}
+            )
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{image.size}"
+
+    data = await asyncio.to_thread(_read_range, image.path, start, end - start + 1)
+    return Response(
+        content=data,
+        status_code=status_code,
+        media_type=image.mime_type,
+        headers=headers,
+    )
 
 
 def create_frontend_router(build_dir="../frontend/dist"):
@@ -0,0 +1,132 @@
+"""Wall-clock, token and call budgets for a research run."""
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+from agent.configuration import Configuration
+
+
+@dataclass(frozen=True)
+class BudgetStatus:
+    """Outcome of a budget check before starting another research loop."""
+
+    exhausted: bool
+    reason: str | None = None
+    # Widest follow-up fan-out the remaining budget can pay for; None means unlimited
+    max_fanout: int | None = None
+
+
+def _mean(values: list[float]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+class RunBudget:
+    """Wall-clock, token and call budget of one research run.
+
+    Spend is read from the `node_metrics` entries that nodes of this run appended
+    to state (entries that finished before `started_at` belong to earlier runs on
+    the same thread). A share of every budget is held back for `finalize_answer`,
+    so the run can always produce its storyboard before the deadline.
+
+    A zero deadline or budget means "no limit".
+    """
+
+    def __init__(
+        self,
+        started_at: float,
+        deadline_seconds: float = 0,
+        token_budget: int = 0,
+        call_budget: int = 0,
+        finalize_reserve_seconds: float = 0,
+        finalize_reserve_tokens: int = 0,
+        searches_per_wave: int = 1,
+    ):
+        """Create a budget for a run that started at `started_at` (wall-clock seconds)."""
+        self.started_at = started_at
+        self.deadline_seconds = deadline_seconds
+        self.token_budget = token_budget
+        self.call_budget = call_budget
+        self.finalize_reserve_seconds = finalize_reserve_seconds
+        self.finalize_reserve_tokens = finalize_reserve_tokens
+        self.searches_per_wave = max(1, searches_per_wave)
+
+    @classmethod
+    def from_config(
+        cls, configurable: Configuration, started_at: float | None
+    ) -> "RunBudget":
+        """Build the budget of the run that started at `started_at` (now if unknown)."""
+        return cls(
+            started_at=started_at if started_at is not None else time.time(),
+            deadline_seconds=configurable.run_deadline_seconds,
+            token_budget=configurable.run_token_budget,
+            call_budget=configurable.run_call_budget,
+            finalize_reserve_seconds=configurable.finalize_reserve_seconds,
+            # The answer prompt carries up to the research context budget and the
+            # storyboard it writes is of similar length.
+            finalize_reserve_tokens=2 * configurable.research_context_token_budget,
+            searches_per_wave=configurable.max_concurrent_searches_per_run,
+        )
+
+    def research_deadline(self) -> float | None:
+        """Epoch time by which research must stop to leave time for the answer."""
+        if not self.deadline_seconds:
+            return None
+        return self.started_at + self.deadline_seconds - self.finalize_reserve_seconds
+
+    def time_left(self, now: float | None = None) -> float | None:
+        """Seconds of research time left, or None without a deadline."""
+        deadline = self.research_deadline()
+        if deadline is None:
+            return None
+        return deadline - (time.time() if now is None else now)
+
+    def check(self, node_metrics: Iterable[dict], now: float | None = None) -> BudgetStatus:
+        """Decide whether another research loop fits and how wide it may fan out.
+
+        A loop costs this reflection, one search per follow-up query and the next
+        reflection. Per-search and per-reflection costs are estimated from what
+        this run has spent so far.
+        """
+        entries = [e for e in node_metrics if e.get("finished_at", 0) >= self.started_at]
+        searches = [e for e in entries if e["node"] == "web_research"]
+        reflections = [e for e in entries if e["node"] == "reflection"]
+        limits: list[tuple[int, str]] = []
+
+        time_left = self.time_left(now)
+        if time_left is not None:
+            if time_left <= 0:
+                return BudgetStatus(True, "deadline", 0)
+            # Searches of one wave run in parallel, so a wave costs the slowest search
+            search_time = max((e["duration_seconds"] for e in searches), default=0.0)
+            reflection_time = _mean([e["duration_seconds"] for e in reflections]) or search_time
+            if search_time:
+                waves = math.floor((time_left - 2 * reflection_time) / search_time)
+                limits.append((waves * self.searches_per_wave, "deadline"))
+
+        if self.token_budget:
+            spent = sum(e["prompt_tokens"] + e["completion_tokens"] for e in entries)
+            left = self.token_budget - spent - self.finalize_reserve_tokens
+            search_tokens = _mean([e["prompt_tokens"] + e["completion_tokens"] for e in searches])
+            reflection_tokens = _mean(
+                [e["prompt_tokens"] + e["completion_tokens"] for e in reflections]
+            ) or search_tokens
+            if left <= 0:
+                limits.append((0, "tokens"))
+            elif search_tokens:
+                limits.append(
+                    (math.floor((left - 2 * reflection_tokens) / search_tokens), "tokens")
+                )
+
+        if self.call_budget:
+            # Keep one call for the answer and two for this and the next reflection
+            spent = sum(e["model_calls"] for e in entries)
+            limits.append((self.call_budget - spent - 3, "calls"))
+
+        if not limits:
+            return BudgetStatus(False)
+        max_fanout, reason = min(limits)
+        if max_fanout <= 0:
+            return BudgetStatus(True, reason, 0)
+        return BudgetStatus(False, None, max_fanout)
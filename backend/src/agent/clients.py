@@ -0,0 +1,97 @@
+"""Shared, lazily built model clients."""
+
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Optional
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from google.genai import Client
+
+_lock = threading.RLock()
+_genai_client: Optional["Client"] = None
+_chat_models: dict[tuple[str, float, Any], Any] = {}
+
+
+def get_api_key() -> str:
+    """Return GEMINI_API_KEY, reading `.env` if it is not in the environment.
+
+    Checked when the first client is built rather than at import, so the graph can
+    be imported and compiled without credentials.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if api_key is None:
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+    if api_key is None:
+        raise ValueError("GEMINI_API_KEY is not set")
+    return api_key
+
+
+def get_genai_client() -> "Client":
+    """Return the process-wide google-genai client.
+
+    The client owns the pooled HTTP connections to the Gemini API, so every caller
+    (grounded search, chat models, image generation) should go through this one.
+    """
+    global _genai_client
+    if _genai_client is None:
+        with _lock:
+            if _genai_client is None:
+                # Imported on first use: google-genai takes about half a second to import
+                from google.genai import Client
+
+                _genai_client = Client(api_key=get_api_key())
+    return _genai_client
+
+
+def _chat_model_class():
+    """Import the langchain-google-genai chat model on first use."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI
+
+
+def get_chat_model(model: str, temperature: float, schema: Any = None):
+    """Return a long-lived chat model for (model, temperature, schema).
+
+    Building `ChatGoogleGenerativeAI` and its structured-output wrapper converts the
+    schema and sets up a client each time, so instances are created once and shared.
+    They hold no per-call state and are safe to use from several threads or tasks.
+
+    Args:
+        model: Name of the Gemini model
+        temperature: Sampling temperature
+        schema: Optional pydantic model for structured output
+
+    Returns:
+        The chat model, or for a schema its `with_structured_output(schema,
+        include_raw=True)` wrapper returning `{"raw", "parsed", "parsing_error"}`
+    """
+    key = (model, float(temperature), schema)
+    runnable = _chat_models.get(key)
+    if runnable is not None:
+        return runnable
+    with _lock:
+        runnable = _chat_models.get(key)
+        if runnable is None:
+            llm = _chat_model_class()(
+                model=model,
+                temperature=temperature,
+                # One attempt per call: retries, backoff and circuit breaking are
+                # handled by agent.retry so they are not multiplied here.
+                max_retries=1,
+                api_key=get_api_key(),
+            )
+            # Reuse the shared client (and its connection pool) instead of the one
+            # the constructor just built.
+            llm.client = get_genai_client()
+            # include_raw keeps the raw message so callers can read token usage
+            runnable = (
+                llm.with_structured_output(schema, include_raw=True)
+                if schema is not None
+                else llm
+            )
+            _chat_models[key] = runnable
+    return runnable
@@ -29,6 +29,56 @@ class Configuration(BaseModel):
         },
     )
 
+    model_routing: bool = Field(
+        default=False,
+        metadata={
+            "description": "Pick the query, reflection and answer models from the tiers below by how complex the request is, for runs whose reasoning_model is 'auto' or unset. A run naming a model always uses it (and the configured query model)."
+        },
+    )
+
+    fast_model: str = Field(
+        default="gemini-2.5-flash-lite",
+        metadata={"description": "Model of the fast routing tier."},
+    )
+
+    balanced_model: str = Field(
+        default="gemini-2.5-flash",
+        metadata={"description": "Model of the balanced routing tier."},
+    )
+
+    strong_model: str = Field(
+        default="gemini-2.5-pro",
+        metadata={"description": "Model of the strong routing tier."},
+    )
+
+    routing_balanced_threshold: float = Field(
+        default=0.3,
+        metadata={
+            "description": "Complexity score (0-1) from which the balanced tier is used."
+        },
+    )
+
+    routing_strong_threshold: float = Field(
+        default=0.6,
+        metadata={
+            "description": "Complexity score (0-1) from which the strong tier is used."
+        },
+    )
+
+    routing_fallback_seconds: float = Field(
+        default=0,
+        metadata={
+            "description": "Seconds a routed query or reflection call may take before it is cancelled and a faster tier is tried; the cancelled call is still paid for. 0 (default) only falls back on rate limits and outages."
+        },
+    )
+
+    routing_slow_seconds: float = Field(
+        default=60,
+        metadata={
+            "description": "Start at a faster tier while a node's routed model has a median latency above this. 0 disables it."
+        },
+    )
+
     number_of_initial_queries: int = Field(
         default=3,
         metadata={"description": "The number of initial search queries to generate."},
@@ -39,6 +89,177 @@ class Configuration(BaseModel):
         metadata={"description": "The maximum number of research loops to perform."},
     )
 
+    max_concurrent_searches_per_run: int = Field(
+        default=4,
+        metadata={
+            "description": "The maximum number of web_research branches of one run searching at the same time."
+        },
+    )
+
+    hedge_searches: bool = Field(
+        default=False,
+        metadata={
+            "description": "Issue a duplicate grounded search when one is slow to answer; the first answer wins. Every hedge is a second paid search (about 10% more searches with the default p90 deadline), drawn from the model's retry budget and rate limit."
+        },
+    )
+
+    search_hedge_after_seconds: float = Field(
+        default=0,
+        metadata={
+            "description": "Seconds before a slow search is hedged; 0 uses the 90th percentile of recent search latencies."
+        },
+    )
+
+    search_quorum: float = Field(
+        default=1.0,
+        metadata={
+            "description": "Fraction of a web_research fan-out that reflection waits for; later results are folded into the next loop. 1 waits for all."
+        },
+    )
+
+    stream_storyboard: bool = Field(
+        default=True,
+        metadata={
+            "description": "Stream the answer and emit each storyboard page as a custom stream event as soon as it is written."
+        },
+    )
+
+    speculative_images: bool = Field(
+        default=False,
+        metadata={
+            "description": "Start generating each page image on the server as soon as the page is written. Requires the image cache and the graph running in the API server process."
+        },
+    )
+
+    query_dedup_threshold: float = Field(
+        default=0.8,
+        metadata={
+            "description": "Token-set similarity at which a new search query counts as a duplicate of one already run."
+        },
+    )
+
+    query_dedup_embedding_model: str = Field(
+        default="",
+        metadata={
+            "description": "Optional local sentence-transformers model for semantic query dedup; empty disables it."
+        },
+    )
+
+    query_dedup_embedding_threshold: float = Field(
+        default=0.9,
+        metadata={
+            "description": "Embedding cosine similarity at which a new search query counts as a duplicate."
+        },
+    )
+
+    run_deadline_seconds: float = Field(
+        default=0,
+        metadata={
+            "description": "Wall-clock budget of one run; research stops early so the answer is written in time. 0 disables it."
+        },
+    )
+
+    run_token_budget: int = Field(
+        default=0,
+        metadata={
+            "description": "Token budget of one run across all model calls. 0 disables it."
+        },
+    )
+
+    run_call_budget: int = Field(
+        default=0,
+        metadata={
+            "description": "Model call budget of one run across all nodes. 0 disables it."
+        },
+    )
+
+    finalize_reserve_seconds: float = Field(
+        default=30,
+        metadata={
+            "description": "Seconds of run_deadline_seconds held back for writing the final storyboard."
+        },
+    )
+
+    research_context_token_budget: int = Field(
+        default=6000,
+        metadata={
+            "description": "Approximate token budget for the research notes passed to reflection and the answer."
+        },
+    )
+
+    topic_token_budget: int = Field(
+        default=2000,
+        metadata={
+            "description": "Approximate token budget for the conversation transcript included in every prompt; 0 means no limit."
+        },
+    )
+
+    fact_sheet_token_budget: int = Field(
+        default=1500,
+        metadata={
+            "description": "Approximate token budget for the rolling fact sheet that earlier research is compacted into."
+        },
+    )
+
+    llm_cache: str = Field(
+        default="memory",
+        metadata={
+            "description": "Where to cache model responses: 'memory', 'sqlite' or 'none'."
+        },
+    )
+
+    llm_cache_path: str = Field(
+        default=".llm_cache.sqlite3",
+        metadata={"description": "The SQLite file used when llm_cache is 'sqlite'."},
+    )
+
+    llm_cache_ttl_seconds: int = Field(
+        default=7 * 24 * 3600,
+        metadata={
+            "description": "How long cached query, reflection and answer responses stay valid."
+        },
+    )
+
+    search_cache_ttl_seconds: int = Field(
+        default=6 * 3600,
+        metadata={
+            "description": "How long cached grounded web_research results stay valid."
+        },
+    )
+
+    research_memory_path: str = Field(
+        default="",
+        metadata={
+            "description": "SQLite file indexing past web_research notes for reuse across topics, e.g. '.research_memory.sqlite3'. Notes are shared by every thread and user of the deployment; empty (default) disables it."
+        },
+    )
+
+    research_memory_threshold: float = Field(
+        default=0.6,
+        metadata={
+            "description": "Token similarity at which a past query's note answers a new query; half of it suffices when the note covers all of the query's entities."
+        },
+    )
+
+    research_memory_max_age_seconds: int = Field(
+        default=14 * 24 * 3600,
+        metadata={"description": "How long a research note can be reused."},
+    )
+
+    research_memory_volatile_max_age_seconds: int = Field(
+        default=24 * 3600,
+        metadata={
+            "description": "How long a research note can be reused for queries about current events (latest, today, this year, ...)."
+        },
+    )
+
+    research_memory_max_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        metadata={
+            "description": "Size cap of the research memory; the least recently used notes are dropped beyond it."
+        },
+    )
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
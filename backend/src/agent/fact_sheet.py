@@ -0,0 +1,120 @@
+"""The running fact sheet that keeps characters and settings consistent across pages."""
+
+import re
+from typing import Iterable
+
+from agent.query_dedup import normalize_query
+from agent.tools_and_schemas import FactSheet
+
+SECTIONS = ("characters", "settings", "objects")
+_SECTION_TITLES = {"characters": "角色", "settings": "场景", "objects": "物件"}
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the token count of `text` without a tokenizer.
+
+    CJK characters are counted as one token each and everything else at about
+    four characters per token, which is close enough for budgeting prompts.
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` so that `estimate_tokens` of the result stays within `max_tokens`."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + " …"
+
+
+def merge_fact_sheet(sheet: dict, extracted: FactSheet) -> dict:
+    """Fold newly extracted facts into the rolling fact sheet.
+
+    The sheet is a plain dict (`{section: {name: [fact, ...]}}`) so it can live in
+    graph state. Entries are matched by normalized name and facts that normalize
+    to an already known fact are dropped, so repeated search results do not grow it.
+    """
+    merged = {
+        section: {name: list(facts) for name, facts in sheet.get(section, {}).items()}
+        for section in SECTIONS
+    }
+    for section in SECTIONS:
+        entries = merged[section]
+        names = {normalize_query(name): name for name in entries}
+        for entry in getattr(extracted, section):
+            if not entry.name.strip():
+                continue
+            key = normalize_query(entry.name)
+            name = names.setdefault(key, entry.name.strip())
+            facts = entries.setdefault(name, [])
+            known = {normalize_query(fact) for fact in facts}
+            for fact in entry.facts:
+                normalized = normalize_query(fact)
+                if normalized and normalized not in known:
+                    known.add(normalized)
+                    facts.append(fact.strip())
+    return merged
+
+
+def _render(sheet: dict, per_entry: int | None) -> str:
+    lines: list[str] = []
+    for section in SECTIONS:
+        entries = sheet.get(section) or {}
+        if not entries:
+            continue
+        lines.append(f"## {_SECTION_TITLES[section]}")
+        for name, facts in entries.items():
+            kept = facts if per_entry is None else facts[:per_entry]
+            lines.append(f"- {name}：" + "；".join(kept))
+    return "\n".join(lines)
+
+
+def render_fact_sheet(sheet: dict, max_tokens: int) -> str:
+    """Render the fact sheet as text, keeping it within `max_tokens`.
+
+    When the full sheet is too long the number of facts kept per entry is reduced
+    (earliest facts first), so every character, setting and object stays visible.
+    """
+    text = _render(sheet, None)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    longest = max(
+        (len(facts) for section in SECTIONS for facts in (sheet.get(section) or {}).values()),
+        default=0,
+    )
+    for per_entry in range(longest - 1, 0, -1):
+        text = _render(sheet, per_entry)
+        if estimate_tokens(text) <= max_tokens:
+            return text
+    return truncate_to_tokens(text, max_tokens)
+
+
+def build_research_context(
+    sheet: dict, new_results: Iterable[str], max_tokens: int, sheet_max_tokens: int
+) -> str:
+    """Combine the compacted fact sheet with not-yet-compacted research results.
+
+    The sheet takes at most `sheet_max_tokens`; the remaining budget is split evenly
+    between the new results, each of which is truncated to its share if needed.
+    """
+    parts: list[str] = []
+    sheet_text = render_fact_sheet(sheet, min(sheet_max_tokens, max_tokens)) if sheet else ""
+    if sheet_text:
+        parts.append("# 已整理的事实表\n" + sheet_text)
+    results = [result for result in new_results if result]
+    if results:
+        remaining = max_tokens - estimate_tokens(sheet_text)
+        share = max(remaining // len(results), 0)
+        parts.extend(truncate_to_tokens(result, share) for result in results)
+    return "\n\n---\n\n".join(part for part in parts if part)
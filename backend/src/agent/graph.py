@@ -1,44 +1,371 @@
-import os
+"""The LangGraph research agent that writes the comic storyboard."""
+
+import asyncio
 import json
+import logging
+import os
 import re
+import time
+import uuid
+from typing import Awaitable, Callable, TypeVar
 
-from agent.tools_and_schemas import SearchQueryList, Reflection
-from dotenv import load_dotenv
 from langchain_core.messages import AIMessage
-from langgraph.types import Send
-from langgraph.graph import StateGraph
-from langgraph.graph import START, END
 from langchain_core.runnables import RunnableConfig
-from google.genai import Client
+from langgraph.config import get_stream_writer
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Send
 
+from agent.budget import RunBudget
+from agent.clients import get_chat_model, get_genai_client
+from agent.configuration import Configuration
+from agent.fact_sheet import (
+    build_research_context,
+    estimate_tokens,
+    merge_fact_sheet,
+)
+from agent.instrumentation import (
+    instrument_node,
+    record_fanout,
+    record_usage,
+)
+from agent.llm_cache import get_llm_cache, llm_cache_key
+from agent.prompts import (
+    answer_instructions,
+    fact_extraction_instructions,
+    get_current_date,
+    query_writer_instructions,
+    reflection_instructions,
+    storyboard_revision_instructions,
+    web_searcher_instructions,
+)
+from agent.query_dedup import QueryDeduplicator, load_local_embedder
+from agent.rate_limit import rate_limiter
+from agent.research_memory import get_research_memory
+from agent.retry import call_with_retry, get_retry_budget
+from agent.routing import call_routed, extract_features, route
+from agent.scheduler import FairScheduler
 from agent.state import (
     OverallState,
     QueryGenerationState,
     ReflectionState,
     WebSearchState,
 )
-from agent.configuration import Configuration
-from agent.prompts import (
-    get_current_date,
-    query_writer_instructions,
-    web_searcher_instructions,
-    reflection_instructions,
-    answer_instructions,
+from agent.storyboard import (
+    StoryboardStreamParser,
+    content_text,
+    find_storyboard,
+    merge_storyboard,
 )
-from langchain_google_genai import ChatGoogleGenerativeAI
+from agent.stragglers import get_latency_tracker, hedged, search_quorum
+from agent.tools_and_schemas import FactSheet, Reflection, SearchQueryList
 from agent.utils import get_research_topic
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-if os.getenv("GEMINI_API_KEY") is None:
-    raise ValueError("GEMINI_API_KEY is not set")
+T = TypeVar("T")
 
-# Used for Google Search API
-genai_client = Client(api_key=os.getenv("GEMINI_API_KEY"))
+# Process-wide cap on concurrent grounded searches across all runs. Free slots are
+# shared round-robin between runs; each run is further capped by
+# `max_concurrent_searches_per_run`.
+search_scheduler = FairScheduler(
+    max_concurrency=int(os.getenv("MAX_CONCURRENT_SEARCHES", "16"))
+)
+
+
+def _total_tokens(message) -> int | None:
+    """Tokens a chat model reported for one call, or None if it did not say."""
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+async def invoke_llm(
+    configurable: Configuration,
+    model: str,
+    temperature: float,
+    prompt: str,
+    schema=None,
+):
+    """Invoke a Gemini chat model, serving byte-identical requests from the response cache.
+
+    Args:
+        configurable: Run configuration, used to pick the cache backend and TTL
+        model: Name of the Gemini model
+        temperature: Sampling temperature
+        prompt: The fully formatted prompt
+        schema: Optional pydantic model for structured output
+
+    Returns:
+        An instance of `schema` when given, otherwise the message content
+    """
+    cache = get_llm_cache(configurable.llm_cache, configurable.llm_cache_path)
+    key = llm_cache_key(model, temperature, schema, prompt)
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            record_usage(model, cached=True)
+            return schema.model_validate(cached) if schema is not None else cached
+
+    llm = get_chat_model(model, temperature, schema)
+    estimated = estimate_tokens(prompt)
+
+    async def attempt():
+        await rate_limiter.acquire(model, estimated)
+        if schema is None:
+            message = await llm.ainvoke(prompt)
+            rate_limiter.settle(model, estimated, _total_tokens(message))
+            return message, message.content
+        output = await llm.ainvoke(prompt)
+        rate_limiter.settle(model, estimated, _total_tokens(output["raw"]))
+        if output["parsed"] is None:
+            raise output.get("parsing_error") or ValueError(
+                f"{model} returned no parsable {schema.__name__}"
+            )
+        return output["raw"], output["parsed"]
+
+    message, result = await call_with_retry(model, attempt)
+    value = result.model_dump() if schema is not None else result
+    usage = message.usage_metadata or {}
+    record_usage(model, usage.get("input_tokens"), usage.get("output_tokens"))
+
+    if cache is not None and value:
+        await asyncio.to_thread(cache.set, key, value, configurable.llm_cache_ttl_seconds)
+    return result
+
+
+async def stream_llm(
+    configurable: Configuration,
+    model: str,
+    temperature: float,
+    prompt: str,
+):
+    """Stream text deltas from a Gemini chat model, through the response cache.
+
+    Shares cache entries with `invoke_llm`; a cached response is yielded in one piece.
+    """
+    cache = get_llm_cache(configurable.llm_cache, configurable.llm_cache_path)
+    key = llm_cache_key(model, temperature, None, prompt)
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            record_usage(model, cached=True)
+            yield content_text(cached)
+            return
+
+    llm = get_chat_model(model, temperature)
+    estimated = estimate_tokens(prompt)
+
+    async def open_stream():
+        # Only the wait for the first chunk is retried; once text has been yielded
+        # a failure cannot be replayed transparently.
+        await rate_limiter.acquire(model, estimated)
+        stream = llm.astream(prompt)
+        try:
+            return stream, [await anext(stream)]
+        except StopAsyncIteration:
+            return stream, []
+        except BaseException:
+            await stream.aclose()
+            raise
+
+    async def chunks():
+        stream, first = await call_with_retry(model, open_stream)
+        for chunk in first:
+            yield chunk
+        async for chunk in stream:
+            yield chunk
+
+    parts = []
+    prompt_tokens = completion_tokens = 0
+    async for chunk in chunks():
+        usage = chunk.usage_metadata or {}
+        prompt_tokens += usage.get("input_tokens", 0)
+        completion_tokens += usage.get("output_tokens", 0)
+        text = content_text(chunk.content)
+        if text:
+            parts.append(text)
+            yield text
+    record_usage(model, prompt_tokens, completion_tokens)
+    if prompt_tokens or completion_tokens:
+        rate_limiter.settle(model, estimated, prompt_tokens + completion_tokens)
+
+    full_text = "".join(parts)
+    if cache is not None and full_text:
+        await asyncio.to_thread(
+            cache.set, key, full_text, configurable.llm_cache_ttl_seconds
+        )
+
+
+async def dedupe_queries(
+    configurable: Configuration, new_queries: list[str], seen_queries: list[str]
+) -> tuple[list[str], list[str]]:
+    """Drop queries that repeat already-run searches; returns `(kept, skipped)`."""
+    embed = (
+        load_local_embedder(configurable.query_dedup_embedding_model)
+        if configurable.query_dedup_embedding_model
+        else None
+    )
+    deduplicator = QueryDeduplicator(
+        token_threshold=configurable.query_dedup_threshold,
+        embed=embed,
+        embedding_threshold=configurable.query_dedup_embedding_threshold,
+    )
+    if embed is None:
+        return deduplicator.dedupe(new_queries, seen_queries)
+    # Embedding models are CPU bound; keep them off the event loop
+    return await asyncio.to_thread(deduplicator.dedupe, new_queries, seen_queries)
+
+
+async def recall_research(
+    configurable: Configuration, queries: list[str], language: str
+) -> tuple[list[str], list[str], list[str]]:
+    """Answer queries from notes of earlier runs; returns `(to_search, recalled, notes)`."""
+    memory = get_research_memory(
+        configurable.research_memory_path, configurable.research_memory_max_bytes
+    )
+    if memory is None or not queries:
+        return queries, [], []
+
+    def lookup_all():
+        return [
+            memory.lookup(
+                query,
+                language,
+                threshold=configurable.research_memory_threshold,
+                max_age=configurable.research_memory_max_age_seconds,
+                volatile_max_age=configurable.research_memory_volatile_max_age_seconds,
+            )
+            for query in queries
+        ]
+
+    to_search, recalled, notes = [], [], []
+    for query, hit in zip(queries, await asyncio.to_thread(lookup_all)):
+        if hit is None:
+            to_search.append(query)
+            continue
+        logger.info(
+            "Reusing research note for %r from %r (%.0fh old)",
+            query,
+            hit.query,
+            hit.age_seconds / 3600,
+        )
+        recalled.append(query)
+        notes.append(hit.note)
+    return to_search, recalled, notes
+
+
+async def compact_results(
+    configurable: Configuration,
+    sheet: dict,
+    new_results: list[str],
+    research_topic: str,
+    language: str,
+) -> dict | None:
+    """Extract facts from new research results and fold them into the fact sheet.
+
+    Only the new results are sent to the (fast) query model, so the cost stays flat
+    as research loops accumulate. Returns None if extraction fails, in which case
+    the results stay uncompacted and are sent raw again next time.
+    """
+    prompt = fact_extraction_instructions.format(
+        research_topic=research_topic,
+        max_tokens=configurable.fact_sheet_token_budget,
+        language=language,
+        summaries="\n\n---\n\n".join(new_results),
+    )
+    try:
+        extracted = await invoke_llm(
+            configurable,
+            model=configurable.query_generator_model,
+            temperature=0,
+            prompt=prompt,
+            schema=FactSheet,
+        )
+    except Exception:
+        logger.warning("Fact sheet compaction failed", exc_info=True)
+        return None
+    return merge_fact_sheet(sheet, extracted)
+
+
+def _pinned_model(state: OverallState) -> str | None:
+    """Return the reasoning model the input asked for, unless it left the choice to routing."""
+    model = state.get("reasoning_model")
+    return model if model and model != "auto" else None
+
+
+async def _run_routed(
+    node: str,
+    state: OverallState,
+    configurable: Configuration,
+    default_model: str,
+    call: Callable[[str], Awaitable[T]],
+    *,
+    pinned: str | None = None,
+    timeout: float | None = None,
+    can_fall_back: Callable[[], bool] = lambda: True,
+) -> T:
+    """Run `call(model)` on the model routed for `node` (see `agent.routing`).
+
+    Without routing, or when the input named a model, `pinned` or `default_model`
+    is used as is.
+    """
+    if pinned or not configurable.model_routing:
+        return await call(pinned or default_model)
+    messages = state["messages"]
+    latest = next(
+        (
+            content_text(message.content)
+            for message in reversed(messages)
+            if getattr(message, "type", None) == "human"
+        ),
+        "",
+    )
+    features = extract_features(
+        get_research_topic(messages, configurable.topic_token_budget or None),
+        latest,
+        loops=state.get("research_loop_count") or 0,
+        max_loops=state.get("max_research_loops") or configurable.max_research_loops,
+    )
+    decision = route(node, configurable, features)
+    return await call_routed(
+        decision, configurable, call, timeout=timeout, can_fall_back=can_fall_back
+    )
+
+
+async def _write_routed_storyboard(
+    node: str,
+    state: OverallState,
+    configurable: Configuration,
+    prompt: str,
+    on_page: Callable[[dict], None],
+):
+    """`_write_storyboard` on the routed answer model.
+
+    Answers have no fallback deadline, and fall back to a faster model (on rate
+    limits or outages) only until the model has produced text: the tokens of a
+    partial answer are paid for, and clients may already show its pages.
+    """
+    produced = False
+
+    def on_text() -> None:
+        nonlocal produced
+        produced = True
+
+    return await _run_routed(
+        node,
+        state,
+        configurable,
+        configurable.answer_model,
+        lambda model: _write_storyboard(configurable, model, prompt, on_page, on_text),
+        pinned=_pinned_model(state),
+        can_fall_back=lambda: not produced,
+    )
 
 
 # Nodes
-def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
+@instrument_node("generate_query", starts_run=True)
+async def generate_query(
+    state: OverallState, config: RunnableConfig
+) -> QueryGenerationState:
     """LangGraph node that generates search queries based on the User's question.
 
     Uses Gemini 2.0 Flash to create an optimized search queries for web research based on
@@ -53,45 +380,83 @@ def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerati
     """
     configurable = Configuration.from_runnable_config(config)
     language = state.get("language") or "English"
+    run_started_at = time.time()
 
     # check for custom initial search query count
     if state.get("initial_search_query_count") is None:
         state["initial_search_query_count"] = configurable.number_of_initial_queries
 
-    # init Gemini 2.0 Flash
-    llm = ChatGoogleGenerativeAI(
-        model=configurable.query_generator_model,
-        temperature=1.0,
-        max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
-    )
-    structured_llm = llm.with_structured_output(SearchQueryList)
-
     # Format the prompt
     current_date = get_current_date()
     formatted_prompt = query_writer_instructions.format(
         current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
+        research_topic=get_research_topic(
+            state["messages"], configurable.topic_token_budget or None
+        ),
         number_queries=state["initial_search_query_count"],
         language=language,
     )
-    # Generate the search queries
-    result = structured_llm.invoke(formatted_prompt)
-    return {"search_query": result.query}
+    # Generate the search queries with the routed (by default a fast) model
+    result = await _run_routed(
+        "generate_query",
+        state,
+        configurable,
+        configurable.query_generator_model,
+        lambda model: invoke_llm(
+            configurable,
+            model=model,
+            temperature=1.0,
+            prompt=formatted_prompt,
+            schema=SearchQueryList,
+        ),
+        # A run naming its model is not routed at all
+        pinned=configurable.query_generator_model if _pinned_model(state) else None,
+        timeout=configurable.routing_fallback_seconds or None,
+    )
+    # Skip queries this thread has already searched (e.g. on a follow-up message)
+    queries, skipped = await dedupe_queries(
+        configurable, result.query, state.get("search_query") or []
+    )
+    # Queries earlier runs already researched are answered from their notes
+    to_search, _, notes = await recall_research(configurable, queries, language)
+    record_fanout(len(to_search))
+    return {
+        "search_query": queries,
+        "pending_queries": to_search,
+        "web_research_result": notes,
+        "number_of_skipped_queries": len(skipped),
+        # A fresh run id per question scopes the per-run search concurrency limit
+        "run_id": uuid.uuid4().hex,
+        "run_started_at": run_started_at,
+    }
 
 
 def continue_to_web_research(state: QueryGenerationState):
     """LangGraph node that sends the search queries to the web research node.
 
     This is used to spawn n number of web research nodes, one for each search query.
+    When every query was already searched in this thread, go straight to reflection.
     """
+    if not state["pending_queries"]:
+        return "reflection"
     return [
-        Send("web_research", {"search_query": search_query, "id": int(idx)})
-        for idx, search_query in enumerate(state["search_query"])
+        Send(
+            "web_research",
+            {
+                "search_query": search_query,
+                "id": int(idx),
+                "run_id": state["run_id"],
+                "run_started_at": state["run_started_at"],
+                "loop": 0,
+                "fanout": len(state["pending_queries"]),
+            },
+        )
+        for idx, search_query in enumerate(state["pending_queries"])
     ]
 
 
-def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
+@instrument_node("web_research")
+async def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     """LangGraph node that performs web research using the native Google Search API tool.
 
     Executes a web search using the native Google Search API tool in combination with Gemini 2.0 Flash.
@@ -112,16 +477,112 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
         language=language,
     )
 
-    # Uses the google genai client as the langchain client doesn't return grounding metadata
-    response = genai_client.models.generate_content(
-        model=configurable.query_generator_model,
-        contents=formatted_prompt,
-        config={
-            "tools": [{"google_search": {}}],
-            "temperature": 0,
-        },
+    # Grounded results age out faster than other responses, hence the separate TTL
+    cache = get_llm_cache(configurable.llm_cache, configurable.llm_cache_path)
+    key = llm_cache_key(
+        configurable.query_generator_model, 0, "google_search", formatted_prompt
+    )
+    run_id = state.get("run_id") or "default"
+    # Branches of one fan-out form a wave; with a quorum below 1, reflection only
+    # waits for part of it (see `search_quorum`).
+    wave = (
+        run_id,
+        state.get("loop") or 0,
+        state.get("fanout") or 1,
+        configurable.search_quorum,
     )
-    base_text = response.text or ""
+    base_text = await asyncio.to_thread(cache.get, key) if cache is not None else None
+    if base_text is not None:
+        record_usage(configurable.query_generator_model, cached=True)
+        search_quorum.finished(*wave)
+    else:
+        # Searches still running when the research deadline passes are abandoned so
+        # the answer can be written in time.
+        time_left = RunBudget.from_config(
+            configurable, state.get("run_started_at")
+        ).time_left()
+        if time_left is not None and time_left <= 0:
+            search_quorum.finished(*wave)
+            return {"search_query": [state["search_query"]]}
+
+        model = configurable.query_generator_model
+        latency = get_latency_tracker(model)
+        memory = get_research_memory(
+            configurable.research_memory_path, configurable.research_memory_max_bytes
+        )
+        estimated = estimate_tokens(formatted_prompt)
+
+        async def search():
+            # Wait for the model's quota before taking a slot, so a throttled model
+            # does not hold slots other runs could use
+            await rate_limiter.acquire(model, estimated)
+            # The slot is held per attempt, not while backing off between attempts
+            async with search_scheduler.slot(
+                run_id,
+                key_limit=configurable.max_concurrent_searches_per_run,
+            ):
+                # Uses the google genai client as the langchain client doesn't return grounding metadata
+                response = await get_genai_client().aio.models.generate_content(
+                    model=model,
+                    contents=formatted_prompt,
+                    config={
+                        "tools": [{"google_search": {}}],
+                        "temperature": 0,
+                    },
+                )
+            rate_limiter.settle(
+                model,
+                estimated,
+                getattr(getattr(response, "usage_metadata", None), "total_token_count", None),
+            )
+            return response
+
+        async def timed_search():
+            started = time.monotonic()
+            response = await call_with_retry(model, search)
+            latency.observe(time.monotonic() - started)
+            return response
+
+        async def run_search() -> str:
+            # A search slower than the soft deadline gets a duplicate; whichever
+            # answers first is used and the other is cancelled.
+            hedge_after = None
+            if configurable.hedge_searches:
+                hedge_after = configurable.search_hedge_after_seconds or latency.quantile(0.9)
+            # Hedges are paid searches: they share the retry budget of the model
+            # (and go through its rate limit in `search`)
+            response = await hedged(
+                timed_search,
+                hedge_after,
+                name=model,
+                allow=get_retry_budget(model).try_spend,
+            )
+            text = response.text or ""
+            usage = response.usage_metadata
+            record_usage(
+                model,
+                getattr(usage, "prompt_token_count", 0),
+                getattr(usage, "candidates_token_count", 0),
+            )
+            if cache is not None and text:
+                await asyncio.to_thread(
+                    cache.set, key, text, configurable.search_cache_ttl_seconds
+                )
+            if memory is not None and text:
+                await asyncio.to_thread(memory.add, state["search_query"], text, language)
+            return text
+
+        try:
+            base_text = await search_quorum.wait(
+                *wave, asyncio.ensure_future(run_search()), timeout=time_left
+            )
+        except TimeoutError:
+            logger.info("Search abandoned at the research deadline: %s", state["search_query"])
+            return {"search_query": [state["search_query"]]}
+        if base_text is None:
+            # The wave reached its quorum; the result is folded into the next loop
+            logger.info("Search left behind by its wave: %s", state["search_query"])
+            return {"search_query": [state["search_query"]]}
 
     return {
         "sources_gathered": [],
@@ -130,7 +591,8 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     }
 
 
-def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+@instrument_node("reflection")
+async def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
     """LangGraph node that identifies knowledge gaps and generates potential follow-up queries.
 
     Analyzes the current summary to identify areas for further research and generates
@@ -146,33 +608,100 @@ def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
     """
     configurable = Configuration.from_runnable_config(config)
     language = state.get("language") or "English"
-    # Increment the research loop count and get the reasoning model
+    # Increment the research loop count
     state["research_loop_count"] = state.get("research_loop_count", 0) + 1
-    reasoning_model = state.get("reasoning_model", configurable.reflection_model)
+
+    # Searches an earlier wave stopped waiting for count as new results now
+    late_results = search_quorum.drain(state.get("run_id"))
+
+    # Skip reflecting when the run cannot afford another research loop anyway
+    budget = RunBudget.from_config(configurable, state.get("run_started_at"))
+    status = budget.check(state.get("node_metrics") or [])
+    if status.exhausted:
+        logger.info("Research budget exhausted (%s); finalizing", status.reason)
+        return {
+            "is_sufficient": False,
+            "knowledge_gap": "",
+            "follow_up_queries": [],
+            "pending_queries": [],
+            "research_loop_count": state["research_loop_count"],
+            "number_of_ran_queries": len(state["search_query"]),
+            "web_research_result": late_results,
+        }
+
+    # Earlier results have been compacted into the fact sheet; only send the new
+    # ones in full so the prompt does not grow with every research loop.
+    results = state["web_research_result"] + late_results
+    compacted = state.get("compacted_results") or 0
+    sheet = state.get("fact_sheet") or {}
+    new_results = results[compacted:]
+    research_topic = get_research_topic(
+        state["messages"], configurable.topic_token_budget or None
+    )
 
     # Format the prompt
     current_date = get_current_date()
     formatted_prompt = reflection_instructions.format(
         current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
-        summaries="\n\n---\n\n".join(state["web_research_result"]),
+        research_topic=research_topic,
+        summaries=build_research_context(
+            sheet,
+            new_results,
+            configurable.research_context_token_budget,
+            configurable.fact_sheet_token_budget,
+        ),
         language=language,
     )
-    # init Reasoning Model
-    llm = ChatGoogleGenerativeAI(
-        model=reasoning_model,
-        temperature=1.0,
-        max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
+    # init Reasoning Model; compaction of the new results runs alongside it
+    result, merged_sheet = await asyncio.gather(
+        _run_routed(
+            "reflection",
+            state,
+            configurable,
+            configurable.reflection_model,
+            lambda model: invoke_llm(
+                configurable,
+                model=model,
+                temperature=1.0,
+                prompt=formatted_prompt,
+                schema=Reflection,
+            ),
+            pinned=_pinned_model(state),
+            timeout=configurable.routing_fallback_seconds or None,
+        ),
+        compact_results(configurable, sheet, new_results, research_topic, language)
+        if new_results
+        else asyncio.sleep(0, result=sheet),
+    )
+
+    # Reflection often proposes near-duplicates of queries that were already run
+    follow_up_queries, skipped = await dedupe_queries(
+        configurable, result.follow_up_queries, state["search_query"]
     )
-    result = llm.with_structured_output(Reflection).invoke(formatted_prompt)
+    pending_queries, recalled, notes = follow_up_queries, [], []
+    if not result.is_sufficient:
+        # Follow-ups earlier runs already researched are answered from their notes
+        pending_queries, recalled, notes = await recall_research(
+            configurable, follow_up_queries, language
+        )
+    if status.max_fanout is not None and len(pending_queries) > status.max_fanout:
+        # Narrow the next loop to what the remaining budget can pay for
+        pending_queries = pending_queries[: status.max_fanout]
+    if not result.is_sufficient:
+        record_fanout(len(pending_queries))
 
     return {
         "is_sufficient": result.is_sufficient,
         "knowledge_gap": result.knowledge_gap,
-        "follow_up_queries": result.follow_up_queries,
+        "follow_up_queries": follow_up_queries,
+        "pending_queries": pending_queries,
+        "number_of_skipped_queries": len(skipped),
         "research_loop_count": state["research_loop_count"],
         "number_of_ran_queries": len(state["search_query"]),
+        "fact_sheet": merged_sheet if merged_sheet is not None else sheet,
+        "compacted_results": len(results) if merged_sheet is not None else compacted,
+        "search_query": recalled,
+        "web_research_result": late_results + notes,
     }
 
 
@@ -198,7 +727,11 @@ def evaluate_research(
         if state.get("max_research_loops") is not None
         else configurable.max_research_loops
     )
-    if state["is_sufficient"] or state["research_loop_count"] >= max_research_loops:
+    if (
+        state["is_sufficient"]
+        or state["research_loop_count"] >= max_research_loops
+        or not state["pending_queries"]
+    ):
         return "finalize_answer"
     else:
         return [
@@ -207,13 +740,156 @@ def evaluate_research(
                 {
                     "search_query": follow_up_query,
                     "id": state["number_of_ran_queries"] + int(idx),
+                    "run_id": state["run_id"],
+                    "run_started_at": state["run_started_at"],
+                    "loop": state["research_loop_count"],
+                    "fanout": len(state["pending_queries"]),
                 },
             )
-            for idx, follow_up_query in enumerate(state["follow_up_queries"])
+            for idx, follow_up_query in enumerate(state["pending_queries"])
         ]
 
 
-def finalize_answer(state: OverallState, config: RunnableConfig):
+def _speculative_image_submitter(
+    state: OverallState, config: RunnableConfig, storyboard_id: str
+) -> Callable[[dict], None] | None:
+    """Open a speculative image board for this answer and return its page submitter.
+
+    Returns None when images cannot be served from the cache, since clients would
+    have no URL to fetch the results from.
+    """
+    # Imported here so graph runs without speculative images never load the image pipeline
+    from agent.images import ImageOptions, get_image_cache, get_speculative_images
+
+    if not get_image_cache().enabled:
+        logger.info("Speculative images need IMAGE_CACHE_MAX_BYTES > 0; skipping")
+        return None
+    thread_id = config.get("configurable", {}).get("thread_id") or storyboard_id
+    speculative_images = get_speculative_images()
+    speculative_images.open(storyboard_id, str(thread_id))
+    # Same defaults as the frontend, so its /generate_images fallback hits the cache
+    aspect_ratio = state.get("aspect_ratio") or "16:9"
+    image_size = state.get("image_size") or "1K"
+
+    def submit(page: dict) -> None:
+        if not isinstance(page, dict) or "id" not in page or not page.get("detail"):
+            return
+        try:
+            page_id = int(page["id"])
+        except (TypeError, ValueError):
+            return
+        speculative_images.submit(
+            storyboard_id,
+            page_id,
+            ImageOptions(
+                prompt=str(page["detail"]).strip(),
+                aspect_ratio=aspect_ratio,
+                image_size=image_size,
+            ),
+        )
+
+    return submit
+
+
+def _research_summaries(state: OverallState, configurable: Configuration) -> str:
+    """Research notes for the answer prompt, compacted if they exceed the context budget."""
+    summaries_text = "\n---\n\n".join(state["web_research_result"])
+    if estimate_tokens(summaries_text) > configurable.research_context_token_budget:
+        # Too long to send raw: use the compacted fact sheet plus whatever came in
+        # after the last compaction.
+        summaries_text = build_research_context(
+            state.get("fact_sheet") or {},
+            state["web_research_result"][state.get("compacted_results") or 0 :],
+            configurable.research_context_token_budget,
+            configurable.fact_sheet_token_budget,
+        )
+    return summaries_text
+
+
+async def _write_storyboard(
+    configurable: Configuration,
+    model: str,
+    prompt: str,
+    on_page: Callable[[dict], None],
+    on_text: Callable[[], None] = lambda: None,
+):
+    """Run the answer model on `prompt` and parse the storyboard JSON it writes.
+
+    With `stream_storyboard`, every page is passed to `on_page` as soon as it is
+    complete, so clients can start rendering page 1 while later pages are still
+    written (see `_stream_page`). `on_text` is called for every streamed chunk.
+
+    Returns:
+        The parsed JSON (a list of pages), or the cleaned text if it is not valid JSON
+    """
+    if configurable.stream_storyboard:
+        parser = StoryboardStreamParser()
+        chunks = []
+        async for text in stream_llm(
+            configurable,
+            model=model,
+            temperature=0,
+            prompt=prompt,
+        ):
+            chunks.append(text)
+            on_text()
+            for page in parser.feed(text):
+                on_page(page)
+        content = "".join(chunks)
+    else:
+        content = await invoke_llm(
+            configurable,
+            model=model,
+            temperature=0,
+            prompt=prompt,
+        )
+
+    # Clean potential markdown fences and parse JSON so we return structured content
+    if isinstance(content, str):
+        # Strip markdown fences ```json ... ```
+        cleaned = re.sub(r"^```[a-zA-Z]*\s*|\s*```$", "", content.strip())
+        try:
+            return json.loads(cleaned)
+        except Exception:
+            return cleaned
+    return content
+
+
+class _StoryboardImages:
+    """Speculative image submission for one answer; does nothing when disabled."""
+
+    def __init__(self, state: OverallState, config: RunnableConfig, storyboard_id: str):
+        configurable = Configuration.from_runnable_config(config)
+        self.storyboard_id = storyboard_id
+        self.submit_page = (
+            _speculative_image_submitter(state, config, storyboard_id)
+            if configurable.speculative_images
+            else None
+        )
+
+    def submit(self, page: dict) -> None:
+        if self.submit_page is not None:
+            self.submit_page(page)
+
+    def seal(self, pages=None) -> None:
+        """Submit any `pages` not submitted yet and close the storyboard."""
+        if self.submit_page is None:
+            return
+        from agent.images import get_speculative_images
+
+        for page in pages if isinstance(pages, list) else []:
+            self.submit_page(page)
+        get_speculative_images().seal(self.storyboard_id)
+
+
+def _stream_page(page: dict, images: _StoryboardImages) -> None:
+    """Send a finished page to clients as a custom stream event and start its image."""
+    get_stream_writer()({"storyboard_page": page})
+    images.submit(page)
+
+
+@instrument_node("finalize_answer")
+async def finalize_answer(state: OverallState, config: RunnableConfig):
     """LangGraph node that finalizes the research summary.
 
     Prepares the final output by deduplicating and formatting sources, then
@@ -227,17 +903,22 @@ def finalize_answer(state: OverallState, config: RunnableConfig):
         Dictionary with state update, including running_summary key containing the formatted final summary with sources
     """
     configurable = Configuration.from_runnable_config(config)
-    reasoning_model = state.get("reasoning_model") or configurable.answer_model
     language = state.get("language") or "English"
+    # Late searches that made it in time are used; the rest are not waited for
+    late_results = search_quorum.drain(state.get("run_id"))
+    search_quorum.discard(state.get("run_id"))
+    if late_results:
+        state = {**state, "web_research_result": state["web_research_result"] + late_results}
 
     # Format the prompt
     current_date = get_current_date()
     # Escape braces in user content to avoid str.format KeyErrors when summaries contain JSON-like text
-    safe_topic = get_research_topic(state["messages"]).replace("{", "{{").replace(
-        "}", "}}"
+    safe_topic = get_research_topic(
+        state["messages"], configurable.topic_token_budget or None
+    ).replace("{", "{{").replace("}", "}}")
+    safe_summaries = (
+        _research_summaries(state, configurable).replace("{", "{{").replace("}", "}}")
     )
-    summaries_text = "\n---\n\n".join(state["web_research_result"])
-    safe_summaries = summaries_text.replace("{", "{{").replace("}", "}}")
     formatted_prompt = answer_instructions.format(
         current_date=current_date,
         research_topic=safe_topic,
@@ -245,31 +926,121 @@ def finalize_answer(state: OverallState, config: RunnableConfig):
         language=language,
     )
 
-    # init Reasoning Model, default to Gemini 2.5 Flash
-    llm = ChatGoogleGenerativeAI(
-        model=reasoning_model,
-        temperature=0,
-        max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
+    storyboard_id = str(uuid.uuid4())
+    images = _StoryboardImages(state, config, storyboard_id)
+    content_payload = None
+    try:
+        # init Reasoning Model, default to Gemini 2.5 Flash
+        content_payload = await _write_routed_storyboard(
+            "finalize_answer",
+            state,
+            configurable,
+            formatted_prompt,
+            lambda page: _stream_page(page, images),
+        )
+    finally:
+        # Pages the stream parser did not see (or all pages without streaming);
+        # already submitted pages are skipped. On failure, subscribers finish with
+        # the pages that were submitted.
+        images.seal(content_payload)
+
+    pages = content_payload if isinstance(content_payload, list) else []
+    return {
+        # The message id doubles as the storyboard id clients subscribe to
+        "messages": [AIMessage(id=storyboard_id, content=content_payload)],
+        "sources_gathered": [],
+        "web_research_result": late_results,
+        "changed_page_ids": [p["id"] for p in pages if isinstance(p, dict) and "id" in p],
+        "edit_mode": False,
+    }
+
+
+def route_start(state: OverallState) -> str:
+    """LangGraph routing function that picks between a new storyboard and edit mode.
+
+    Edit mode needs a previous storyboard and research in the thread; otherwise the
+    request runs as a fresh research run.
+    """
+    if (
+        state.get("edit_mode")
+        and state.get("web_research_result")
+        and find_storyboard(state["messages"]) is not None
+    ):
+        return "revise_storyboard"
+    return "generate_query"
+
+
+@instrument_node("revise_storyboard", starts_run=True)
+async def revise_storyboard(state: OverallState, config: RunnableConfig):
+    """LangGraph node that revises the thread's last storyboard without new research.
+
+    Reuses the research already in state and asks the answer model only for the
+    pages the latest user message affects, then merges them into the previous
+    storyboard. `changed_page_ids` lists the pages whose text actually changed;
+    images of the other pages keep their prompts and so come from the image cache.
+
+    Args:
+        state: Current graph state with the previous storyboard and research results
+        config: Configuration for the runnable
+
+    Returns:
+        Dictionary with state update, including the revised storyboard message and changed_page_ids
+    """
+    configurable = Configuration.from_runnable_config(config)
+    previous = find_storyboard(state["messages"]) or []
+    revision_request = next(
+        (
+            content_text(message.content)
+            for message in reversed(state["messages"])
+            if getattr(message, "type", None) == "human"
+        ),
+        "",
+    )
+    allowed_ids = {int(page_id) for page_id in state.get("edit_page_ids") or []} or None
+    if allowed_ids:
+        revision_request += "\n（仅修改这些页面：{}）".format(
+            ", ".join(str(page_id) for page_id in sorted(allowed_ids))
+        )
+    formatted_prompt = storyboard_revision_instructions.format(
+        current_date=get_current_date(),
+        research_topic=get_research_topic(
+            state["messages"], configurable.topic_token_budget or None
+        ),
+        revision_request=revision_request,
+        storyboard=json.dumps(previous, ensure_ascii=False, indent=1),
+        summaries=_research_summaries(state, configurable),
+        language=state.get("language") or "English",
     )
-    result = llm.invoke(formatted_prompt)
 
-    # Clean potential markdown fences and parse JSON so we return structured content
-    content = result.content
-    if isinstance(content, str):
-        # Strip markdown fences ```json ... ```
-        cleaned = re.sub(r"^```[a-zA-Z]*\s*|\s*```$", "", content.strip())
-        try:
-            parsed = json.loads(cleaned)
-        except Exception:
-            parsed = cleaned
-        content_payload = parsed
-    else:
-        content_payload = content
+    storyboard_id = str(uuid.uuid4())
+    images = _StoryboardImages(state, config, storyboard_id)
+
+    def on_page(page: dict) -> None:
+        # Only stream (and draw) rewrites the merge keeps; a rewrite of a page outside
+        # `edit_page_ids` or one with the same text would get an image that does not
+        # match the page shown.
+        pages, changed = merge_storyboard(previous, [page], allowed_ids)
+        if changed:
+            _stream_page(next(p for p in pages if p["id"] == changed[0]), images)
+
+    merged = previous
+    try:
+        revised = await _write_routed_storyboard(
+            "revise_storyboard", state, configurable, formatted_prompt, on_page
+        )
+        if isinstance(revised, list):
+            merged, changed = merge_storyboard(previous, revised, allowed_ids)
+        else:
+            logger.warning("Storyboard revision was not a JSON page list; keeping pages")
+            changed = []
+    finally:
+        images.seal(merged)
 
     return {
-        "messages": [AIMessage(content=content_payload)],
-        "sources_gathered": [],
+        "messages": [AIMessage(id=storyboard_id, content=merged)],
+        "changed_page_ids": changed,
+        "edit_mode": False,
+        "edit_page_ids": [],
     }
 
 
@@ -281,13 +1052,15 @@ builder.add_node("generate_query", generate_query)
 builder.add_node("web_research", web_research)
 builder.add_node("reflection", reflection)
 builder.add_node("finalize_answer", finalize_answer)
+builder.add_node("revise_storyboard", revise_storyboard)
 
-# Set the entrypoint as `generate_query`
-# This means that this node is the first one called
-builder.add_edge(START, "generate_query")
+# Start with research, or revise the thread's last storyboard in edit mode
+builder.add_conditional_edges(
+    START, route_start, ["generate_query", "revise_storyboard"]
+)
 # Add conditional edge to continue with search queries in a parallel branch
 builder.add_conditional_edges(
-    "generate_query", continue_to_web_research, ["web_research"]
+    "generate_query", continue_to_web_research, ["web_research", "reflection"]
 )
 # Reflect on the web research
 builder.add_edge("web_research", "reflection")
@@ -297,5 +1070,6 @@ builder.add_conditional_edges(
 )
 # Finalize the answer
 builder.add_edge("finalize_answer", END)
+builder.add_edge("revise_storyboard", END)
 
 graph = builder.compile(name="pro-search-agent")
@@ -0,0 +1,412 @@
+"""Content-addressed on-disk cache for generated images."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import pathlib
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Not registered by default on every platform; needed to name and serve variants.
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+
+def image_cache_key(
+    prompt: str,
+    aspect_ratio: str,
+    image_size: str,
+    use_search: bool,
+    model: str,
+) -> str:
+    """Hash every input that changes the generated image into a cache key."""
+    normalized_prompt = " ".join(prompt.split())
+    payload = json.dumps(
+        [normalized_prompt, aspect_ratio, image_size, bool(use_search), model],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class StoredImage:
+    """An image blob on disk, addressed by the sha256 of its bytes."""
+
+    digest: str
+    mime_type: str
+    path: pathlib.Path
+    size: int
+    # Bytes of a freshly generated image, so callers don't re-read what we just wrote.
+    data: bytes | None = field(default=None, compare=False, repr=False)
+    # Re-encoded versions of this image (e.g. "thumb", "web"), keyed by name
+    variants: dict[str, "StoredImage"] = field(default_factory=dict, compare=False, repr=False)
+
+    @property
+    def total_size(self) -> int:
+        """Size of the blob plus all of its variants."""
+        return self.size + sum(v.size for v in self.variants.values())
+
+    def read_bytes(self) -> bytes:
+        """Return the image bytes, reading the blob only if they are not held in memory."""
+        if self.data is not None:
+            return self.data
+        return self.path.read_bytes()
+
+
+@dataclass
+class _Entry:
+    digests: list[str]
+    size: int
+
+
+class ImageCache:
+    """Content-addressed image cache on local disk with LRU eviction.
+
+    Layout under `root`:
+        blobs/<digest><ext>          image bytes, shared between entries with equal content
+        blobs/<digest>@<name><ext>   variants of a blob (e.g. its thumbnail)
+        entries/<key>.json           the list of blob digests produced for one cache key
+
+    Recency is tracked in memory and mirrored to the entry file mtime, so the LRU
+    order survives a restart. When the total blob size exceeds `max_bytes` the least
+    recently used entries are dropped together with blobs no other entry references.
+    Concurrent `get_or_generate` calls for the same key share one upstream call.
+    Entries written to the same directory by other processes (image workers) are
+    picked up on lookup; each process enforces `max_bytes` on the entries it knows.
+
+    If `postprocess` is given, it is awaited for every newly generated image and the
+    variants it returns are stored next to the blob and evicted together with it.
+    """
+
+    def __init__(
+        self,
+        root: str | os.PathLike,
+        max_bytes: int,
+        postprocess: Callable[[bytes], Awaitable[dict[str, tuple[str, bytes]]]] | None = None,
+    ):
+        """Open the cache under `root`, loading the entries already on disk."""
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.postprocess = postprocess
+        self._blobs_dir = self.root / "blobs"
+        self._entries_dir = self.root / "entries"
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._blobs: dict[str, StoredImage] = {}
+        self._refs: Counter[str] = Counter()
+        self._inflight: dict[str, asyncio.Task] = {}
+        # Callers awaiting each in-flight generation
+        self._waiters: Counter[asyncio.Task] = Counter()
+        self._counters: Counter[str] = Counter()
+        if self.enabled:
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the cache stores anything; `max_bytes <= 0` turns it off."""
+        return self.max_bytes > 0
+
+    @property
+    def total_bytes(self) -> int:
+        """Size of all stored blobs and their variants."""
+        return sum(blob.total_size for blob in self._blobs.values())
+
+    def _load(self) -> None:
+        """Rebuild the in-memory index from disk, oldest entry first."""
+        self._blobs_dir.mkdir(parents=True, exist_ok=True)
+        self._entries_dir.mkdir(parents=True, exist_ok=True)
+        variant_paths = []
+        for path in self._blobs_dir.iterdir():
+            if path.name.startswith("."):
+                # Partial write from an interrupted put.
+                path.unlink(missing_ok=True)
+            elif "@" in path.stem:
+                variant_paths.append(path)
+            elif path.is_file():
+                self._blobs[path.stem] = self._stored_from_path(path, path.stem)
+        for path in variant_paths:
+            digest, _, name = path.stem.partition("@")
+            parent = self._blobs.get(digest)
+            if parent is None:
+                path.unlink(missing_ok=True)
+            else:
+                parent.variants[name] = self._stored_from_path(path, path.stem)
+        for path in self._entries_dir.glob(".*.tmp"):
+            path.unlink(missing_ok=True)
+        entry_files = sorted(
+            self._entries_dir.glob("*.json"), key=lambda p: p.stat().st_mtime
+        )
+        for path in entry_files:
+            try:
+                digests = json.loads(path.read_text())["images"]
+            except (OSError, ValueError, KeyError):
+                path.unlink(missing_ok=True)
+                continue
+            if not digests or any(d not in self._blobs for d in digests):
+                path.unlink(missing_ok=True)
+                continue
+            self._entries[path.stem] = _Entry(
+                digests=digests, size=sum(self._blobs[d].total_size for d in digests)
+            )
+            self._refs.update(digests)
+        # Blobs left over from a crash between writing the blob and the entry.
+        for digest in [d for d in self._blobs if not self._refs[d]]:
+            self._unlink_blob(self._blobs.pop(digest))
+        self._evict()
+
+    @staticmethod
+    def _stored_from_path(path: pathlib.Path, digest: str) -> StoredImage:
+        return StoredImage(
+            digest=digest,
+            mime_type=mimetypes.guess_type(path.name)[0] or "image/png",
+            path=path,
+            size=path.stat().st_size,
+        )
+
+    @staticmethod
+    def _unlink_blob(blob: StoredImage) -> None:
+        for variant in blob.variants.values():
+            variant.path.unlink(missing_ok=True)
+        blob.path.unlink(missing_ok=True)
+
+    def _entry_path(self, key: str) -> pathlib.Path:
+        return self._entries_dir / f"{key}.json"
+
+    def get(self, key: str) -> list[StoredImage] | None:
+        """Return the cached images for `key` and mark the entry as recently used."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                images = [self._blobs[d] for d in entry.digests]
+        if entry is None:
+            images = self._adopt(key)
+            if images is None:
+                return None
+        try:
+            os.utime(self._entry_path(key))
+        except OSError:
+            pass
+        return images
+
+    def _adopt(self, key: str) -> list[StoredImage] | None:
+        """Index an entry that another process (e.g. an image worker) wrote to `root`."""
+        try:
+            digests = json.loads(self._entry_path(key).read_text())["images"]
+        except (OSError, ValueError, KeyError):
+            return None
+        images = []
+        for digest in digests:
+            blob = self.blob(digest) or self._find_blob(digest)
+            if blob is None:
+                return None
+            images.append(blob)
+        with self._lock:
+            if key not in self._entries:
+                for image in images:
+                    self._blobs.setdefault(image.digest, image)
+                self._refs.update(digests)
+                self._entries[key] = _Entry(
+                    digests=digests, size=sum(image.total_size for image in images)
+                )
+                self._evict()
+        return images
+
+    def _find_blob(self, digest: str) -> StoredImage | None:
+        paths = list(self._blobs_dir.glob(f"{digest}*"))
+        originals = [p for p in paths if p.stem == digest]
+        if not originals:
+            return None
+        blob = self._stored_from_path(originals[0], digest)
+        for path in paths:
+            if path.stem.startswith(f"{digest}@"):
+                blob.variants[path.stem.partition("@")[2]] = self._stored_from_path(
+                    path, path.stem
+                )
+        return blob
+
+    def blob(self, digest: str, variant: str | None = None) -> StoredImage | None:
+        """Look up a stored image by content digest, or one of its variants by name."""
+        with self._lock:
+            blob = self._blobs.get(digest)
+        if blob is None or variant is None:
+            return blob
+        return blob.variants.get(variant)
+
+    def _store_blob(
+        self, digest: str, mime_type: str, data: bytes, suffix: str = ""
+    ) -> StoredImage:
+        ext = mimetypes.guess_extension(mime_type) or ".bin"
+        path = self._blobs_dir / f"{digest}{suffix}{ext}"
+        if self.enabled:
+            self._write_atomic(path, data)
+        return StoredImage(
+            digest=f"{digest}{suffix}", mime_type=mime_type, path=path, size=len(data), data=data
+        )
+
+    def put(
+        self,
+        key: str,
+        images: list[tuple[str, bytes]],
+        variants: list[dict[str, tuple[str, bytes]]] | None = None,
+    ) -> list[StoredImage]:
+        """Store `(mime_type, data)` pairs under `key`, evicting old entries if needed.
+
+        `variants`, if given, holds one `{name: (mime_type, data)}` dict per image.
+        """
+        stored: list[StoredImage] = []
+        for index, (mime_type, data) in enumerate(images):
+            digest = hashlib.sha256(data).hexdigest()
+            image_variants = variants[index] if variants else {}
+            existing = self.blob(digest)
+            if existing is not None and (existing.variants or not image_variants):
+                stored.append(existing)
+                continue
+            image = self._store_blob(digest, mime_type, data)
+            for name, (variant_mime, variant_data) in image_variants.items():
+                image.variants[name] = self._store_blob(
+                    digest, variant_mime, variant_data, f"@{name}"
+                )
+            stored.append(image)
+        if not self.enabled or not stored:
+            return stored
+
+        manifest = {"images": [s.digest for s in stored], "created_at": time.time()}
+        self._write_atomic(self._entry_path(key), json.dumps(manifest).encode("utf-8"))
+        with self._lock:
+            for image in stored:
+                if image.digest not in self._blobs or image.variants:
+                    self._blobs[image.digest] = replace(
+                        image,
+                        data=None,
+                        variants={
+                            name: replace(v, data=None) for name, v in image.variants.items()
+                        },
+                    )
+            # Take the new references before dropping the old ones so blobs shared
+            # by both versions of the entry are not deleted in between.
+            self._refs.update(s.digest for s in stored)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._drop_refs(previous.digests)
+            self._entries[key] = _Entry(
+                digests=[s.digest for s in stored], size=sum(s.total_size for s in stored)
+            )
+            self._evict()
+        return stored
+
+    @staticmethod
+    def _write_atomic(path: pathlib.Path, data: bytes) -> None:
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    def _drop_refs(self, digests: list[str]) -> None:
+        self._refs.subtract(digests)
+        for digest in set(digests):
+            if self._refs[digest] <= 0:
+                del self._refs[digest]
+                blob = self._blobs.pop(digest, None)
+                if blob is not None:
+                    self._unlink_blob(blob)
+
+    def _evict(self) -> None:
+        while self._entries and self.total_bytes > self.max_bytes:
+            key, entry = self._entries.popitem(last=False)
+            self._entry_path(key).unlink(missing_ok=True)
+            self._drop_refs(entry.digests)
+            self._counters["evictions"] += 1
+            logger.info("Evicted image cache entry %s (%s bytes)", key, entry.size)
+
+    async def get_or_generate(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[list[tuple[str, bytes]]]],
+        bypass: bool = False,
+    ) -> tuple[list[StoredImage], str]:
+        """Return cached images for `key`, generating and storing them on a miss.
+
+        Returns the images and how they were obtained: "hit", "miss", "coalesced"
+        (shared an in-flight call for the same key) or "bypass" (fresh sample
+        requested; the result still replaces the cached entry).
+        """
+        if bypass:
+            self._counters["bypass"] += 1
+            return await self._generate_and_store(key, generate), "bypass"
+
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            self._counters["hits"] += 1
+            return cached, "hit"
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._counters["coalesced"] += 1
+            return await self._join(pending), "coalesced"
+
+        self._counters["misses"] += 1
+        task = asyncio.create_task(self._generate_and_store(key, generate))
+        self._inflight[key] = task
+
+        def forget(done: asyncio.Task) -> None:
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+
+        task.add_done_callback(forget)
+        return await self._join(task), "miss"
+
+    async def _join(self, task: asyncio.Task) -> list[StoredImage]:
+        """Await a shared generation; it is cancelled only once every caller gave up.
+
+        The caller that started it is not special: cancelling it must not fail the
+        callers that coalesced onto the same key.
+        """
+        self._waiters[task] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if self._waiters[task] <= 0:
+                del self._waiters[task]
+                if not task.done():
+                    task.cancel()
+
+    async def _generate_and_store(
+        self, key: str, generate: Callable[[], Awaitable[list[tuple[str, bytes]]]]
+    ) -> list[StoredImage]:
+        images = await generate()
+        variants = None
+        if self.enabled and self.postprocess is not None:
+            variants = await asyncio.gather(*(self.postprocess(data) for _, data in images))
+        return await asyncio.to_thread(self.put, key, images, variants)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and disk usage."""
+        lookups = self._counters["hits"] + self._counters["misses"] + self._counters["coalesced"]
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._counters["hits"],
+            "misses": self._counters["misses"],
+            "coalesced": self._counters["coalesced"],
+            "bypass": self._counters["bypass"],
+            "evictions": self._counters["evictions"],
+            "hit_ratio": (
+                (self._counters["hits"] + self._counters["coalesced"]) / lookups
+                if lookups
+                else 0.0
+            ),
+        }
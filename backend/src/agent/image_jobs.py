@@ -0,0 +1,500 @@
+"""Durable image generation jobs, stored in SQLite or Redis."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = frozenset({SUCCEEDED, FAILED})
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a different request."""
+
+    def __init__(self, job_id: str):
+        """Point at `job_id`, the job the key already belongs to."""
+        super().__init__(f"Idempotency key already used for job {job_id} with another request")
+        self.job_id = job_id
+
+
+@dataclass
+class ImageJob:
+    """One durable image generation job.
+
+    `request` holds the image options, the scheduler fairness key and the cache
+    bypass flag. `result` holds the image cache key and the digests of the stored
+    images; the bytes themselves live in the image store.
+    """
+
+    id: str
+    status: str
+    request: dict
+    idempotency_key: str | None = None
+    attempts: int = 0
+    result: dict | None = None
+    error: Any = None
+    error_status: int | None = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    worker_id: str | None = None
+    lease_until: float | None = None
+    # Earliest time a queued job may be claimed (retry backoff)
+    not_before: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job succeeded or failed for good."""
+        return self.status in FINISHED
+
+    def to_dict(self) -> dict:
+        """Return the job as a JSON-serializable dict."""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ImageJob":
+        """Build a job from `to_dict` output, ignoring unknown fields."""
+        return cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
+
+
+class JobStore(ABC):
+    """Durable queue of image jobs, shared by the API and the image workers.
+
+    Workers `claim` a job under a lease and must `extend_lease` while working on
+    it. A job whose lease runs out (the worker crashed or was killed) is handed to
+    the next worker that claims, until it has been attempted `max_attempts` times.
+    Transitions made by a worker that no longer holds the lease are ignored.
+    """
+
+    def __init__(self, max_attempts: int = 3, ttl: float = 7 * 24 * 3600):
+        """Set how often a job may be attempted and how long finished jobs are kept."""
+        self.max_attempts = max_attempts
+        # Finished jobs (and their idempotency keys) are forgotten after `ttl` seconds
+        self.ttl = ttl
+
+    @abstractmethod
+    def submit(
+        self, request: dict, idempotency_key: str | None = None
+    ) -> tuple[ImageJob, bool]:
+        """Queue a job, or return the job already created for `idempotency_key`.
+
+        Returns the job and whether it was created by this call.
+
+        Raises:
+            IdempotencyConflict: If the key was used for a different request
+        """
+
+    @abstractmethod
+    def get(self, job_id: str) -> ImageJob | None:
+        """Return the job, or None if it is unknown or expired."""
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float) -> ImageJob | None:
+        """Take the oldest due job (or one whose lease expired), or None if idle."""
+
+    @abstractmethod
+    def extend_lease(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Keep a running job; False if `worker_id` lost it to another worker."""
+
+    @abstractmethod
+    def _finish(self, job_id: str, worker_id: str, changes: dict) -> bool: ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Return the number of jobs per status."""
+
+    def complete(self, job_id: str, worker_id: str, result: dict) -> bool:
+        """Mark a running job as succeeded; False if `worker_id` no longer holds it."""
+        return self._finish(
+            job_id, worker_id, {"status": SUCCEEDED, "result": result, "error": None}
+        )
+
+    def fail(
+        self, job_id: str, worker_id: str, error: Any, status_code: int | None = None
+    ) -> bool:
+        """Mark a running job as failed for good; False if `worker_id` no longer holds it."""
+        return self._finish(
+            job_id,
+            worker_id,
+            {"status": FAILED, "error": error, "error_status": status_code},
+        )
+
+    def retry_later(self, job_id: str, worker_id: str, error: Any, delay: float) -> bool:
+        """Put a running job back in the queue, claimable after `delay` seconds."""
+        return self._finish(
+            job_id,
+            worker_id,
+            {"status": QUEUED, "error": error, "not_before": time.time() + delay},
+        )
+
+
+def _same_request(job: ImageJob, request: dict) -> bool:
+    return json.dumps(job.request, sort_keys=True) == json.dumps(request, sort_keys=True)
+
+
+class SQLiteJobStore(JobStore):
+    """Job queue in a SQLite file, shared by the API and workers on one host (or volume)."""
+
+    _COLUMNS = (
+        "id", "status", "request", "idempotency_key", "attempts", "result", "error",
+        "error_status", "created_at", "updated_at", "worker_id", "lease_until", "not_before",
+    )
+    _JSON_COLUMNS = ("request", "result", "error")
+
+    def __init__(self, path: str, **kwargs):
+        """Open (or create) the queue database at `path`."""
+        super().__init__(**kwargs)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS image_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    idempotency_key TEXT UNIQUE,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    error_status INTEGER,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    worker_id TEXT,
+                    lease_until REAL,
+                    not_before REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS image_jobs_due ON image_jobs (status, not_before, created_at)"
+            )
+
+    def _encode(self, column: str, value: Any) -> Any:
+        if column in self._JSON_COLUMNS and value is not None:
+            return json.dumps(value, ensure_ascii=False, default=str)
+        return value
+
+    def _row_to_job(self, row: tuple | None) -> ImageJob | None:
+        if row is None:
+            return None
+        data = dict(zip(self._COLUMNS, row))
+        for column in self._JSON_COLUMNS:
+            if data[column] is not None:
+                data[column] = json.loads(data[column])
+        return ImageJob.from_dict(data)
+
+    def _select(self, where: str, params: tuple) -> ImageJob | None:
+        row = self._conn.execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM image_jobs WHERE {where}", params
+        ).fetchone()
+        return self._row_to_job(row)
+
+    def submit(
+        self, request: dict, idempotency_key: str | None = None
+    ) -> tuple[ImageJob, bool]:
+        """Insert the job, first dropping finished jobs older than `ttl`."""
+        now = time.time()
+        job = ImageJob(
+            id=uuid.uuid4().hex,
+            status=QUEUED,
+            request=request,
+            idempotency_key=idempotency_key,
+            created_at=now,
+            updated_at=now,
+            not_before=now,
+        )
+        row = job.to_dict()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM image_jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (SUCCEEDED, FAILED, now - self.ttl),
+            )
+            if idempotency_key is not None:
+                existing = self._select("idempotency_key = ?", (idempotency_key,))
+                if existing is not None:
+                    if not _same_request(existing, request):
+                        raise IdempotencyConflict(existing.id)
+                    return existing, False
+            self._conn.execute(
+                f"INSERT INTO image_jobs ({', '.join(self._COLUMNS)}) VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                tuple(self._encode(c, row[c]) for c in self._COLUMNS),
+            )
+        return job, True
+
+    def get(self, job_id: str) -> ImageJob | None:
+        """Return the job, or None if it is unknown or expired."""
+        with self._lock:
+            return self._select("id = ?", (job_id,))
+
+    def claim(self, worker_id: str, lease_seconds: float) -> ImageJob | None:
+        """Fail lost jobs out of attempts, then lease the oldest due job to `worker_id`."""
+        now = time.time()
+        with self._lock, self._conn:
+            # Lost leases that used up their attempts fail instead of looping forever
+            self._conn.execute(
+                """
+                UPDATE image_jobs SET status = ?, error = ?, updated_at = ?, worker_id = NULL
+                WHERE status = ? AND lease_until < ? AND attempts >= ?
+                """,
+                (FAILED, json.dumps("Image worker lost the job"), now, RUNNING, now, self.max_attempts),
+            )
+            # A single statement, so two workers can never claim the same job
+            row = self._conn.execute(
+                f"""
+                UPDATE image_jobs
+                SET status = ?, worker_id = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM image_jobs
+                    WHERE (status = ? AND not_before <= ?) OR (status = ? AND lease_until < ?)
+                    ORDER BY not_before, created_at
+                    LIMIT 1
+                )
+                RETURNING {', '.join(self._COLUMNS)}
+                """,
+                (RUNNING, worker_id, now + lease_seconds, now, QUEUED, now, RUNNING, now),
+            ).fetchone()
+        return self._row_to_job(row)
+
+    def extend_lease(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Push the lease of a running job `lease_seconds` into the future."""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE image_jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = ?",
+                (now + lease_seconds, now, job_id, worker_id, RUNNING),
+            )
+        return cursor.rowcount > 0
+
+    def _finish(self, job_id: str, worker_id: str, changes: dict) -> bool:
+        changes = {**changes, "updated_at": time.time(), "worker_id": None, "lease_until": None}
+        assignments = ", ".join(f"{column} = ?" for column in changes)
+        values = tuple(self._encode(c, v) for c, v in changes.items())
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"UPDATE image_jobs SET {assignments} WHERE id = ? AND worker_id = ? AND status = ?",
+                (*values, job_id, worker_id, RUNNING),
+            )
+        return cursor.rowcount > 0
+
+    def stats(self) -> dict:
+        """Return the number of jobs per status."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM image_jobs GROUP BY status"
+            ).fetchall()
+        return {status: 0 for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)} | dict(rows)
+
+
+# Claims the first due job atomically. Expired leases come first so a crashed
+# worker's jobs are not starved by new submissions.
+_CLAIM_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, 1)
+if #ids == 0 then
+  ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+  if #ids == 0 then return nil end
+  redis.call('ZREM', KEYS[1], ids[1])
+end
+local key = ARGV[4] .. ids[1]
+local raw = redis.call('GET', key)
+if not raw then
+  redis.call('ZREM', KEYS[2], ids[1])
+  return nil
+end
+local job = cjson.decode(raw)
+if job['status'] == 'running' and job['attempts'] >= tonumber(ARGV[5]) then
+  job['status'] = 'failed'
+  job['error'] = 'Image worker lost the job'
+  job['worker_id'] = cjson.null
+  job['lease_until'] = cjson.null
+  job['updated_at'] = tonumber(ARGV[1])
+  redis.call('ZREM', KEYS[2], ids[1])
+  redis.call('SET', key, cjson.encode(job), 'EX', ARGV[6])
+  return nil
+end
+job['status'] = 'running'
+job['worker_id'] = ARGV[3]
+job['lease_until'] = tonumber(ARGV[2])
+job['attempts'] = job['attempts'] + 1
+job['updated_at'] = tonumber(ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[2], ids[1])
+local encoded = cjson.encode(job)
+redis.call('SET', key, encoded)
+return encoded
+"""
+
+# Applies a JSON patch to a job held by ARGV[1]; moves it between the sets.
+_TRANSITION_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then return 0 end
+local job = cjson.decode(raw)
+if job['status'] ~= 'running' or job['worker_id'] ~= ARGV[1] then return 0 end
+for k, v in pairs(cjson.decode(ARGV[2])) do job[k] = v end
+if job['status'] == 'running' then
+  redis.call('ZADD', KEYS[2], job['lease_until'], ARGV[3])
+  redis.call('SET', KEYS[1], cjson.encode(job))
+elseif job['status'] == 'queued' then
+  redis.call('ZREM', KEYS[2], ARGV[3])
+  redis.call('ZADD', KEYS[3], job['not_before'], ARGV[3])
+  redis.call('SET', KEYS[1], cjson.encode(job))
+else
+  redis.call('ZREM', KEYS[2], ARGV[3])
+  redis.call('SET', KEYS[1], cjson.encode(job), 'EX', ARGV[4])
+  local idempotency_key = job['idempotency_key']
+  if idempotency_key and idempotency_key ~= cjson.null then
+    redis.call('EXPIRE', ARGV[5] .. idempotency_key, ARGV[4])
+  end
+end
+return 1
+"""
+
+
+class RedisJobStore(JobStore):
+    """Job queue in Redis, for API pods and image workers on different hosts.
+
+    Jobs are JSON strings; due jobs sit in a sorted set scored by the time they
+    may run, running jobs in one scored by their lease expiry. Claims and
+    transitions are Lua scripts, so they are atomic across workers.
+    """
+
+    def __init__(self, url: str, prefix: str = "image_jobs", **kwargs):
+        """Connect to Redis at `url`; every key of the queue starts with `prefix`."""
+        super().__init__(**kwargs)
+        import redis
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._queued = f"{prefix}:queued"
+        self._running = f"{prefix}:running"
+        self._claim = self._redis.register_script(_CLAIM_SCRIPT)
+        self._transition = self._redis.register_script(_TRANSITION_SCRIPT)
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def _idempotency_key(self, key: str) -> str:
+        return f"{self.prefix}:idem:{key}"
+
+    def submit(
+        self, request: dict, idempotency_key: str | None = None
+    ) -> tuple[ImageJob, bool]:
+        """Store the job and claim its idempotency key, or return the job holding the key."""
+        now = time.time()
+        job = ImageJob(
+            id=uuid.uuid4().hex,
+            status=QUEUED,
+            request=request,
+            idempotency_key=idempotency_key,
+            created_at=now,
+            updated_at=now,
+            not_before=now,
+        )
+        # The job is written before its idempotency key, so a key always points
+        # at a readable job.
+        self._redis.set(self._job_key(job.id), json.dumps(job.to_dict(), ensure_ascii=False))
+        if idempotency_key is not None and not self._redis.set(
+            self._idempotency_key(idempotency_key), job.id, nx=True
+        ):
+            self._redis.delete(self._job_key(job.id))
+            existing_id = self._redis.get(self._idempotency_key(idempotency_key))
+            existing = self.get(existing_id) if existing_id else None
+            if existing is None:
+                # The other job finished and expired between the two reads
+                return self.submit(request, idempotency_key)
+            if not _same_request(existing, request):
+                raise IdempotencyConflict(existing.id)
+            return existing, False
+        self._redis.zadd(self._queued, {job.id: job.not_before})
+        return job, True
+
+    def get(self, job_id: str) -> ImageJob | None:
+        """Return the job, or None if it is unknown or expired."""
+        raw = self._redis.get(self._job_key(job_id))
+        return ImageJob.from_dict(json.loads(raw)) if raw else None
+
+    def claim(self, worker_id: str, lease_seconds: float) -> ImageJob | None:
+        """Lease the first expired or due job to `worker_id` in one script call."""
+        now = time.time()
+        raw = self._claim(
+            keys=[self._queued, self._running],
+            args=[
+                now,
+                now + lease_seconds,
+                worker_id,
+                f"{self.prefix}:job:",
+                self.max_attempts,
+                int(self.ttl),
+            ],
+        )
+        return ImageJob.from_dict(json.loads(raw)) if raw else None
+
+    def _apply(self, job_id: str, worker_id: str, changes: dict) -> bool:
+        return bool(
+            self._transition(
+                keys=[self._job_key(job_id), self._running, self._queued],
+                args=[
+                    worker_id,
+                    json.dumps(changes, ensure_ascii=False, default=str),
+                    job_id,
+                    int(self.ttl),
+                    f"{self.prefix}:idem:",
+                ],
+            )
+        )
+
+    def extend_lease(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Push the lease of a running job `lease_seconds` into the future."""
+        now = time.time()
+        return self._apply(
+            job_id, worker_id, {"lease_until": now + lease_seconds, "updated_at": now}
+        )
+
+    def _finish(self, job_id: str, worker_id: str, changes: dict) -> bool:
+        changes = {**changes, "updated_at": time.time(), "worker_id": None, "lease_until": None}
+        return self._apply(job_id, worker_id, changes)
+
+    def stats(self) -> dict:
+        """Return the number of queued and running jobs; finished ones are not indexed."""
+        return {
+            QUEUED: self._redis.zcard(self._queued),
+            RUNNING: self._redis.zcard(self._running),
+        }
+
+
+_stores: dict[str, JobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_job_store(sqlite_path: str, redis_url: str | None = None) -> JobStore:
+    """Return the shared job store: Redis if `redis_url` is given and the client is installed, else SQLite."""
+    with _stores_lock:
+        if redis_url:
+            store = _stores.get(redis_url)
+            if store is not None:
+                return store
+            try:
+                store = _stores[redis_url] = RedisJobStore(redis_url)
+                return store
+            except ImportError:
+                logger.warning(
+                    "redis is not installed; image jobs are stored in SQLite at %s",
+                    sqlite_path,
+                )
+        store = _stores.get(sqlite_path)
+        if store is None:
+            store = _stores[sqlite_path] = SQLiteJobStore(sqlite_path)
+        return store
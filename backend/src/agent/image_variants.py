@@ -0,0 +1,120 @@
+"""Thumbnail and web-sized re-encodings of generated images."""
+
+import asyncio
+import functools
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Longest side of the card-sized thumbnail, in pixels
+THUMBNAIL_SIZE = 640
+_QUALITY = {"thumb": 75, "web": 82}
+_MIME_TYPES = {"WEBP": "image/webp", "AVIF": "image/avif"}
+
+
+@functools.lru_cache(maxsize=1)
+def variant_format() -> str:
+    """Pillow format for variants: IMAGE_VARIANT_FORMAT (webp or avif), default WebP."""
+    fmt = os.getenv("IMAGE_VARIANT_FORMAT", "webp").upper()
+    if fmt == "AVIF":
+        from PIL import features
+
+        if not features.check("avif"):
+            logger.warning("This Pillow build cannot encode AVIF; using WebP image variants")
+            fmt = "WEBP"
+    return fmt if fmt in _MIME_TYPES else "WEBP"
+
+
+def _encode(image: "Image.Image", fmt: str, quality: int) -> bytes:
+    out = io.BytesIO()
+    options = {"method": 4} if fmt == "WEBP" else {}
+    image.save(out, format=fmt, quality=quality, **options)
+    return out.getvalue()
+
+
+def make_variants(data: bytes, fmt: str = "WEBP") -> dict[str, tuple[str, bytes]]:
+    """Build the size variants of one generated image.
+
+    Runs in a worker process. Returns `{name: (mime_type, data)}` with
+    - "thumb": at most THUMBNAIL_SIZE px on the long side, for page cards
+    - "web": full resolution, re-encoded; omitted when not smaller than the original
+    """
+    # Imported here so that importing the image pipeline does not load Pillow
+    from PIL import Image
+
+    mime_type = _MIME_TYPES[fmt]
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        has_alpha = "A" in source.getbands() or "transparency" in source.info
+        image = source.convert("RGBA" if has_alpha else "RGB")
+    variants: dict[str, tuple[str, bytes]] = {}
+    web = _encode(image, fmt, _QUALITY["web"])
+    if len(web) < len(data):
+        variants["web"] = (mime_type, web)
+    thumb = image.copy()
+    thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+    variants["thumb"] = (mime_type, _encode(thumb, fmt, _QUALITY["thumb"]))
+    return variants
+
+
+_lock = threading.Lock()
+_executor: ProcessPoolExecutor | None = None
+
+
+def _get_executor() -> ProcessPoolExecutor | None:
+    """Return the shared worker pool, or None when IMAGE_VARIANT_WORKERS is 0."""
+    global _executor
+    workers = int(os.getenv("IMAGE_VARIANT_WORKERS", str(min(4, os.cpu_count() or 1))))
+    if workers <= 0:
+        return None
+    with _lock:
+        if _executor is None:
+            # spawn: forking a process that runs an event loop and worker threads
+            # can copy held locks into the child.
+            _executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _reset_executor(executor: ProcessPoolExecutor) -> None:
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def build_variants(data: bytes) -> dict[str, tuple[str, bytes]]:
+    """Encode the variants of `data` off the event loop.
+
+    Image decoding and encoding is CPU-bound, so it runs in a process pool (or a
+    thread with IMAGE_VARIANT_WORKERS=0). Failures are logged and yield no
+    variants; the original image is still served.
+    """
+    fmt = variant_format()
+    executor = _get_executor()
+    try:
+        if executor is None:
+            return await asyncio.to_thread(make_variants, data, fmt)
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, make_variants, data, fmt
+        )
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge image); start a fresh pool next time.
+        logger.warning("Image variant worker pool broke; restarting it", exc_info=True)
+        _reset_executor(executor)
+        return {}
+    except Exception:
+        logger.warning("Building image variants failed", exc_info=True)
+        return {}
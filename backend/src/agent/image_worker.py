@@ -0,0 +1,193 @@
+"""Worker that runs durable image jobs.
+
+Run one or more of these next to the API to scale image generation separately:
+
+    python -m agent.image_worker --concurrency 8
+
+Workers share the job store (Redis with REDIS_URI, otherwise the SQLite file in
+IMAGE_CACHE_DIR) and write results to the image store, so IMAGE_CACHE_DIR must
+be a volume shared with the API pods.
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import logging
+import os
+import signal
+import socket
+import uuid
+
+from agent.image_jobs import ImageJob, JobStore
+from agent.images import (
+    ImageGenerationError,
+    ImageOptions,
+    get_image_jobs,
+    get_or_generate_images,
+)
+from agent.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+# Failures worth running the job again later: the model kept failing or its
+# circuit breaker was open. Blocked prompts (422) fail the job right away.
+RETRYABLE_JOB_STATUS = frozenset({500, 503})
+
+
+def job_request(options: ImageOptions, key: str, bypass_cache: bool = False) -> dict:
+    """Serialize what a worker needs to run an image job."""
+    return {
+        "options": dataclasses.asdict(options),
+        "key": key,
+        "bypass_cache": bypass_cache,
+    }
+
+
+class ImageJobWorker:
+    """Claim image jobs from `store` and run up to `concurrency` of them at a time.
+
+    The lease of a running job is renewed every third of `lease_seconds`; if this
+    process dies, the job is picked up by another worker once its lease expires.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        concurrency: int = 4,
+        lease_seconds: float = 60.0,
+        poll_interval: float = 0.5,
+        worker_id: str | None = None,
+    ):
+        """Create a worker; `worker_id` defaults to one built from the host and pid."""
+        self.store = store
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks: set[asyncio.Task] = set()
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Process jobs until `stop` is set, then let running jobs finish."""
+        slots = asyncio.Semaphore(self.concurrency)
+        logger.info("Image worker %s started", self.worker_id)
+        try:
+            while not stop.is_set():
+                await slots.acquire()
+                job = None
+                try:
+                    job = await asyncio.to_thread(
+                        self.store.claim, self.worker_id, self.lease_seconds
+                    )
+                except Exception:
+                    logger.warning("Claiming an image job failed", exc_info=True)
+                if job is None:
+                    slots.release()
+                    try:
+                        await asyncio.wait_for(stop.wait(), self.poll_interval)
+                    except TimeoutError:
+                        pass
+                    continue
+                task = asyncio.create_task(self._process(job), name=f"image-job-{job.id}")
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                task.add_done_callback(lambda _: slots.release())
+        finally:
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            logger.info("Image worker %s stopped", self.worker_id)
+
+    async def _keep_lease(self, job: ImageJob, task: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            kept = await asyncio.to_thread(
+                self.store.extend_lease, job.id, self.worker_id, self.lease_seconds
+            )
+            if not kept:
+                logger.warning("Image job %s was taken over; abandoning it", job.id)
+                task.cancel()
+                return
+
+    async def _process(self, job: ImageJob) -> None:
+        options = ImageOptions(**job.request["options"])
+        work = asyncio.create_task(
+            get_or_generate_images(
+                options, job.request["key"], bypass_cache=job.request.get("bypass_cache", False)
+            )
+        )
+        lease = asyncio.create_task(self._keep_lease(job, work))
+        outcome = "failed"
+        try:
+            stored, queue_wait, cache_status = await work
+        except asyncio.CancelledError:
+            outcome = "abandoned"
+            if asyncio.current_task().cancelling():
+                raise
+            return
+        except ImageGenerationError as exc:
+            if exc.status_code in RETRYABLE_JOB_STATUS and job.attempts < self.store.max_attempts:
+                outcome = "retried"
+                retry_after = (exc.headers or {}).get("Retry-After")
+                delay = float(retry_after) if retry_after else min(300.0, 5.0 * 2**job.attempts)
+                await asyncio.to_thread(
+                    self.store.retry_later, job.id, self.worker_id, exc.detail, delay
+                )
+            else:
+                await asyncio.to_thread(
+                    self.store.fail, job.id, self.worker_id, exc.detail, exc.status_code
+                )
+        except Exception as exc:
+            logger.exception("Image job %s crashed", job.id)
+            await asyncio.to_thread(self.store.fail, job.id, self.worker_id, str(exc), 500)
+        else:
+            outcome = "succeeded"
+            await asyncio.to_thread(
+                self.store.complete,
+                job.id,
+                self.worker_id,
+                {
+                    "cache_key": options.cache_key(),
+                    "images": [image.digest for image in stored],
+                    "queue_wait_ms": int(queue_wait * 1000),
+                    "cache": cache_status,
+                },
+            )
+        finally:
+            lease.cancel()
+            metrics.inc(
+                "agent_image_jobs_total",
+                labels={"outcome": outcome},
+                help_text="Image jobs processed by workers, by outcome.",
+            )
+
+
+async def _serve(concurrency: int, lease_seconds: float) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    worker = ImageJobWorker(get_image_jobs(), concurrency=concurrency, lease_seconds=lease_seconds)
+    await worker.run(stop)
+
+
+def main() -> None:
+    """Run a worker until SIGINT or SIGTERM."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.getenv("IMAGE_JOB_CONCURRENCY", "4")),
+        help="Jobs run at the same time by this process",
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=60.0,
+        help="How long a job stays with this worker without a heartbeat",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    asyncio.run(_serve(args.concurrency, args.lease_seconds))
+
+
+if __name__ == "__main__":
+    main()
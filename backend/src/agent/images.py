@@ -0,0 +1,373 @@
+"""Image generation through the shared scheduler, cache and job queue."""
+
+import asyncio
+import logging
+import os
+import pathlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+
+from agent.clients import get_genai_client
+from agent.fact_sheet import estimate_tokens
+from agent.image_cache import ImageCache, StoredImage, image_cache_key
+from agent.image_jobs import JobStore, get_job_store
+from agent.image_variants import build_variants
+from agent.instrumentation import metrics
+from agent.rate_limit import rate_limiter
+from agent.retry import CircuitOpenError, NoImageError, call_with_retry
+from agent.scheduler import FairScheduler
+
+logger = logging.getLogger(__name__)
+
+# Per request: use Gemini 3 image preview model
+IMAGE_MODEL = "gemini-3-pro-image-preview"
+SAFETY_FINISH_REASONS = frozenset(
+    {
+        "SAFETY",
+        "BLOCKLIST",
+        "PROHIBITED_CONTENT",
+        "SPII",
+        "IMAGE_SAFETY",
+        "IMAGE_PROHIBITED_CONTENT",
+    }
+)
+# Output tokens of one generated image by size, used to reserve quota up front
+IMAGE_OUTPUT_TOKENS = {"1K": 1120, "2K": 1120, "4K": 2000}
+
+IMAGE_CACHE_DIR = os.getenv(
+    "IMAGE_CACHE_DIR", str(pathlib.Path(__file__).parent.parent.parent / ".image_cache")
+)
+
+# Built on first use: the image store scans its directory and the job store opens
+# SQLite or connects to Redis, which importing the module should not do.
+_lock = threading.Lock()
+_image_scheduler: FairScheduler | None = None
+_image_cache: ImageCache | None = None
+_image_jobs: JobStore | None = None
+_speculative_images: Optional["SpeculativeImageBoard"] = None
+
+
+def get_image_scheduler() -> FairScheduler:
+    """Return the process-wide cap on in-flight image model calls, queued fairly per client."""
+    global _image_scheduler
+    if _image_scheduler is None:
+        with _lock:
+            if _image_scheduler is None:
+                _image_scheduler = FairScheduler(
+                    max_concurrency=int(os.getenv("IMAGE_MAX_CONCURRENCY", "8")),
+                    max_per_key=int(os.getenv("IMAGE_MAX_CONCURRENCY_PER_CLIENT", "0"))
+                    or None,
+                )
+    return _image_scheduler
+
+
+def get_image_cache() -> ImageCache:
+    """Return the disk cache of generated images; IMAGE_CACHE_MAX_BYTES=0 disables it."""
+    global _image_cache
+    if _image_cache is None:
+        with _lock:
+            if _image_cache is None:
+                _image_cache = ImageCache(
+                    IMAGE_CACHE_DIR,
+                    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024**3))),
+                    # Card-sized thumbnail and re-encoded full-size variant of each image
+                    postprocess=build_variants,
+                )
+    return _image_cache
+
+
+def get_image_jobs() -> JobStore:
+    """Return the durable image jobs run by `agent.image_worker`.
+
+    Redis when REDIS_URI is set (API pods and workers on different hosts), else
+    SQLite next to the image store.
+    """
+    global _image_jobs
+    if _image_jobs is None:
+        with _lock:
+            if _image_jobs is None:
+                _image_jobs = get_job_store(
+                    os.getenv("IMAGE_JOB_DB", os.path.join(IMAGE_CACHE_DIR, "jobs.sqlite")),
+                    os.getenv("REDIS_URI"),
+                )
+    return _image_jobs
+
+
+
+@dataclass(frozen=True)
+class ImageOptions:
+    """Everything that determines a generated image (and so its cache entry)."""
+
+    prompt: str
+    aspect_ratio: str = "3:4"
+    image_size: str = "1K"
+    use_search: bool = True
+
+    def cache_key(self) -> str:
+        """Return the image cache key of these options."""
+        return image_cache_key(
+            self.prompt, self.aspect_ratio, self.image_size, self.use_search, IMAGE_MODEL
+        )
+
+
+class ImageGenerationError(Exception):
+    """Image generation failed; carries the HTTP status and detail to report."""
+
+    def __init__(self, status_code: int, detail, headers: dict | None = None):
+        """Carry the response to send: status, detail and optional headers."""
+        super().__init__(str(detail))
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers
+
+
+def _enum_name(value) -> str | None:
+    return getattr(value, "name", None) or (str(value) if value is not None else None)
+
+
+async def call_image_model(
+    options: ImageOptions, key: str
+) -> tuple[list[tuple[str, bytes]], float]:
+    """Run the image model with retries and return `(mime_type, data)` pairs plus total queue wait.
+
+    Args:
+        options: What to generate
+        key: Fairness key for the image scheduler (a thread id or client address)
+
+    Raises:
+        ImageGenerationError: When no image could be generated
+    """
+    # Deferred like the client itself; google-genai is slow to import
+    from google.genai import types
+
+    prompt = options.prompt.replace("\n", " ")
+    tools = [{"google_search": {}}] if options.use_search else []
+    estimated = estimate_tokens(prompt) + IMAGE_OUTPUT_TOKENS.get(options.image_size, 2000)
+    queue_wait = 0.0
+    attempt = 0
+
+    async def generate() -> list[tuple[str, bytes]]:
+        nonlocal queue_wait, attempt
+        attempt += 1
+        # Time spent waiting for the image quota counts as queue wait too
+        queue_wait += await rate_limiter.acquire(IMAGE_MODEL, estimated)
+        # The slot is held per attempt, not while backing off between attempts
+        async with get_image_scheduler().slot(key) as ticket:
+            queue_wait += ticket.wait_seconds
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                # Shares the connection pool with the research graph's Gemini calls
+                response = await get_genai_client().aio.models.generate_content(
+                    model=IMAGE_MODEL,
+                    contents=prompt,
+                    config=types.GenerateContentConfig(
+                        tools=tools,
+                        image_config=types.ImageConfig(
+                            aspect_ratio=options.aspect_ratio,
+                            image_size=options.image_size,
+                        ),
+                    ),
+                )
+                outcome = "ok"
+                rate_limiter.settle(
+                    IMAGE_MODEL,
+                    estimated,
+                    getattr(getattr(response, "usage_metadata", None), "total_token_count", None),
+                )
+            finally:
+                metrics.observe(
+                    "agent_image_call_seconds",
+                    time.perf_counter() - started,
+                    labels={"model": IMAGE_MODEL, "outcome": outcome},
+                    help_text="Latency of image model calls, excluding queue wait.",
+                )
+        metrics.observe(
+            "agent_image_queue_wait_seconds",
+            ticket.wait_seconds,
+            help_text="Time image requests waited for a scheduler slot.",
+        )
+        prompt_feedback = getattr(response, "prompt_feedback", None)
+        finish_reason = (
+            _enum_name(getattr(response.candidates[0], "finish_reason", None))
+            if getattr(response, "candidates", None)
+            else None
+        )
+        logging.info("Image prompt_feedback (attempt %s): %s", attempt, prompt_feedback)
+        logging.info("Image finish_reason (attempt %s): %s", attempt, finish_reason)
+
+        # Collect inline image parts
+        parts = []
+        if getattr(response, "parts", None):
+            parts = [part for part in response.parts if getattr(part, "inline_data", None)]
+        if not parts and getattr(response, "candidates", None):
+            for candidate in response.candidates:
+                if getattr(candidate, "content", None) and getattr(candidate.content, "parts", None):
+                    for part in candidate.content.parts:
+                        if getattr(part, "inline_data", None):
+                            parts.append(part)
+
+        if not parts:
+            block_reason = _enum_name(getattr(prompt_feedback, "block_reason", None))
+            detail = {
+                "error": "No image content returned",
+                "prompt_feedback": prompt_feedback,
+                "finish_reason": finish_reason,
+            }
+            # A blocked prompt or safety stop will be blocked again; retrying only
+            # adds load and latency.
+            blocked = bool(block_reason) or finish_reason in SAFETY_FINISH_REASONS
+            raise NoImageError(detail, retryable=not blocked)
+
+        return [
+            (part.inline_data.mime_type or "image/png", part.inline_data.data)
+            for part in parts
+        ]
+
+    try:
+        images = await call_with_retry(IMAGE_MODEL, generate, scope="generate_image")
+    except NoImageError as exc:
+        status_code = 500 if exc.retryable else 422
+        raise ImageGenerationError(status_code, exc.detail) from exc
+    except CircuitOpenError as exc:
+        raise ImageGenerationError(
+            503, str(exc), headers={"Retry-After": str(max(1, round(exc.retry_after)))}
+        ) from exc
+    except Exception as exc:
+        raise ImageGenerationError(500, str(exc)) from exc
+    return images, queue_wait
+
+
+async def get_or_generate_images(
+    options: ImageOptions, key: str, bypass_cache: bool = False
+) -> tuple[list[StoredImage], float, str]:
+    """Serve images from the cache or the model.
+
+    Returns the stored images, the time spent queued for the model and the cache
+    outcome ("hit", "miss", "coalesced" or "bypass").
+    """
+    queue_wait = 0.0
+
+    async def generate() -> list[tuple[str, bytes]]:
+        nonlocal queue_wait
+        images, queue_wait = await call_image_model(options, key)
+        return images
+
+    stored, cache_status = await get_image_cache().get_or_generate(
+        options.cache_key(), generate, bypass=bypass_cache
+    )
+    return stored, queue_wait, cache_status
+
+
+@dataclass
+class _Storyboard:
+    thread_id: str
+    results: dict[int, dict] = field(default_factory=dict)
+    tasks: dict[int, asyncio.Task] = field(default_factory=dict)
+    sealed: bool = False
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class SpeculativeImageBoard:
+    """Image jobs started by the graph while the storyboard is still being written.
+
+    `finalize_answer` submits each page as soon as it is parsed, so image generation
+    overlaps the rest of the answer instead of starting after the run. Results are
+    kept per storyboard (the id of the answer message) and page id; clients
+    `subscribe` to them. Jobs go through the image cache, so a later
+    /generate_images request for the same pages is a cache hit or joins the
+    in-flight call.
+    """
+
+    def __init__(self, max_storyboards: int = 256):
+        """Track at most `max_storyboards` storyboards, forgetting the oldest first."""
+        self.max_storyboards = max_storyboards
+        self._storyboards: OrderedDict[str, _Storyboard] = OrderedDict()
+
+    def open(self, storyboard_id: str, thread_id: str) -> None:
+        """Start tracking a storyboard, forgetting the oldest one if needed."""
+        self._storyboards[storyboard_id] = _Storyboard(thread_id=thread_id)
+        while len(self._storyboards) > self.max_storyboards:
+            _, old = self._storyboards.popitem(last=False)
+            old.sealed = True
+            old.changed.set()
+
+    def submit(self, storyboard_id: str, page_id: int, options: ImageOptions) -> None:
+        """Start generating the image of one page in the background."""
+        board = self._storyboards.get(storyboard_id)
+        if board is None or board.sealed or page_id in board.tasks:
+            return
+        board.tasks[page_id] = asyncio.create_task(
+            self._run(board, page_id, options), name=f"speculative-image-{page_id}"
+        )
+
+    def seal(self, storyboard_id: str) -> None:
+        """Mark that every page of the storyboard has been submitted."""
+        board = self._storyboards.get(storyboard_id)
+        if board is not None:
+            board.sealed = True
+            self._notify(board)
+
+    @staticmethod
+    def _notify(board: _Storyboard) -> None:
+        board.changed.set()
+        board.changed = asyncio.Event()
+
+    async def _run(self, board: _Storyboard, page_id: int, options: ImageOptions) -> None:
+        try:
+            stored, queue_wait, cache_status = await get_or_generate_images(
+                options, board.thread_id
+            )
+            board.results[page_id] = {
+                "images": stored,
+                "queue_wait_ms": int(queue_wait * 1000),
+                "cache": cache_status,
+            }
+        except ImageGenerationError as exc:
+            board.results[page_id] = {"error": exc.detail}
+        except asyncio.CancelledError:
+            # Subscribers wait for a result per submitted page; do not leave them hanging
+            board.results[page_id] = {"error": "cancelled"}
+            raise
+        except Exception as exc:
+            logger.warning("Speculative image for page %s failed", page_id, exc_info=True)
+            board.results[page_id] = {"error": str(exc)}
+        finally:
+            self._notify(board)
+
+    def __contains__(self, storyboard_id: str) -> bool:
+        """Whether the storyboard is still tracked."""
+        return storyboard_id in self._storyboards
+
+    async def subscribe(self, storyboard_id: str) -> AsyncIterator[tuple[int, dict]]:
+        """Yield `(page_id, result)` for every page as it finishes.
+
+        Pages that already finished are yielded first. The iteration ends once the
+        storyboard is sealed and all its submitted pages have finished.
+        """
+        board = self._storyboards.get(storyboard_id)
+        if board is None:
+            raise KeyError(storyboard_id)
+        sent: set[int] = set()
+        while True:
+            changed = board.changed
+            for page_id, result in list(board.results.items()):
+                if page_id not in sent:
+                    sent.add(page_id)
+                    yield page_id, result
+            if board.sealed and len(sent) >= len(board.tasks):
+                return
+            await changed.wait()
+
+
+def get_speculative_images() -> SpeculativeImageBoard:
+    """Return the speculative image jobs of this process."""
+    global _speculative_images
+    if _speculative_images is None:
+        with _lock:
+            if _speculative_images is None:
+                _speculative_images = SpeculativeImageBoard()
+    return _speculative_images
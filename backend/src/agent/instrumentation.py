@@ -0,0 +1,256 @@
+"""Per-node metrics and structured logs for the research graph."""
+
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any
+
+logger = logging.getLogger("agent.metrics")
+
+# Seconds; covers fast cache hits up to slow pro-model answers and image calls.
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, Any] | None) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: tuple[str, str] | None = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class MetricsRegistry:
+    """Minimal in-process counters, gauges and histograms in Prometheus text format."""
+
+    def __init__(self) -> None:
+        """Create an empty registry."""
+        self._lock = threading.Lock()
+        self._help: dict[str, tuple[str, str]] = {}
+        self._values: dict[str, dict[Labels, float]] = defaultdict(dict)
+        self._histograms: dict[str, dict[Labels, list]] = defaultdict(dict)
+        self._buckets: dict[str, tuple[float, ...]] = {}
+
+    def _declare(self, name: str, kind: str, help_text: str) -> None:
+        self._help.setdefault(name, (kind, help_text))
+
+    def inc(self, name: str, value: float = 1, labels=None, help_text: str = "") -> None:
+        """Add `value` to a counter."""
+        with self._lock:
+            self._declare(name, "counter", help_text)
+            key = _labels(labels)
+            self._values[name][key] = self._values[name].get(key, 0) + value
+
+    def set(self, name: str, value: float, labels=None, help_text: str = "") -> None:
+        """Set a gauge."""
+        with self._lock:
+            self._declare(name, "gauge", help_text)
+            self._values[name][_labels(labels)] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        labels=None,
+        help_text: str = "",
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        """Record one observation in a histogram."""
+        with self._lock:
+            self._declare(name, "histogram", help_text)
+            bounds = self._buckets.setdefault(name, buckets)
+            key = _labels(labels)
+            hist = self._histograms[name].get(key)
+            if hist is None:
+                hist = self._histograms[name][key] = [[0] * len(bounds), 0.0, 0]
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: list[str] = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "histogram":
+                    bounds = self._buckets[name]
+                    for labels, (counts, total, count) in self._histograms[name].items():
+                        for bound, bucket_count in zip(bounds, counts):
+                            le = _format_labels(labels, ("le", f"{bound:g}"))
+                            lines.append(f"{name}_bucket{le} {bucket_count}")
+                        le = _format_labels(labels, ("le", "+Inf"))
+                        lines.append(f"{name}_bucket{le} {count}")
+                        lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+                        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+                else:
+                    for labels, value in self._values[name].items():
+                        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+@dataclass
+class NodeRecorder:
+    """Collects what one graph node invocation spent."""
+
+    node: str
+    started_at: float = field(default_factory=time.perf_counter)
+    models: list[str] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    model_calls: int = 0
+    cache_hits: int = 0
+    retries: int = 0
+    fanout: int | None = None
+    routes: list[dict] = field(default_factory=list)
+
+    def as_dict(self, duration: float) -> dict:
+        """Return the stats as the fields of a node's structured log line."""
+        return {
+            "node": self.node,
+            "duration_seconds": round(duration, 4),
+            "models": self.models,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "model_calls": self.model_calls,
+            "cache_hits": self.cache_hits,
+            "retries": self.retries,
+            "fanout": self.fanout,
+            "routes": self.routes,
+        }
+
+
+_current: contextvars.ContextVar[NodeRecorder | None] = contextvars.ContextVar(
+    "agent_node_recorder", default=None
+)
+
+
+def record_usage(
+    model: str,
+    prompt_tokens: int | None = 0,
+    completion_tokens: int | None = 0,
+    cached: bool = False,
+) -> None:
+    """Attribute one model call (or cache hit) to the running node."""
+    recorder = _current.get()
+    node = recorder.node if recorder else "none"
+    prompt_tokens = prompt_tokens or 0
+    completion_tokens = completion_tokens or 0
+    metrics.inc(
+        "agent_model_calls_total",
+        labels={"node": node, "model": model, "cached": str(cached).lower()},
+        help_text="Model calls made (or served from cache) per node and model.",
+    )
+    for kind, count in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+        if count:
+            metrics.inc(
+                "agent_tokens_total",
+                count,
+                labels={"node": node, "model": model, "kind": kind},
+                help_text="Tokens used per node, model and direction.",
+            )
+    if recorder is None:
+        return
+    if model not in recorder.models:
+        recorder.models.append(model)
+    if cached:
+        recorder.cache_hits += 1
+    else:
+        recorder.model_calls += 1
+    recorder.prompt_tokens += prompt_tokens
+    recorder.completion_tokens += completion_tokens
+
+
+def record_retry(count: int = 1, scope: str | None = None) -> None:
+    """Count retries of an upstream call against the running node (or `scope`)."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.retries += count
+    metrics.inc(
+        "agent_retries_total",
+        count,
+        labels={"scope": scope or (recorder.node if recorder else "none")},
+        help_text="Retried upstream calls.",
+    )
+
+
+def record_fanout(width: int) -> None:
+    """Record how many parallel branches the running node is about to spawn."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.fanout = width
+    metrics.observe(
+        "agent_fanout_width",
+        width,
+        labels={"node": recorder.node if recorder else "none"},
+        help_text="Number of web_research branches spawned per fan-out.",
+        buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21),
+    )
+
+
+def record_route(decision: dict) -> None:
+    """Attach a model routing decision (see `agent.routing`) to the running node."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.routes.append(decision)
+
+
+def instrument_node(name: str, *, starts_run: bool = False):
+    """Decorate an async graph node to record its latency, tokens and retries.
+
+    The node's metrics are logged as one structured line, exported through
+    `metrics`, and appended to the `node_metrics` state channel of its update.
+    The entry of a node that `starts_run` is marked `run_start` and replaces the
+    entries of the thread's earlier runs.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            recorder = NodeRecorder(node=name)
+            token = _current.set(recorder)
+            status = "error"
+            try:
+                result = await fn(*args, **kwargs)
+                status = "ok"
+            finally:
+                _current.reset(token)
+                duration = time.perf_counter() - recorder.started_at
+                entry = recorder.as_dict(duration)
+                entry["finished_at"] = round(time.time(), 3)
+                if starts_run:
+                    entry["run_start"] = True
+                metrics.observe(
+                    "agent_node_duration_seconds",
+                    duration,
+                    labels={"node": name, "status": status},
+                    help_text="Wall-clock time spent in each graph node.",
+                )
+                logger.info(json.dumps({"event": "node_metrics", "status": status, **entry}))
+            if isinstance(result, dict):
+                result = {**result, "node_metrics": [entry]}
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,178 @@
+"""Response cache for model calls, in memory or in a shared SQLite file."""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from typing import Any, Type
+
+from pydantic import BaseModel
+
+
+def llm_cache_key(
+    model: str,
+    temperature: float,
+    schema: Type[BaseModel] | str | None,
+    prompt: str,
+) -> str:
+    """Hash everything that determines a model response into a cache key.
+
+    `schema` is the structured-output model (its JSON schema is part of the key, so
+    changing a field invalidates old entries), a free-form tag such as
+    "google_search" for tool calls, or None for plain text responses.
+    """
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        schema_id = schema.__name__ + ":" + json.dumps(
+            schema.model_json_schema(), sort_keys=True
+        )
+    else:
+        schema_id = schema or ""
+    payload = json.dumps(
+        [model, float(temperature), schema_id, hashlib.sha256(prompt.encode("utf-8")).hexdigest()]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache(ABC):
+    """A key/value store for JSON-serializable model responses with per-entry TTL."""
+
+    def __init__(self) -> None:
+        """Start with zeroed hit/miss counters."""
+        self.counters: Counter[str] = Counter()
+
+    @abstractmethod
+    def _get(self, key: str) -> Any | None: ...
+
+    @abstractmethod
+    def _set(self, key: str, value: Any, expires_at: float | None) -> None: ...
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value for `key`, or None if missing or expired."""
+        value = self._get(key)
+        self.counters["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """Store `value` under `key`; `ttl` is in seconds, None or <= 0 means no expiry."""
+        expires_at = time.time() + ttl if ttl and ttl > 0 else None
+        self._set(key, value, expires_at)
+
+    def stats(self) -> dict:
+        """Return the hit and miss counts since the cache was created."""
+        return {"hits": self.counters["hits"], "misses": self.counters["misses"]}
+
+
+class InMemoryLLMCache(LLMCache):
+    """Process-local LRU cache."""
+
+    def __init__(self, max_entries: int = 1024):
+        """Keep at most `max_entries` responses, evicting the least recently used."""
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, tuple[Any, float | None]] = OrderedDict()
+
+    def _get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: Any, expires_at: float | None) -> None:
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class SQLiteLLMCache(LLMCache):
+    """Persistent cache in a single SQLite file, shared by every process on the host."""
+
+    def __init__(self, path: str, max_entries: int = 50_000):
+        """Open (or create) the cache database at `path`, keeping at most `max_entries` rows."""
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)"
+            )
+
+    def _get(self, key: str) -> Any | None:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(value)
+
+    def _set(self, key: str, value: Any, expires_at: float | None) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at, now),
+            )
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (now,),
+            )
+            self._conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+
+_caches: dict[tuple[str, str], LLMCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_llm_cache(backend: str, path: str) -> LLMCache | None:
+    """Return the shared cache for `backend` ("memory", "sqlite" or "none")."""
+    if backend == "none":
+        return None
+    if backend not in ("memory", "sqlite"):
+        raise ValueError(f"Unknown llm_cache backend: {backend!r}")
+    cache_id = (backend, path if backend == "sqlite" else "")
+    with _caches_lock:
+        cache = _caches.get(cache_id)
+        if cache is None:
+            cache = InMemoryLLMCache() if backend == "memory" else SQLiteLLMCache(path)
+            _caches[cache_id] = cache
+        return cache
@@ -84,6 +84,24 @@ reflection_instructions = """你是一名资深研究助理，正在分析关于
 </SUMMARIES>
 """
 
+fact_extraction_instructions = """你是一名研究整理员，负责把关于“{research_topic}”的最新研究笔记压缩成漫画分镜可用的事实表。
+
+指引：
+- 只提取下方笔记中出现的事实，不要编造。
+- 按角色（性格、外貌、服装、说话风格）、场景（时代、地点、氛围、视觉线索）和物件（是什么、外观特征）归类，每个条目用其名称标识。
+- 每条事实简短、独立、可直接用于绘制画面；合并重复或同义的事实。
+- 与漫画绘制无关的信息（来源、统计口径、推测）一律省略。
+- 全部事实总计不超过约 {max_tokens} 个 token。
+- 始终用 {language} 回答。
+
+输出格式：
+- 将响应格式化为包含以下精确键的 JSON 对象："characters"、"settings"、"objects"，每个键对应一个由 {{"name": ..., "facts": [...]}} 组成的列表。
+
+<NOTES>
+{summaries}
+</NOTES>
+"""
+
 answer_instructions = """你是一名漫画脚本师，正在创作关于“{research_topic}”的详细的漫画分镜脚本。
 
 严格要求：
@@ -116,3 +134,33 @@ answer_instructions = """你是一名漫画脚本师，正在创作关于“{res
 {summaries}
 </SUMMARIES>
 """
+
+
+storyboard_revision_instructions = """你是一名漫画脚本师，正在按用户的修改意见修订一份关于“{research_topic}”的现有漫画分镜脚本。
+
+严格要求：
+- 只输出有效的 JSON 数组。不要有正文、Markdown 代码块或注释。
+- 只输出需要修改或新增的页面；不受修改意见影响的页面不要输出。
+- 每个页面对象必须且仅有两个键：
+  - "id"：整数，沿用现有页面的编号；新增页面使用现有最大编号之后的编号。
+  - "detail"：字符串，该页修改后的完整描述（不是差异说明），与原脚本同样详尽：角色动作、服装、环境、镜头/构图、带语气的对话、道具、转场。
+- 如果没有页面需要修改，输出空数组 []。
+- 不要编造事实。新增的细节都要基于提供的摘要。
+
+指引：
+- 当前日期是 {current_date}。
+- 修改后的页面要与未修改的页面在人物外貌、服装、画风和情节上保持连贯。
+- 始终用 {language} 回答。
+
+修改意见：
+{revision_request}
+
+当前分镜（JSON）：
+{storyboard}
+
+<SUMMARIES>
+# Summaries
+
+{summaries}
+</SUMMARIES>
+"""
@@ -0,0 +1,148 @@
+"""Detection of near-duplicate search queries."""
+
+import functools
+import logging
+import math
+import re
+import unicodedata
+from typing import Callable, Iterable, Sequence
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[Sequence[str]], Sequence[Sequence[float]]]
+
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+# Function words that make two phrasings of the same query look different.
+_STOP_WORDS = frozenset(
+    "a an and are for how in is of on the to what when where which who why".split()
+)
+_CJK_STOP_CHARS = frozenset("的了和与及之是在")
+
+
+def normalize_query(query: str) -> str:
+    """Fold width/case, drop punctuation and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = _PUNCT_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+def query_tokens(query: str) -> frozenset[str]:
+    """Tokenize a normalized query.
+
+    Latin words are tokens as-is; runs of CJK characters, which have no spaces, are
+    split into character bigrams so that reordered phrasings still overlap. Common
+    function words are dropped in both cases.
+    """
+    tokens: set[str] = set()
+    for word in normalize_query(query).split():
+        if not _CJK_RE.search(word):
+            if word not in _STOP_WORDS:
+                tokens.add(word)
+            continue
+        word = "".join(ch for ch in word if ch not in _CJK_STOP_CHARS)
+        if len(word) <= 1:
+            tokens.update(word)
+            continue
+        tokens.update(word[i : i + 2] for i in range(len(word) - 1))
+    return frozenset(tokens)
+
+
+def token_set_similarity(a: frozenset[str], b: frozenset[str]) -> float:
+    """Jaccard similarity of two token sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@functools.lru_cache(maxsize=4)
+def load_local_embedder(model_name: str) -> EmbedFn | None:
+    """Load a local sentence-transformers model, or None if it is not installed."""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logger.warning(
+            "sentence-transformers is not installed; embedding query dedup is disabled"
+        )
+        return None
+    model = SentenceTransformer(model_name)
+    return lambda texts: model.encode(list(texts)).tolist()
+
+
+class QueryDeduplicator:
+    """Drop search queries that repeat, or nearly repeat, queries already searched.
+
+    A query is redundant when its normalized text matches, its token-set similarity
+    reaches `token_threshold`, or (with an `embed` function) its embedding cosine
+    similarity reaches `embedding_threshold`. Near-duplicates within one batch of
+    new queries are merged by keeping the more specific (longer) phrasing.
+    """
+
+    def __init__(
+        self,
+        token_threshold: float = 0.8,
+        embed: EmbedFn | None = None,
+        embedding_threshold: float = 0.9,
+    ):
+        """Create a deduplicator; without `embed` only token overlap is compared."""
+        self.token_threshold = token_threshold
+        self.embed = embed
+        self.embedding_threshold = embedding_threshold
+
+    def _similar(
+        self,
+        a: tuple[str, frozenset[str], Sequence[float] | None],
+        b: tuple[str, frozenset[str], Sequence[float] | None],
+    ) -> bool:
+        if a[0] == b[0]:
+            return True
+        if token_set_similarity(a[1], b[1]) >= self.token_threshold:
+            return True
+        if a[2] is not None and b[2] is not None:
+            return _cosine(a[2], b[2]) >= self.embedding_threshold
+        return False
+
+    def dedupe(
+        self, new_queries: Iterable[str], seen_queries: Iterable[str] = ()
+    ) -> tuple[list[str], list[str]]:
+        """Split `new_queries` into queries worth running and redundant ones.
+
+        Returns:
+            A `(kept, skipped)` pair; `kept` preserves the original order.
+        """
+        new_list = [q for q in new_queries if q and q.strip()]
+        seen_list = list(dict.fromkeys(q for q in seen_queries if q))
+        vectors: list[Sequence[float] | None] = [None] * (len(new_list) + len(seen_list))
+        if self.embed is not None and new_list:
+            vectors = list(self.embed(new_list + seen_list))
+
+        def features(query: str, idx: int):
+            return normalize_query(query), query_tokens(query), vectors[idx]
+
+        seen = [features(q, len(new_list) + i) for i, q in enumerate(seen_list)]
+        kept: list[tuple[int, str, tuple]] = []
+        skipped: list[str] = []
+        for idx, query in enumerate(new_list):
+            feat = features(query, idx)
+            if any(self._similar(feat, other) for other in seen):
+                skipped.append(query)
+                continue
+            match = next(
+                (pos for pos, (_, _, other) in enumerate(kept) if self._similar(feat, other)),
+                None,
+            )
+            if match is None:
+                kept.append((idx, query, feat))
+            elif len(query) > len(kept[match][1]):
+                # Merge: keep the more specific phrasing in the earlier slot.
+                skipped.append(kept[match][1])
+                kept[match] = (kept[match][0], query, feat)
+            else:
+                skipped.append(query)
+        return [query for _, query, _ in kept], skipped
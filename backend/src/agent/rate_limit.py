@@ -0,0 +1,325 @@
+"""Per-model Gemini quotas (requests and tokens per minute) shared by every caller.
+
+Limits come from GEMINI_RATE_LIMITS, a comma-separated list of
+`model=rpm/tpm` entries, where `*` sets the limit of unlisted models and 0
+leaves a dimension unlimited:
+
+    GEMINI_RATE_LIMITS="gemini-2.5-flash=1000/1000000,gemini-3-pro-image-preview=20/0"
+
+With REDIS_URI the buckets live in Redis, so all API replicas and image workers
+draw from the same quota. Without it (or when Redis is unreachable) each process
+keeps its own buckets.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from agent.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds a queued caller sleeps at most before asking the bucket again; other
+# replicas may have left tokens by then.
+MAX_POLL_SECONDS = 1.0
+
+
+@dataclass(frozen=True)
+class ModelLimit:
+    """Quota of one model; 0 leaves a dimension unlimited."""
+
+    rpm: float = 0
+    tpm: float = 0
+
+    @property
+    def unlimited(self) -> bool:
+        """Whether neither requests nor tokens are limited."""
+        return self.rpm <= 0 and self.tpm <= 0
+
+
+def parse_limits(spec: str | None) -> dict[str, ModelLimit]:
+    """Parse `model=rpm/tpm,...` into limits per model name."""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        model, _, values = entry.partition("=")
+        rpm, _, tpm = values.partition("/")
+        try:
+            limits[model.strip()] = ModelLimit(float(rpm or 0), float(tpm or 0))
+        except ValueError:
+            raise ValueError(f"Invalid GEMINI_RATE_LIMITS entry: {entry!r}") from None
+    return limits
+
+
+@dataclass
+class BucketState:
+    """Result of taking from a bucket: the seconds to wait (0 if taken) and what is left."""
+
+    wait: float
+    requests: float
+    tokens: float
+
+
+class LocalBuckets:
+    """Token buckets kept in this process."""
+
+    def __init__(self) -> None:
+        """Start with full buckets for every model."""
+        self._lock = threading.Lock()
+        # model -> [requests, tokens, updated_at]
+        self._buckets: dict[str, list[float]] = {}
+
+    def take(
+        self, model: str, limit: ModelLimit, requests: float, tokens: float, force: bool = False
+    ) -> BucketState:
+        """Take `requests` and `tokens` if the bucket holds them; `force` takes them anyway."""
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._buckets.setdefault(model, [limit.rpm, limit.tpm, now])
+            elapsed = max(0.0, now - bucket[2])
+            bucket[0] = min(limit.rpm, bucket[0] + elapsed * limit.rpm / 60)
+            bucket[1] = min(limit.tpm, bucket[1] + elapsed * limit.tpm / 60)
+            bucket[2] = now
+            wait = 0.0
+            if not force:
+                if limit.rpm > 0 and bucket[0] < requests:
+                    wait = max(wait, (requests - bucket[0]) * 60 / limit.rpm)
+                if limit.tpm > 0 and bucket[1] < tokens:
+                    wait = max(wait, (tokens - bucket[1]) * 60 / limit.tpm)
+            if wait == 0:
+                bucket[0] -= requests
+                bucket[1] -= tokens
+            return BucketState(wait, bucket[0], bucket[1])
+
+
+# Same refill-and-take as LocalBuckets, atomic across replicas. Redis' clock is
+# used so that replicas with skewed clocks agree on the refill.
+_TAKE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+local want_r, want_t = tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'r', 't', 'ts')
+local r = tonumber(state[1]) or rpm
+local t = tonumber(state[2]) or tpm
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+r = math.min(rpm, r + elapsed * rpm / 60)
+t = math.min(tpm, t + elapsed * tpm / 60)
+local wait = 0
+if ARGV[5] ~= '1' then
+  if rpm > 0 and r < want_r then wait = math.max(wait, (want_r - r) * 60 / rpm) end
+  if tpm > 0 and t < want_t then wait = math.max(wait, (want_t - t) * 60 / tpm) end
+end
+if wait == 0 then
+  r = r - want_r
+  t = t - want_t
+end
+redis.call('HSET', KEYS[1], 'r', r, 't', t, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 120)
+return {tostring(wait), tostring(r), tostring(t)}
+"""
+
+
+class RedisBuckets:
+    """Token buckets in Redis, shared by every process using the same server."""
+
+    def __init__(self, url: str, prefix: str = "rate_limit"):
+        """Connect to Redis at `url`; bucket keys start with `prefix`."""
+        import redis
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+        self.prefix = prefix
+
+    def take(
+        self, model: str, limit: ModelLimit, requests: float, tokens: float, force: bool = False
+    ) -> BucketState:
+        """Take `requests` and `tokens` if the bucket holds them; `force` takes them anyway."""
+        wait, left_requests, left_tokens = self._take(
+            keys=[f"{self.prefix}:{model}"],
+            args=[limit.rpm, limit.tpm, requests, tokens, "1" if force else "0"],
+        )
+        return BucketState(float(wait), float(left_requests), float(left_tokens))
+
+
+class RateLimiter:
+    """Make callers of a model wait until its quota allows another call.
+
+    Callers of one model queue first in first out: only the head of the queue
+    draws from the bucket, so a burst of small calls cannot starve a large one.
+    Token counts are estimated up front and corrected with `settle` once the
+    real usage is known.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, ModelLimit],
+        shared: RedisBuckets | None = None,
+    ):
+        """Enforce `limits`, in Redis if `shared` is given, else in this process."""
+        self.limits = limits
+        self._shared = shared
+        self._local = LocalBuckets()
+        self._lock = threading.Lock()
+        self._queues: dict[str, deque[asyncio.Future]] = {}
+        self._levels: dict[str, BucketState] = {}
+        self._waited = 0.0
+        self._acquired = 0
+
+    def limit_for(self, model: str) -> ModelLimit:
+        """Return the quota of `model`, falling back to the "*" entry."""
+        return self.limits.get(model) or self.limits.get("*") or ModelLimit()
+
+    def _take(
+        self, model: str, limit: ModelLimit, requests: float, tokens: float, force: bool = False
+    ) -> BucketState:
+        if self._shared is not None:
+            try:
+                state = self._shared.take(model, limit, requests, tokens, force)
+            except Exception:
+                logger.warning(
+                    "Shared rate limiter unavailable; limiting %s in this process",
+                    model,
+                    exc_info=True,
+                )
+            else:
+                self._record(model, limit, state)
+                return state
+        state = self._local.take(model, limit, requests, tokens, force)
+        self._record(model, limit, state)
+        return state
+
+    def _record(self, model: str, limit: ModelLimit, state: BucketState) -> None:
+        with self._lock:
+            self._levels[model] = state
+        for kind, capacity, left in (
+            ("requests", limit.rpm, state.requests),
+            ("tokens", limit.tpm, state.tokens),
+        ):
+            if capacity > 0:
+                metrics.set(
+                    "agent_rate_limit_utilization",
+                    min(1.0, max(0.0, 1 - left / capacity)),
+                    labels={"model": model, "kind": kind},
+                    help_text="Share of a model's per-minute quota currently used.",
+                )
+
+    def _wake_head(self, queue: deque) -> None:
+        if queue and not queue[0].done():
+            head = queue[0]
+            head.get_loop().call_soon_threadsafe(
+                lambda: head.done() or head.set_result(None)
+            )
+
+    def saturated(self, model: str) -> bool:
+        """Whether a call to `model` would have to wait, as of the last call to it."""
+        limit = self.limit_for(model)
+        if limit.unlimited:
+            return False
+        with self._lock:
+            if self._queues.get(model):
+                return True
+            state = self._levels.get(model)
+        if state is None:
+            return False
+        return (limit.rpm > 0 and state.requests < 1) or (limit.tpm > 0 and state.tokens <= 0)
+
+    async def acquire(self, model: str, tokens: int = 0) -> float:
+        """Wait until `model` may be called with about `tokens` tokens.
+
+        Returns:
+            The seconds spent waiting
+        """
+        limit = self.limit_for(model)
+        if limit.unlimited:
+            return 0.0
+        # A call larger than the whole bucket could never go through otherwise
+        if limit.tpm > 0:
+            tokens = min(tokens, limit.tpm)
+        started = time.monotonic()
+        turn = asyncio.get_running_loop().create_future()
+        with self._lock:
+            queue = self._queues.setdefault(model, deque())
+            queue.append(turn)
+            if queue[0] is turn:
+                turn.set_result(None)
+        try:
+            await turn
+            while True:
+                if self._shared is not None:
+                    state = await asyncio.to_thread(self._take, model, limit, 1, tokens)
+                else:
+                    state = self._take(model, limit, 1, tokens)
+                if state.wait <= 0:
+                    break
+                await asyncio.sleep(min(state.wait, MAX_POLL_SECONDS))
+        finally:
+            with self._lock:
+                queue.remove(turn)
+                self._wake_head(queue)
+        waited = time.monotonic() - started
+        with self._lock:
+            self._acquired += 1
+            self._waited += waited
+        metrics.observe(
+            "agent_rate_limit_wait_seconds",
+            waited,
+            labels={"model": model},
+            help_text="Time calls waited for their model's rate limit.",
+        )
+        return waited
+
+    def settle(self, model: str, estimated: int, actual: int | None) -> None:
+        """Charge the difference between the estimated and the reported token usage."""
+        limit = self.limit_for(model)
+        if limit.tpm <= 0 or actual is None or actual == estimated:
+            return
+        try:
+            self._take(model, limit, 0, actual - estimated, force=True)
+        except Exception:
+            logger.warning("Settling rate limit tokens failed", exc_info=True)
+
+    def stats(self) -> dict:
+        """Per-model utilization plus queue lengths and wait totals."""
+        with self._lock:
+            levels = dict(self._levels)
+            queued = {model: len(queue) for model, queue in self._queues.items() if queue}
+            acquired, waited = self._acquired, self._waited
+        models = {}
+        for model, state in levels.items():
+            limit = self.limit_for(model)
+            models[model] = {
+                "rpm": limit.rpm,
+                "tpm": limit.tpm,
+                "requests_utilization": round(min(1.0, max(0.0, 1 - state.requests / limit.rpm)), 3)
+                if limit.rpm > 0
+                else None,
+                "tokens_utilization": round(min(1.0, max(0.0, 1 - state.tokens / limit.tpm)), 3)
+                if limit.tpm > 0
+                else None,
+                "queued": queued.get(model, 0),
+            }
+        return {
+            "backend": "redis" if self._shared is not None else "local",
+            "acquired": acquired,
+            "avg_wait_ms": int(waited / acquired * 1000) if acquired else 0,
+            "models": models,
+        }
+
+
+def _build_limiter() -> RateLimiter:
+    limits = parse_limits(os.getenv("GEMINI_RATE_LIMITS"))
+    shared = None
+    redis_url = os.getenv("REDIS_URI")
+    if limits and redis_url:
+        try:
+            shared = RedisBuckets(redis_url)
+        except ImportError:
+            logger.warning("redis is not installed; rate limits are enforced per process")
+    return RateLimiter(limits, shared)
+
+
+rate_limiter = _build_limiter()
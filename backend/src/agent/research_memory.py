@@ -0,0 +1,246 @@
+"""Persistent full-text index of grounded research notes, shared across threads.
+
+Comics often revisit the same people, places and eras. Every note a live
+web_research search produces is stored with its query, language and the
+entities it mentions, in a SQLite FTS5 index. Before fanning out searches, the
+graph looks each query up here and uses a fresh enough note instead of searching
+again.
+
+A note answers a query when their query tokens are similar enough, or when the
+query's named entities all appear in the note and the queries still overlap
+somewhat. Notes expire after `max_age` seconds, and after a much shorter
+`volatile_max_age` for queries about current events. The index is kept under a
+byte cap by dropping the least recently used notes.
+
+The memory is off unless `research_memory_path` is set. Notes are not scoped to
+a thread or user: research done for one user's topic is served to everyone
+using the same file, so only enable it where that is acceptable.
+"""
+
+import datetime
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from agent.instrumentation import metrics
+from agent.query_dedup import normalize_query, query_tokens, token_set_similarity
+from agent.utils import extract_entities
+
+logger = logging.getLogger(__name__)
+
+# Entities kept per note; long notes mention many names in passing
+MAX_NOTE_ENTITIES = 40
+# Candidates ranked by FTS5 before the similarity check
+CANDIDATES = 20
+
+_TIME_SENSITIVE_RE = re.compile(
+    r"\b(?:latest|today|tonight|yesterday|current|currently|recent|recently|news|now|"
+    r"this (?:week|month|year)|upcoming)\b"
+    r"|最新|今天|今日|昨天|近期|最近|目前|现在|本周|本月|今年|新闻",
+    re.IGNORECASE,
+)
+
+
+def is_time_sensitive(query: str) -> bool:
+    """Whether `query` asks about current events, whose answers go stale quickly."""
+    year = datetime.date.today().year
+    return bool(_TIME_SENSITIVE_RE.search(query)) or any(
+        str(y) in query for y in (year - 1, year, year + 1)
+    )
+
+
+@dataclass(frozen=True)
+class MemoryHit:
+    """A stored note that answers a query."""
+
+    query: str
+    note: str
+    age_seconds: float
+    similarity: float
+
+
+class ResearchMemory:
+    """Research notes in one SQLite file, shared by every process on the host."""
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024**2):
+        """Open (or create) the notes database at `path`, keeping at most `max_bytes` of notes."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS notes (
+                    id INTEGER PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    query_key TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    entities TEXT NOT NULL,
+                    note TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    used_at REAL NOT NULL,
+                    UNIQUE (language, query_key)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS notes_used ON notes (used_at)")
+            # Terms are pre-tokenized (words, CJK bigrams) so that the default
+            # tokenizer matches Chinese as well as English queries.
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(terms)"
+            )
+
+    @staticmethod
+    def _entity_keys(entities) -> set[str]:
+        return {normalize_query(entity) for entity in entities} - {""}
+
+    @staticmethod
+    def _match_expression(terms) -> str:
+        return " OR ".join('"' + term.replace('"', '""') + '"' for term in sorted(terms))
+
+    def add(self, query: str, note: str, language: str) -> None:
+        """Store the note a live search returned for `query`, replacing an older one."""
+        if not note.strip():
+            return
+        now = time.time()
+        entities = sorted(
+            self._entity_keys(extract_entities(query))
+            | set(sorted(self._entity_keys(extract_entities(note)))[:MAX_NOTE_ENTITIES])
+        )
+        terms = set(query_tokens(query))
+        for entity in entities:
+            terms.update(query_tokens(entity))
+        size = len(note.encode("utf-8"))
+        with self._lock, self._conn:
+            (note_id,) = self._conn.execute(
+                """
+                INSERT INTO notes
+                    (query, query_key, language, entities, note, size, created_at, used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (language, query_key) DO UPDATE SET
+                    query = excluded.query,
+                    entities = excluded.entities,
+                    note = excluded.note,
+                    size = excluded.size,
+                    created_at = excluded.created_at,
+                    used_at = excluded.used_at
+                RETURNING id
+                """,
+                (
+                    query,
+                    normalize_query(query),
+                    language,
+                    json.dumps(entities, ensure_ascii=False),
+                    note,
+                    size,
+                    now,
+                    now,
+                ),
+            ).fetchone()
+            self._conn.execute("DELETE FROM notes_fts WHERE rowid = ?", (note_id,))
+            self._conn.execute(
+                "INSERT INTO notes_fts (rowid, terms) VALUES (?, ?)",
+                (note_id, " ".join(sorted(terms))),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM notes").fetchone()
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for note_id, size in self._conn.execute("SELECT id, size FROM notes ORDER BY used_at"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((note_id,))
+            total -= size
+        self._conn.executemany("DELETE FROM notes WHERE id = ?", doomed)
+        self._conn.executemany("DELETE FROM notes_fts WHERE rowid = ?", doomed)
+
+    def lookup(
+        self,
+        query: str,
+        language: str,
+        threshold: float,
+        max_age: float,
+        volatile_max_age: float,
+    ) -> MemoryHit | None:
+        """Return the best fresh note answering `query`, or None."""
+        tokens = query_tokens(query)
+        if not tokens:
+            return None
+        entities = self._entity_keys(extract_entities(query))
+        now = time.time()
+        oldest = now - (volatile_max_age if is_time_sensitive(query) else max_age)
+        terms = set(tokens)
+        for entity in entities:
+            terms.update(query_tokens(entity))
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT notes.id, notes.query, notes.entities, notes.note, notes.created_at
+                FROM notes_fts JOIN notes ON notes.id = notes_fts.rowid
+                WHERE notes_fts MATCH ? AND notes.language = ?
+                ORDER BY bm25(notes_fts)
+                LIMIT ?
+                """,
+                (self._match_expression(terms), language, CANDIDATES),
+            ).fetchall()
+        best = None
+        stale = False
+        for note_id, stored_query, stored_entities, note, created_at in rows:
+            similarity = token_set_similarity(tokens, query_tokens(stored_query))
+            about_same_entities = bool(entities) and entities <= set(json.loads(stored_entities))
+            if not (
+                similarity >= threshold or (about_same_entities and similarity >= threshold / 2)
+            ):
+                continue
+            if created_at < oldest:
+                stale = True
+                continue
+            if best is None or similarity > best[1]:
+                best = (note_id, similarity, stored_query, note, created_at)
+        outcome = "hit" if best is not None else "stale" if stale else "miss"
+        metrics.inc(
+            "agent_research_memory_lookups_total",
+            labels={"outcome": outcome},
+            help_text="Research memory lookups before searching, by outcome.",
+        )
+        if best is None:
+            return None
+        note_id, similarity, stored_query, note, created_at = best
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE notes SET used_at = ? WHERE id = ?", (now, note_id))
+        logger.debug("Research memory answered %r with the note for %r", query, stored_query)
+        return MemoryHit(stored_query, note, now - created_at, round(similarity, 3))
+
+    def stats(self) -> dict:
+        """Return the number and total size of the stored notes."""
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM notes"
+            ).fetchone()
+        return {"notes": count, "bytes": size, "max_bytes": self.max_bytes}
+
+
+_memories: dict[str, ResearchMemory] = {}
+_memories_lock = threading.Lock()
+
+
+def get_research_memory(path: str, max_bytes: int) -> ResearchMemory | None:
+    """Return the shared research memory at `path`; an empty path disables it."""
+    if not path:
+        return None
+    with _memories_lock:
+        memory = _memories.get(path)
+        if memory is None:
+            memory = _memories[path] = ResearchMemory(path, max_bytes)
+        memory.max_bytes = max_bytes
+        return memory
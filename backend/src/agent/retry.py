@@ -0,0 +1,353 @@
+"""Retries, circuit breakers and retry budgets for upstream model calls."""
+
+import asyncio
+import email.utils
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+
+from agent.instrumentation import metrics, record_retry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upstream statuses worth another attempt; other 4xx (bad request, no access to
+# the model, unknown model) will fail the same way again.
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+_RETRY_DELAY_RE = re.compile(r"^(\d+(?:\.\d+)?)s$")
+
+
+@dataclass(frozen=True)
+class RetryDecision:
+    """How an upstream failure should be handled."""
+
+    retryable: bool
+    reason: str
+    retry_after: float | None = None
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        """Report that `name` may be called again in `retry_after` seconds."""
+        super().__init__(f"{name} is failing; retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class NoImageError(RuntimeError):
+    """The image model answered without an image.
+
+    Safety blocks are final; other empty answers (e.g. the model replied with text
+    only) are worth another attempt.
+    """
+
+    def __init__(self, detail: dict, retryable: bool):
+        """Wrap the `detail` of the empty answer and whether asking again may help."""
+        super().__init__(detail.get("error", "No image content returned"))
+        self.detail = detail
+        self.retryable = retryable
+
+
+def _retry_after(error: BaseException) -> float | None:
+    """Read a Retry-After header or a google.rpc.RetryInfo delay from an API error."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                parsed = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                parsed = None
+            if parsed is not None:
+                return max(0.0, parsed.timestamp() - time.time())
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details)
+        details = details.get("details") if isinstance(details, dict) else None
+    for detail in details if isinstance(details, list) else []:
+        if isinstance(detail, dict) and "retryDelay" in detail:
+            match = _RETRY_DELAY_RE.match(str(detail["retryDelay"]))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+def classify_error(error: BaseException) -> RetryDecision:
+    """Decide whether `error` from a Gemini call is transient.
+
+    Wrapped errors (e.g. langchain's model errors raised `from` the google-genai
+    error) are classified by the first HTTP status found along the cause chain.
+    Unknown errors are treated as transient.
+    """
+    if isinstance(error, CircuitOpenError):
+        return RetryDecision(False, "circuit_open", error.retry_after)
+    if isinstance(error, NoImageError):
+        return RetryDecision(error.retryable, "no_image" if error.retryable else "safety")
+    seen: BaseException | None = error
+    while seen is not None:
+        code = getattr(seen, "code", None)
+        if code is None:
+            code = getattr(getattr(seen, "response", None), "status_code", None)
+        if isinstance(code, int) and 400 <= code < 600:
+            if code in RETRYABLE_STATUS:
+                return RetryDecision(True, f"http_{code}", _retry_after(seen))
+            return RetryDecision(False, f"http_{code}")
+        if isinstance(seen, (asyncio.TimeoutError, OSError, httpx.TransportError)):
+            return RetryDecision(True, "network")
+        seen = seen.__cause__ or seen.__context__
+    return RetryDecision(True, "unknown")
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after consecutive transient failures.
+
+    After `failure_threshold` failures in a row the circuit opens and calls fail
+    fast with `CircuitOpenError` for `reset_timeout` seconds. Then a single probe
+    is let through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """Create a closed breaker for the upstream `name`."""
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        """One of "closed", "open" or "half_open"."""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        """Raise `CircuitOpenError` unless a call may go through now."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.reset_timeout:
+                raise CircuitOpenError(self.name, self.reset_timeout - elapsed)
+            if self._probing:
+                raise CircuitOpenError(self.name, 1.0)
+            self._probing = True
+
+    def release(self) -> None:
+        """Give up a half-open probe that says nothing about the upstream's health.
+
+        E.g. a cancelled call, or a bad request or safety block.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+        self._export()
+
+    def record_failure(self) -> None:
+        """Count a transient failure, opening the circuit at the threshold or on a failed probe."""
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(
+                        "Circuit for %s opened after %s failures", self.name, self._failures
+                    )
+                self._opened_at = time.monotonic()
+                self._probing = False
+        self._export()
+
+    def _export(self) -> None:
+        metrics.set(
+            "agent_circuit_open",
+            0 if self._opened_at is None else 1,
+            labels={"upstream": self.name},
+            help_text="1 while the circuit breaker of an upstream is open.",
+        )
+
+
+class RetryBudget:
+    """Cap retries at a fraction of first attempts.
+
+    Every first attempt deposits `ratio` tokens and every retry withdraws one, with
+    `min_per_second` tokens trickling in so that low traffic can still retry. When
+    an upstream fails hard, retries stop instead of multiplying the load on it.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, capacity: float = 10.0):
+        """Create a budget that starts full, holding at most `capacity` tokens."""
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._balance = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._balance = min(
+            self.capacity, self._balance + (now - self._updated) * self.min_per_second
+        )
+        self._updated = now
+
+    def record_request(self) -> None:
+        """Deposit `ratio` tokens for a first attempt."""
+        with self._lock:
+            self._refill()
+            self._balance = min(self.capacity, self._balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Take one retry token; False when the budget is exhausted."""
+        with self._lock:
+            self._refill()
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with full jitter, honoring server-provided retry delays.
+
+    A Retry-After longer than `max_delay` is not waited out: the error is raised so
+    the caller is not held (and no scheduler slot is tied up) for that long.
+    """
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    multiplier: float = 2.0
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float | None:
+        """Seconds to wait before retry number `attempt + 1`, or None to give up."""
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        ceiling = min(self.max_delay, self.base_delay * self.multiplier**attempt)
+        return random.uniform(0, ceiling)
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        *,
+        scope: str | None = None,
+        breaker: CircuitBreaker | None = None,
+        budget: RetryBudget | None = None,
+        classify: Callable[[BaseException], RetryDecision] = classify_error,
+    ) -> T:
+        """Await `call()` until it succeeds, fails for good or retries run out.
+
+        Args:
+            call: Makes one attempt; called again for every retry
+            scope: Name used for retry metrics; defaults to the running graph node
+            breaker: Optional circuit breaker of the upstream
+            budget: Optional retry budget shared by callers of the upstream
+            classify: Maps an exception to a `RetryDecision`
+
+        Returns:
+            The result of the first successful attempt
+        """
+        if budget is not None:
+            budget.record_request()
+        for attempt in range(self.max_attempts):
+            if breaker is not None:
+                breaker.before_call()
+            try:
+                result = await call()
+            except asyncio.CancelledError:
+                if breaker is not None:
+                    breaker.release()
+                raise
+            except Exception as exc:
+                decision = classify(exc)
+                if breaker is not None:
+                    # Only transient failures say the upstream is unhealthy; other
+                    # errors (a 400, a safety block) do not say it is healthy either
+                    if decision.retryable:
+                        breaker.record_failure()
+                    else:
+                        breaker.release()
+                if not decision.retryable or attempt + 1 >= self.max_attempts:
+                    raise
+                delay = self.backoff(attempt, decision.retry_after)
+                if delay is None or (budget is not None and not budget.try_spend()):
+                    raise
+                logger.info(
+                    "%s attempt %s failed (%s); retrying in %.2fs",
+                    scope or (breaker.name if breaker is not None else "call"),
+                    attempt + 1,
+                    decision.reason,
+                    delay,
+                )
+                record_retry(scope=scope)
+                await asyncio.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
+        raise AssertionError("unreachable")  # pragma: no cover
+
+
+_lock = threading.Lock()
+_breakers: dict[str, CircuitBreaker] = {}
+_budgets: dict[str, RetryBudget] = {}
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker of an upstream (e.g. a model name)."""
+    with _lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def get_retry_budget(name: str) -> RetryBudget:
+    """Return the process-wide retry budget of an upstream."""
+    with _lock:
+        budget = _budgets.get(name)
+        if budget is None:
+            budget = _budgets[name] = RetryBudget()
+        return budget
+
+
+async def call_with_retry(
+    name: str,
+    call: Callable[[], Awaitable[T]],
+    *,
+    scope: str | None = None,
+    policy: RetryPolicy | None = None,
+    classify: Callable[[BaseException], RetryDecision] = classify_error,
+) -> T:
+    """Run `call` under `policy` with the shared breaker and budget of upstream `name`."""
+    return await (policy or DEFAULT_POLICY).run(
+        call,
+        scope=scope,
+        breaker=get_circuit_breaker(name),
+        budget=get_retry_budget(name),
+        classify=classify,
+    )
+
+
+DEFAULT_POLICY = RetryPolicy()
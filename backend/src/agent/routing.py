@@ -0,0 +1,238 @@
+"""Pick a model tier per node from how complex the request looks.
+
+A one-line gag strip does not need the strong model to write its storyboard, and
+a dense historical topic should not be reflected on by the fastest one. Every
+routed node scores the request on a few cheap features, maps the score to a tier
+(`fast`, `balanced`, `strong`) within the range allowed for that node, and falls
+back to faster tiers when the chosen model is slow, rate-limited or failing.
+
+Each decision is logged as a `model_route` JSON line with the features, score,
+model and latency, and attached to the node's `node_metrics` entry, so the
+thresholds can be tuned from real traffic.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, TypeVar
+
+from agent.configuration import Configuration
+from agent.fact_sheet import estimate_tokens
+from agent.instrumentation import metrics, record_route
+from agent.rate_limit import rate_limiter
+from agent.retry import classify_error, get_circuit_breaker
+from agent.stragglers import get_latency_tracker
+from agent.utils import extract_entities
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+TIERS = ("fast", "balanced", "strong")
+# The tiers each node may be routed to; fallbacks may go below the floor
+NODE_TIERS = {
+    "generate_query": ("fast", "balanced"),
+    "reflection": ("fast", "strong"),
+    "finalize_answer": ("fast", "strong"),
+    "revise_storyboard": ("fast", "strong"),
+}
+# Weights of the complexity features; each feature is scaled to [0, 1]
+WEIGHTS = {"topic": 0.3, "entities": 0.25, "pages": 0.25, "loops": 0.2}
+# Upstream failures that mean "use another model" rather than "try again"
+UNAVAILABLE_REASONS = frozenset({"http_429", "http_503", "circuit_open"})
+
+_PAGES_RE = re.compile(
+    r"(\d{1,3})\s*(?:pages?|panels?|frames?|页|頁|格|幅|张|張|コマ)", re.IGNORECASE
+)
+
+
+@dataclass(frozen=True)
+class Features:
+    """What a routing decision is based on."""
+
+    topic_tokens: int
+    entities: int
+    pages: int | None
+    loops: int
+    max_loops: int
+
+
+def extract_features(
+    topic: str, latest_message: str, loops: int = 0, max_loops: int = 0
+) -> Features:
+    """Score inputs for a request: its topic, the latest user message and research loops."""
+    match = _PAGES_RE.search(latest_message)
+    return Features(
+        topic_tokens=estimate_tokens(topic),
+        entities=len(extract_entities(topic)),
+        pages=int(match.group(1)) if match else None,
+        loops=loops,
+        max_loops=max_loops,
+    )
+
+
+def complexity(features: Features) -> float:
+    """Complexity of a request in [0, 1]."""
+    scaled = {
+        "topic": min(1.0, features.topic_tokens / 400),
+        "entities": min(1.0, features.entities / 8),
+        # Without a requested page count, assume a short strip of a few pages
+        "pages": min(1.0, (features.pages if features.pages is not None else 4) / 12),
+        "loops": min(1.0, features.loops / features.max_loops) if features.max_loops else 0.0,
+    }
+    return round(sum(WEIGHTS[name] * value for name, value in scaled.items()), 3)
+
+
+@dataclass
+class RouteDecision:
+    """The model a node should call, and faster ones to fall back to."""
+
+    node: str
+    tier: str
+    score: float
+    models: list[str]
+    features: Features
+    reason: str = "score"
+    attempts: list[dict] = field(default_factory=list)
+
+    @property
+    def model(self) -> str:
+        """The first model to try."""
+        return self.models[0]
+
+
+def _tier_models(configurable: Configuration) -> dict[str, str]:
+    return {
+        "fast": configurable.fast_model,
+        "balanced": configurable.balanced_model,
+        "strong": configurable.strong_model,
+    }
+
+
+def _unavailable(node: str, model: str, configurable: Configuration) -> str | None:
+    """Why `model` should be skipped right now, or None if it is fine to call."""
+    if get_circuit_breaker(model).state == "open":
+        return "circuit_open"
+    if rate_limiter.saturated(model):
+        return "rate_limited"
+    slow = configurable.routing_slow_seconds
+    median = get_latency_tracker(f"{node}:{model}").quantile(0.5)
+    if slow and median is not None and median > slow:
+        return "slow"
+    return None
+
+
+def route(node: str, configurable: Configuration, features: Features) -> RouteDecision:
+    """Choose the tier and model for `node`, plus the faster models to fall back to."""
+    score = complexity(features)
+    if score >= configurable.routing_strong_threshold:
+        tier = "strong"
+    elif score >= configurable.routing_balanced_threshold:
+        tier = "balanced"
+    else:
+        tier = "fast"
+    low, high = NODE_TIERS.get(node, ("fast", "strong"))
+    index = min(max(TIERS.index(tier), TIERS.index(low)), TIERS.index(high))
+    models_by_tier = _tier_models(configurable)
+    candidates = []
+    for name in reversed(TIERS[: index + 1]):
+        if models_by_tier[name] not in candidates:
+            candidates.append(models_by_tier[name])
+    decision = RouteDecision(node, TIERS[index], score, candidates, features)
+    # Start lower when the chosen model is known to be slow or throttled now
+    while len(decision.models) > 1:
+        reason = _unavailable(node, decision.model, configurable)
+        if reason is None:
+            break
+        decision.attempts.append({"model": decision.models.pop(0), "outcome": f"skipped_{reason}"})
+        decision.reason = reason
+    return decision
+
+
+async def call_routed(
+    decision: RouteDecision,
+    configurable: Configuration,
+    call: Callable[[str], Awaitable[T]],
+    *,
+    timeout: float | None = None,
+    can_fall_back: Callable[[], bool] = lambda: True,
+) -> T:
+    """Run `call(model)` on the decision's model, falling back to faster ones.
+
+    A fallback happens when the model is rate-limited or unavailable after its
+    retries, or did not answer within `timeout` (None waits as long as it takes).
+    `can_fall_back` returning False, e.g. once part of a streamed answer was
+    produced, makes a failure final and lets a call past `timeout` run to the end
+    instead of being cancelled and paid for twice.
+    """
+    models = list(decision.models)
+    for position, model in enumerate(models):
+        last = position == len(models) - 1
+        started = time.monotonic()
+        task = asyncio.ensure_future(call(model))
+        try:
+            if timeout and not last:
+                done, _ = await asyncio.wait({task}, timeout=timeout)
+                if not done and can_fall_back():
+                    task.cancel()
+                    _attempt(decision, model, started, "timeout")
+                    continue
+            result = await task
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        except Exception as exc:
+            reason = classify_error(exc).reason
+            outcome = "unavailable" if reason in UNAVAILABLE_REASONS else "error"
+            _attempt(decision, model, started, outcome, reason)
+            if last or outcome != "unavailable" or not can_fall_back():
+                _log(decision)
+                raise
+            continue
+        latency = _attempt(decision, model, started, "ok")
+        get_latency_tracker(f"{decision.node}:{model}").observe(latency)
+        _log(decision)
+        return result
+    raise AssertionError("unreachable")  # pragma: no cover
+
+
+def _attempt(
+    decision: RouteDecision, model: str, started: float, outcome: str, error: str = ""
+) -> float:
+    latency = time.monotonic() - started
+    attempt = {"model": model, "outcome": outcome, "seconds": round(latency, 3)}
+    if error:
+        attempt["error"] = error
+    decision.attempts.append(attempt)
+    metrics.observe(
+        "agent_routed_call_seconds",
+        latency,
+        labels={"node": decision.node, "model": model, "outcome": outcome},
+        help_text="Latency of routed model calls per node, model and outcome.",
+    )
+    return latency
+
+
+def _log(decision: RouteDecision) -> None:
+    final = decision.attempts[-1] if decision.attempts else {}
+    entry = {
+        "node": decision.node,
+        "tier": decision.tier,
+        "score": decision.score,
+        "reason": decision.reason,
+        "features": asdict(decision.features),
+        "model": final.get("model"),
+        "outcome": final.get("outcome"),
+        "seconds": round(sum(a.get("seconds", 0) for a in decision.attempts), 3),
+        "attempts": decision.attempts,
+    }
+    metrics.inc(
+        "agent_route_decisions_total",
+        labels={"node": decision.node, "tier": decision.tier, "model": entry["model"] or ""},
+        help_text="Model routing decisions per node, chosen tier and model finally used.",
+    )
+    record_route(entry)
+    logger.info(json.dumps({"event": "model_route", **entry}, ensure_ascii=False))
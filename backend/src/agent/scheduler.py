@@ -0,0 +1,172 @@
+"""Fair scheduling of upstream model calls across users, threads and runs."""
+
+import asyncio
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+
+@dataclass
+class SlotTicket:
+    """Handle returned by `FairScheduler.slot` describing how long the caller queued."""
+
+    key: str
+    enqueued_at: float
+    granted_at: float | None = None
+
+    @property
+    def wait_seconds(self) -> float:
+        """Seconds spent queued for the slot, or 0.0 until it is granted."""
+        if self.granted_at is None:
+            return 0.0
+        return self.granted_at - self.enqueued_at
+
+
+@dataclass
+class _Waiter:
+    ticket: SlotTicket
+    future: asyncio.Future = field(repr=False)
+
+
+class FairScheduler:
+    """Bound the number of in-flight upstream calls and share free slots fairly.
+
+    Callers are grouped by a key (user, thread or run). When every slot is busy the
+    caller is queued behind other callers with the same key, and free slots are
+    handed out round-robin across keys, so one key with many queued calls cannot
+    starve a key that only needs one.
+    """
+
+    def __init__(self, max_concurrency: int, max_per_key: int | None = None):
+        """Create a scheduler.
+
+        Args:
+            max_concurrency: Maximum number of calls in flight across all keys.
+            max_per_key: Maximum number of calls in flight for one key. Defaults to
+                `max_concurrency`.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.max_per_key = max_per_key or max_concurrency
+        self._in_flight = 0
+        self._in_flight_by_key: Counter[str] = Counter()
+        # Insertion order doubles as the round-robin order of keys with waiters.
+        self._queues: OrderedDict[str, deque[_Waiter]] = OrderedDict()
+        # Per-key overrides of max_per_key, e.g. a run-specific concurrency limit.
+        self._key_limits: dict[str, int] = {}
+        self._granted = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _limit_for(self, key: str) -> int:
+        return self._key_limits.get(key, self.max_per_key)
+
+    def _has_capacity(self, key: str) -> bool:
+        return (
+            self._in_flight < self.max_concurrency
+            and self._in_flight_by_key[key] < self._limit_for(key)
+        )
+
+    def _grant(self, ticket: SlotTicket) -> None:
+        ticket.granted_at = time.monotonic()
+        self._in_flight += 1
+        self._in_flight_by_key[ticket.key] += 1
+        self._granted += 1
+        wait = ticket.wait_seconds
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+
+    def _release(self, key: str) -> None:
+        self._in_flight -= 1
+        self._in_flight_by_key[key] -= 1
+        if self._in_flight_by_key[key] <= 0:
+            del self._in_flight_by_key[key]
+            if key not in self._queues:
+                self._key_limits.pop(key, None)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to queued waiters, one key at a time."""
+        while self._in_flight < self.max_concurrency and self._queues:
+            granted = False
+            for key in list(self._queues):
+                if self._in_flight >= self.max_concurrency:
+                    break
+                if self._in_flight_by_key[key] >= self._limit_for(key):
+                    continue
+                queue = self._queues.pop(key)
+                waiter = queue.popleft()
+                if queue:
+                    # Re-insert at the end so the next free slot goes to another key.
+                    self._queues[key] = queue
+                granted = True
+                if waiter.future.done():
+                    continue
+                self._grant(waiter.ticket)
+                waiter.future.set_result(None)
+            if not granted:
+                break
+
+    def _remove_waiter(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.ticket.key)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue:
+            del self._queues[waiter.ticket.key]
+
+    @asynccontextmanager
+    async def slot(
+        self, key: str, key_limit: int | None = None
+    ) -> AsyncIterator[SlotTicket]:
+        """Wait for a free slot for `key` and hold it for the duration of the block.
+
+        Args:
+            key: Fairness group of the caller
+            key_limit: Optional cap on concurrent slots for this key, overriding
+                `max_per_key` (never above `max_concurrency`)
+        """
+        if key_limit:
+            self._key_limits[key] = key_limit
+        ticket = SlotTicket(key=key, enqueued_at=time.monotonic())
+        if not self._queues and self._has_capacity(key):
+            self._grant(ticket)
+        else:
+            waiter = _Waiter(ticket, asyncio.get_running_loop().create_future())
+            self._queues.setdefault(key, deque()).append(waiter)
+            self._dispatch()
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # The slot was granted right as we were cancelled; give it back.
+                    self._release(key)
+                else:
+                    self._remove_waiter(waiter)
+                    if key not in self._in_flight_by_key and key not in self._queues:
+                        self._key_limits.pop(key, None)
+                raise
+        try:
+            yield ticket
+        finally:
+            self._release(key)
+
+    def stats(self) -> dict:
+        """Return a snapshot of queue depth and wait times."""
+        queued_by_key = {key: len(queue) for key, queue in self._queues.items()}
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_per_key": self.max_per_key,
+            "in_flight": self._in_flight,
+            "queued": sum(queued_by_key.values()),
+            "queued_by_key": queued_by_key,
+            "granted_total": self._granted,
+            "avg_wait_seconds": self._total_wait / self._granted if self._granted else 0.0,
+            "max_wait_seconds": self._max_wait,
+        }
@@ -10,6 +10,17 @@ from typing_extensions import Annotated
 import operator
 
 
+def add_node_metrics(current: list, update: list) -> list:
+    """Append node metrics; the first node of a run starts the list over.
+
+    Keeps the checkpointed channel to the current run instead of growing with
+    every follow-up turn of the thread (see `instrument_node`).
+    """
+    if update and update[0].get("run_start"):
+        return list(update)
+    return (current or []) + list(update)
+
+
 class OverallState(TypedDict):
     messages: Annotated[list, add_messages]
     search_query: Annotated[list, operator.add]
@@ -20,6 +31,17 @@ class OverallState(TypedDict):
     research_loop_count: int
     reasoning_model: str
     language: str
+    run_id: str
+    number_of_skipped_queries: Annotated[int, operator.add]
+    node_metrics: Annotated[list, add_node_metrics]
+    fact_sheet: dict
+    compacted_results: int
+    run_started_at: float
+    aspect_ratio: str
+    image_size: str
+    edit_mode: bool
+    edit_page_ids: list[int]
+    changed_page_ids: list[int]
 
 
 class ReflectionState(TypedDict):
@@ -28,6 +50,9 @@ class ReflectionState(TypedDict):
     follow_up_queries: Annotated[list, operator.add]
     research_loop_count: int
     number_of_ran_queries: int
+    run_id: str
+    run_started_at: float
+    pending_queries: list[str]
 
 
 class Query(TypedDict):
@@ -37,11 +62,18 @@ class Query(TypedDict):
 
 class QueryGenerationState(TypedDict):
     search_query: list[Query]
+    run_id: str
+    run_started_at: float
+    pending_queries: list[str]
 
 
 class WebSearchState(TypedDict):
     search_query: str
     id: str
+    run_id: str
+    run_started_at: float
+    loop: int
+    fanout: int
 
 
 @dataclass(kw_only=True)
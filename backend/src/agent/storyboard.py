@@ -0,0 +1,152 @@
+"""Parsing and merging of the storyboard the answer model writes."""
+
+import json
+from typing import Any
+
+
+def content_text(content: Any) -> str:
+    """Flatten message content (a string or a list of content parts) to text."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+            if isinstance(part, (str, dict))
+        )
+    return ""
+
+
+class StoryboardStreamParser:
+    """Incrementally extract page objects from a streamed storyboard JSON array.
+
+    The answer model writes `[{"id": 1, "detail": "..."}, ...]`, possibly wrapped in a
+    markdown fence. Text is fed in as it arrives and every top-level object is
+    returned as soon as its closing brace is seen, so downstream work for page 1
+    can start while later pages are still being written.
+    """
+
+    def __init__(self) -> None:
+        """Start a parser that has not seen the opening bracket yet."""
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = -1
+
+    def feed(self, text: str) -> list[dict]:
+        """Consume the next chunk of model output and return newly completed pages."""
+        self._buffer += text
+        pages: list[dict] = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            ch = buffer[i]
+            if not self._in_array:
+                if ch == "[":
+                    self._in_array = True
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    page = self._parse_page(buffer[self._object_start : i + 1])
+                    if page is not None:
+                        pages.append(page)
+                    self._object_start = -1
+            i += 1
+        self._pos = i
+        # Keep only the unfinished object so the buffer does not grow with the answer.
+        if self._object_start >= 0:
+            self._buffer = buffer[self._object_start :]
+            self._pos -= self._object_start
+            self._object_start = 0
+        else:
+            self._buffer = ""
+            self._pos = 0
+        return pages
+
+    @staticmethod
+    def _parse_page(raw: str) -> dict | None:
+        try:
+            page = json.loads(raw)
+        except ValueError:
+            return None
+        if isinstance(page, dict) and "id" in page and "detail" in page:
+            return page
+        return None
+
+
+def _is_page(page: Any) -> bool:
+    return isinstance(page, dict) and "id" in page and "detail" in page
+
+
+def find_storyboard(messages: list) -> list[dict] | None:
+    """Return the pages of the most recent storyboard answer in `messages`, if any."""
+    for message in reversed(messages):
+        if getattr(message, "type", None) != "ai":
+            continue
+        content = message.content
+        if isinstance(content, str):
+            try:
+                content = json.loads(content)
+            except ValueError:
+                continue
+        if isinstance(content, list) and content and all(_is_page(p) for p in content):
+            return content
+    return None
+
+
+def _normalized(detail: Any) -> str:
+    return " ".join(str(detail).split())
+
+
+def merge_storyboard(
+    previous: list[dict],
+    revised: list[dict],
+    allowed_ids: set[int] | None = None,
+) -> tuple[list[dict], list[int]]:
+    """Apply revised pages to a storyboard.
+
+    `revised` holds only the pages the model rewrote or added; every other page is
+    kept as is. With `allowed_ids`, rewrites of other existing pages are ignored.
+
+    Returns the merged pages in page order and the ids of pages whose `detail`
+    actually changed (whitespace differences do not count).
+    """
+    pages: dict[int, dict] = {}
+    for page in previous:
+        try:
+            pages[int(page["id"])] = page
+        except (TypeError, ValueError):
+            continue
+    changed: list[int] = []
+    for page in revised:
+        if not _is_page(page):
+            continue
+        try:
+            page_id = int(page["id"])
+        except (TypeError, ValueError):
+            continue
+        current = pages.get(page_id)
+        if current is not None and allowed_ids is not None and page_id not in allowed_ids:
+            continue
+        if current is not None and _normalized(current["detail"]) == _normalized(page["detail"]):
+            continue
+        pages[page_id] = {"id": page_id, "detail": page["detail"]}
+        if page_id not in changed:
+            changed.append(page_id)
+    return [pages[page_id] for page_id in sorted(pages)], sorted(changed)
@@ -0,0 +1,297 @@
+"""Keep one slow grounded search from setting the latency of a research loop.
+
+Two tools, used by the web_research fan-out:
+
+- `hedged` issues a duplicate call when the first one has not answered after a
+  soft deadline and keeps whichever answers first.
+- `QuorumTracker` lets the branches of a fan-out wave stop waiting once enough
+  of them have finished. Searches still running are parked in the background and
+  their results are folded into the next reflection (or the answer).
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, TypeVar
+
+from agent.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Runs that have not touched their parked results for this long are forgotten,
+# e.g. when a run failed before reaching the answer.
+PARKED_MAX_AGE_SECONDS = 3600
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies of one upstream."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """Keep the last `window` latencies; quantiles need `min_samples` of them."""
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        """Record the latency of one call."""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        """Return the `q` quantile of the window, or None until `min_samples` are known."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_lock = threading.Lock()
+_trackers: dict[str, LatencyTracker] = {}
+
+
+def get_latency_tracker(name: str) -> LatencyTracker:
+    """Return the process-wide latency tracker of an upstream (e.g. a model name)."""
+    with _lock:
+        tracker = _trackers.get(name)
+        if tracker is None:
+            tracker = _trackers[name] = LatencyTracker()
+        return tracker
+
+
+async def hedged(
+    call: Callable[[], Awaitable[T]],
+    delay: float | None,
+    *,
+    name: str,
+    max_hedges: int = 1,
+    allow: Callable[[], bool] | None = None,
+) -> T:
+    """Await `call()`, starting another `call()` whenever `delay` passes without an answer.
+
+    The first successful answer wins and the calls still running are cancelled. A
+    failed call only fails the hedge when no other call is left running. Every
+    hedge is a paid request, so `allow` can cap them (e.g. with a retry budget).
+
+    Args:
+        call: Makes one request; called again for every hedge
+        delay: Soft deadline in seconds before a hedge is issued; None never hedges
+        name: Upstream name used for the hedging metrics
+        max_hedges: Duplicate calls issued at most
+        allow: Asked before each hedge; returning False stops hedging
+
+    Returns:
+        The result of the first call that succeeds
+    """
+    if delay is None or max_hedges < 1:
+        return await call()
+    first = asyncio.ensure_future(call())
+    pending = {first}
+    hedges = 0
+    error: BaseException | None = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=delay if hedges < max_hedges else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                if task.exception() is None:
+                    if hedges:
+                        metrics.inc(
+                            "agent_hedged_calls_total",
+                            labels={
+                                "upstream": name,
+                                "winner": "primary" if task is first else "hedge",
+                            },
+                            help_text="Calls that issued a hedge, by which request answered first.",
+                        )
+                    return task.result()
+                error = error or task.exception()
+            if not done:
+                if allow is not None and not allow():
+                    logger.info("%s has not answered after %.1fs; no budget to hedge", name, delay)
+                    hedges = max_hedges
+                    continue
+                hedges += 1
+                logger.info("%s has not answered after %.1fs; hedging", name, delay)
+                pending.add(asyncio.ensure_future(call()))
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+@dataclass
+class _Wave:
+    size: int
+    needed: int
+    finished: int = 0
+    left: int = 0
+    reached: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class QuorumTracker:
+    """Release the branches of a fan-out wave once `quorum` of them have finished.
+
+    A wave is identified by the run id and the research loop that sent it. The
+    work of a released branch keeps running; its result is parked until the next
+    `drain` for the run.
+    """
+
+    def __init__(self) -> None:
+        """Start with no waves and nothing parked."""
+        self._lock = threading.Lock()
+        self._waves: dict[tuple[str, int], _Wave] = {}
+        self._parked: dict[str, list[str]] = {}
+        self._running: dict[str, set[asyncio.Future]] = {}
+        self._touched: dict[str, float] = {}
+
+    @staticmethod
+    def needed(size: int, quorum: float) -> int:
+        """Branches of a wave of `size` that must finish before the rest are released."""
+        return min(size, max(1, math.ceil(quorum * size)))
+
+    def _join(self, run_id: str, wave: int, size: int, quorum: float) -> _Wave:
+        with self._lock:
+            state = self._waves.get((run_id, wave))
+            if state is None:
+                state = self._waves[(run_id, wave)] = _Wave(
+                    size=size, needed=self.needed(size, quorum), left=size
+                )
+            return state
+
+    def _leave(self, run_id: str, wave: int, state: _Wave, finished: bool) -> None:
+        with self._lock:
+            if finished:
+                state.finished += 1
+                if state.finished >= state.needed:
+                    state.reached.set()
+            state.left -= 1
+            if state.left <= 0:
+                self._waves.pop((run_id, wave), None)
+
+    def finished(self, run_id: str, wave: int, size: int, quorum: float) -> None:
+        """Count a branch that finished without work to wait for (e.g. a cache hit)."""
+        if self.needed(size, quorum) >= size:
+            return
+        self._leave(run_id, wave, self._join(run_id, wave, size, quorum), finished=True)
+
+    async def wait(
+        self,
+        run_id: str,
+        wave: int,
+        size: int,
+        quorum: float,
+        work: "asyncio.Future[str]",
+        timeout: float | None = None,
+    ) -> str | None:
+        """Await `work`, one branch of a wave of `size` branches.
+
+        Returns:
+            The result of `work`, or None when the quorum was reached first and
+            `work` was parked.
+
+        Raises:
+            asyncio.TimeoutError: `work` did not finish within `timeout`; it is
+                cancelled.
+        """
+        if self.needed(size, quorum) >= size:
+            return await asyncio.wait_for(work, timeout)
+        state = self._join(run_id, wave, size, quorum)
+        released = asyncio.ensure_future(state.reached.wait())
+        finished = False
+        try:
+            done, _ = await asyncio.wait(
+                {work, released}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if work in done:
+                finished = True
+                return work.result()
+            if not done:
+                work.cancel()
+                raise TimeoutError
+            self._park(run_id, work)
+            return None
+        except asyncio.CancelledError:
+            work.cancel()
+            raise
+        finally:
+            released.cancel()
+            self._leave(run_id, wave, state, finished)
+
+    def _park(self, run_id: str, work: "asyncio.Future[str]") -> None:
+        with self._lock:
+            self._prune()
+            self._touched[run_id] = time.monotonic()
+            self._running.setdefault(run_id, set()).add(work)
+        self._count("parked")
+
+        def collect(task: "asyncio.Future[str]") -> None:
+            with self._lock:
+                running = self._running.get(run_id)
+                if running is None or task not in running:
+                    return  # discarded with its run
+                running.discard(task)
+                if task.cancelled():
+                    return
+                if task.exception() is not None:
+                    logger.info("Parked search failed: %s", task.exception())
+                    self._count("failed")
+                    return
+                if task.result():
+                    self._parked.setdefault(run_id, []).append(task.result())
+
+        work.add_done_callback(collect)
+
+    def drain(self, run_id: str | None) -> list[str]:
+        """Take the parked results of a run that have arrived so far."""
+        if not run_id:
+            return []
+        with self._lock:
+            results = self._parked.pop(run_id, [])
+            if run_id in self._running:
+                self._touched[run_id] = time.monotonic()
+        if results:
+            self._count("folded", len(results))
+        return results
+
+    def discard(self, run_id: str | None) -> None:
+        """Cancel the parked work of a run that needs no more research."""
+        if not run_id:
+            return
+        with self._lock:
+            running = self._running.pop(run_id, set())
+            dropped = len(self._parked.pop(run_id, []))
+            self._touched.pop(run_id, None)
+        for task in running:
+            task.cancel()
+        if running or dropped:
+            self._count("dropped", len(running) + dropped)
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - PARKED_MAX_AGE_SECONDS
+        for run_id in [r for r, at in self._touched.items() if at < cutoff]:
+            for task in self._running.pop(run_id, set()):
+                task.cancel()
+            self._parked.pop(run_id, None)
+            self._touched.pop(run_id, None)
+
+    @staticmethod
+    def _count(outcome: str, value: int = 1) -> None:
+        metrics.inc(
+            "agent_search_stragglers_total",
+            value,
+            labels={"outcome": outcome},
+            help_text="Searches that missed their wave's quorum, by what became of their results.",
+        )
+
+
+search_quorum = QuorumTracker()
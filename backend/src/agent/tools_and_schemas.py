@@ -21,3 +21,26 @@ class Reflection(BaseModel):
     follow_up_queries: List[str] = Field(
         description="A list of follow-up queries to address the knowledge gap."
     )
+
+
+class FactEntry(BaseModel):
+    """Facts about one character, setting or object."""
+
+    name: str = Field(description="The character, setting or object the facts describe.")
+    facts: List[str] = Field(
+        description="Short, self-contained facts useful for drawing it (appearance, personality, era, look, ...)."
+    )
+
+
+class FactSheet(BaseModel):
+    """Facts extracted from the research, grouped by what they describe."""
+
+    characters: List[FactEntry] = Field(
+        description="Facts about each character: personality, appearance, clothing, speech style."
+    )
+    settings: List[FactEntry] = Field(
+        description="Facts about each setting: era, place, atmosphere, visual cues."
+    )
+    objects: List[FactEntry] = Field(
+        description="Facts about each object or term: what it is and how it looks."
+    )
@@ -1,19 +1,133 @@
+"""Helpers that turn the conversation into a research topic and find the entities it names."""
+
+import re
+import threading
+from collections import OrderedDict
 from typing import List
-from langchain_core.messages import AnyMessage, AIMessage, HumanMessage
 
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
+
+from agent.fact_sheet import estimate_tokens, truncate_to_tokens
+from agent.storyboard import content_text, find_storyboard
+
+# Each page of an earlier storyboard is reduced to its first sentence, cut to this
+# many tokens; the full pages never need to be in a search or reflection prompt.
+PAGE_TITLE_TOKENS = 24
+_SENTENCE_ENDS = "。！？.!?\n"
+
+_ENTITY_RE = re.compile(
+    r"\b[A-Z][\w'’-]+(?:\s+[A-Z][\w'’-]+)*"  # Capitalized names, "Neil Armstrong"
+    r"|[《「『“\"]([^》」』”\"]{1,30})[》」』”\"]"  # quoted or titled names
+)
+# Names listed in CJK text, e.g. 刘备、关羽和张飞
+_CJK_LIST_RE = re.compile(r"[一-鿿]{2,8}(?=[、，,和与及])")
+
+_lock = threading.Lock()
+_line_cache: "OrderedDict[str, str]" = OrderedDict()
+_topic_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_LINE_CACHE_SIZE = 4096
+_TOPIC_CACHE_SIZE = 256
+
+
+def _cached(cache: OrderedDict, key, size: int, build):
+    with _lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    value = build()
+    with _lock:
+        cache[key] = value
+        while len(cache) > size:
+            cache.popitem(last=False)
+    return value
+
+
+def _page_title(detail) -> str:
+    text = " ".join(str(detail).split())
+    cut = min((i for i in (text.find(c) for c in _SENTENCE_ENDS) if i >= 0), default=-1)
+    if cut >= 0:
+        text = text[: cut + 1]
+    title = truncate_to_tokens(text, PAGE_TITLE_TOKENS)
+    return title if title == text else title + "…"
+
+
+def _message_line(message: AnyMessage) -> str:
+    """One transcript line; storyboard answers are reduced to their page titles."""
+    if isinstance(message, HumanMessage):
+        return f"User: {content_text(message.content)}"
+    if isinstance(message, AIMessage):
+        pages = find_storyboard([message])
+        if pages is None:
+            return f"Assistant: {content_text(message.content)}"
+        titles = " / ".join(f"{page['id']}. {_page_title(page['detail'])}" for page in pages)
+        return f"Assistant: [storyboard, {len(pages)} pages] {titles}"
+    return ""
 
-def get_research_topic(messages: List[AnyMessage]) -> str:
+
+def _line(message: AnyMessage) -> str:
+    if message.id is None:
+        return _message_line(message)
+    return _cached(_line_cache, message.id, _LINE_CACHE_SIZE, lambda: _message_line(message))
+
+
+def _build_topic(messages: List[AnyMessage], max_tokens: int) -> str:
+    lines = [_line(message) for message in messages]
+    # Lines of other message types (e.g. tool calls) are empty and cost nothing
+    kept = {i for i, line in enumerate(lines) if not line} | {len(lines) - 1}
+    # The latest message is what to act on; the first user message usually names
+    # the subject. The rest is filled in newest first while the budget lasts.
+    first_user = next((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), None)
+    candidates = ([first_user] if first_user is not None else []) + list(
+        range(len(lines) - 2, -1, -1)
+    )
+    used = estimate_tokens(lines[-1])
+    for index in candidates:
+        if index in kept:
+            continue
+        cost = estimate_tokens(lines[index]) + 1
+        if used + cost <= max_tokens:
+            kept.add(index)
+            used += cost
+    parts = []
+    previous = -1
+    for index in sorted(kept):
+        if index != previous + 1:
+            parts.append("…")
+        if lines[index]:
+            parts.append(lines[index])
+        previous = index
+    return truncate_to_tokens("\n".join(parts), max_tokens)
+
+
+def get_research_topic(messages: List[AnyMessage], max_tokens: int | None = 2000) -> str:
     """
     Get the research topic from the messages.
+
+    A single message is used as is. Longer conversations become a `User:` /
+    `Assistant:` transcript in which earlier storyboards are reduced to page titles
+    and, to stay within `max_tokens` (None for no limit), the oldest turns are
+    dropped first; the first user message and the latest one are always kept.
+    Results are cached per thread (by message ids), since every node of a run asks
+    for the same topic.
     """
-    # check if request has a history and combine the messages into a single string
+    budget = max_tokens if max_tokens is not None else float("inf")
     if len(messages) == 1:
-        research_topic = messages[-1].content
-    else:
-        research_topic = ""
-        for message in messages:
-            if isinstance(message, HumanMessage):
-                research_topic += f"User: {message.content}\n"
-            elif isinstance(message, AIMessage):
-                research_topic += f"Assistant: {message.content}\n"
-    return research_topic
+        topic = content_text(messages[-1].content)
+        return topic if max_tokens is None else truncate_to_tokens(topic, max_tokens)
+    ids = tuple(message.id for message in messages)
+    if None in ids:
+        return _build_topic(messages, budget)
+    return _cached(
+        _topic_cache, (ids, max_tokens), _TOPIC_CACHE_SIZE, lambda: _build_topic(messages, budget)
+    )
+
+
+def extract_entities(text: str) -> set[str]:
+    """Named things in `text`: capitalized names, quoted titles and listed CJK names.
+
+    A cheap heuristic without a tagger; good enough to tell a topic about several
+    people and places from a one-line gag, or to key notes by who they are about.
+    """
+    entities = {m.group(1) or m.group(0) for m in _ENTITY_RE.finditer(text)}
+    entities.update(_CJK_LIST_RE.findall(text))
+    return entities
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# The image store and job queue are opened in IMAGE_CACHE_DIR on first use; keep
+# the tests away from the development store in backend/.image_cache.
+os.environ.setdefault("IMAGE_CACHE_DIR", tempfile.mkdtemp(prefix="nanocomic-tests-"))
+os.environ.setdefault("IMAGE_JOB_WORKERS", "0")
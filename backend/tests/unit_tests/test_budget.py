@@ -0,0 +1,91 @@
+from agent.budget import RunBudget
+from agent.configuration import Configuration
+
+STARTED = 1000.0
+
+
+def _entry(node, duration=1.0, tokens=(0, 0), calls=1, finished_at=STARTED + 1):
+    return {
+        "node": node,
+        "finished_at": finished_at,
+        "duration_seconds": duration,
+        "prompt_tokens": tokens[0],
+        "completion_tokens": tokens[1],
+        "model_calls": calls,
+    }
+
+
+def test_no_limits_never_exhausts():
+    status = RunBudget(STARTED).check([_entry("web_research")] * 50, now=STARTED + 10_000)
+    assert not status.exhausted
+    assert status.max_fanout is None
+
+
+def test_deadline_passed_exhausts():
+    budget = RunBudget(STARTED, deadline_seconds=60, finalize_reserve_seconds=20)
+    assert budget.research_deadline() == STARTED + 40
+    status = budget.check([], now=STARTED + 40)
+    assert status.exhausted
+    assert status.reason == "deadline"
+    assert status.max_fanout == 0
+
+
+def test_deadline_limits_fanout_by_search_waves():
+    budget = RunBudget(STARTED, deadline_seconds=100, searches_per_wave=3)
+    entries = [
+        _entry("web_research", duration=10),
+        _entry("web_research", duration=20),
+        _entry("reflection", duration=5),
+    ]
+    # 60s left, minus two 5s reflections, fits two 20s waves of three searches
+    status = budget.check(entries, now=STARTED + 40)
+    assert not status.exhausted
+    assert status.max_fanout == 6
+
+
+def test_token_budget_holds_back_the_finalize_reserve():
+    budget = RunBudget(STARTED, token_budget=10_000, finalize_reserve_tokens=4_000)
+    entries = [_entry("web_research", tokens=(800, 200)), _entry("reflection", tokens=(400, 100))]
+    # 10000 - 1500 spent - 4000 reserve = 4500; minus two reflections = 3500 -> 3 searches
+    status = budget.check(entries, now=STARTED)
+    assert status.max_fanout == 3
+
+    entries.append(_entry("web_research", tokens=(3_000, 1_000)))
+    status = budget.check(entries, now=STARTED)
+    assert status.exhausted
+    assert status.reason == "tokens"
+
+
+def test_call_budget_keeps_calls_for_reflection_and_answer():
+    budget = RunBudget(STARTED, call_budget=10)
+    status = budget.check([_entry("web_research")] * 5, now=STARTED)
+    assert status.max_fanout == 2
+    status = budget.check([_entry("web_research")] * 7, now=STARTED)
+    assert status.exhausted
+    assert status.reason == "calls"
+
+
+def test_entries_from_earlier_runs_are_not_counted():
+    budget = RunBudget(STARTED, call_budget=10)
+    old = [_entry("web_research", finished_at=STARTED - 1)] * 20
+    assert budget.check(old, now=STARTED).max_fanout == 7
+
+
+def test_tightest_limit_wins():
+    budget = RunBudget(STARTED, deadline_seconds=1000, token_budget=1_000_000, call_budget=6)
+    status = budget.check([_entry("web_research", duration=1, tokens=(10, 10))], now=STARTED)
+    assert status.max_fanout == 2
+
+
+def test_from_config_uses_run_settings():
+    configurable = Configuration(
+        run_deadline_seconds=120,
+        finalize_reserve_seconds=30,
+        run_token_budget=5000,
+        research_context_token_budget=1000,
+        max_concurrent_searches_per_run=2,
+    )
+    budget = RunBudget.from_config(configurable, started_at=STARTED)
+    assert budget.research_deadline() == STARTED + 90
+    assert budget.finalize_reserve_tokens == 2000
+    assert budget.searches_per_wave == 2
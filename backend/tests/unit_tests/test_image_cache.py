@@ -0,0 +1,117 @@
+import asyncio
+
+from agent.image_cache import ImageCache, image_cache_key
+
+
+def test_image_cache_key_ignores_prompt_whitespace_only():
+    key = image_cache_key("a  red\nkite", "3:4", "1K", True, "m")
+    assert key == image_cache_key("a red kite", "3:4", "1K", True, "m")
+    assert key != image_cache_key("a red kite", "4:3", "1K", True, "m")
+    assert key != image_cache_key("a red kite", "3:4", "1K", False, "m")
+
+
+def test_image_cache_stores_and_reloads(tmp_path):
+    cache = ImageCache(tmp_path, max_bytes=10_000)
+    stored = cache.put("k", [("image/png", b"png-bytes")])
+    assert [image.read_bytes() for image in cache.get("k")] == [b"png-bytes"]
+    assert cache.blob(stored[0].digest).mime_type == "image/png"
+
+    reloaded = ImageCache(tmp_path, max_bytes=10_000)
+    assert [image.read_bytes() for image in reloaded.get("k")] == [b"png-bytes"]
+
+
+def test_image_cache_shares_blobs_and_evicts_lru(tmp_path):
+    cache = ImageCache(tmp_path, max_bytes=25)
+    cache.put("a", [("image/png", b"x" * 10)])
+    cache.put("b", [("image/png", b"x" * 10)])
+    # Equal content is stored once
+    assert cache.total_bytes == 10
+    cache.put("c", [("image/png", b"y" * 10)])
+    cache.get("a")
+    cache.put("d", [("image/png", b"z" * 10)])
+    # Dropping "b" frees nothing while "a" still uses its blob, so "c" goes too
+    assert cache.get("b") is None
+    assert cache.get("c") is None
+    assert cache.get("a") is not None
+    assert cache.get("d") is not None
+    assert cache.total_bytes == 20
+
+
+def test_image_cache_coalesces_concurrent_misses(tmp_path):
+    cache = ImageCache(tmp_path, max_bytes=10_000)
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [("image/png", b"drawn")]
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_generate("k", generate) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(how for _, how in results) == ["coalesced", "coalesced", "miss"]
+    images, how = asyncio.run(cache.get_or_generate("k", generate))
+    assert how == "hit"
+    images, how = asyncio.run(cache.get_or_generate("k", generate, bypass=True))
+    assert how == "bypass"
+    assert len(calls) == 2
+
+
+def test_disabled_image_cache_keeps_nothing(tmp_path):
+    cache = ImageCache(tmp_path / "off", max_bytes=0)
+    stored = cache.put("k", [("image/png", b"data")])
+    assert stored[0].read_bytes() == b"data"
+    assert cache.get("k") is None
+    assert not (tmp_path / "off").exists()
+
+
+def test_cancelled_originator_does_not_fail_coalesced_callers(tmp_path):
+    cache = ImageCache(tmp_path, max_bytes=10_000)
+    release = asyncio.Event()
+
+    async def generate():
+        await release.wait()
+        return [("image/png", b"drawn")]
+
+    async def main():
+        originator = asyncio.create_task(cache.get_or_generate("k", generate))
+        await asyncio.sleep(0.01)
+        joiner = asyncio.create_task(cache.get_or_generate("k", generate))
+        await asyncio.sleep(0.01)
+        originator.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        images, how = await joiner
+        assert originator.cancelled()
+        return images, how
+
+    images, how = asyncio.run(main())
+    assert how == "coalesced"
+    assert images[0].read_bytes() == b"drawn"
+    assert cache.get("k") is not None
+
+
+def test_generation_is_cancelled_once_every_caller_gave_up(tmp_path):
+    cache = ImageCache(tmp_path, max_bytes=10_000)
+    cancelled = asyncio.Event()
+
+    async def generate():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return [("image/png", b"drawn")]
+
+    async def main():
+        callers = [asyncio.create_task(cache.get_or_generate("k", generate)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert cache._inflight == {}
+
+    asyncio.run(main())
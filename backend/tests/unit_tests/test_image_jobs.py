@@ -0,0 +1,94 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from agent import app as app_module
+from agent import images
+from agent.image_jobs import (
+    FAILED,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    IdempotencyConflict,
+    SQLiteJobStore,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite"), max_attempts=2)
+
+
+def test_submit_is_idempotent_per_key(store):
+    job, created = store.submit({"prompt": "a", "n": 1}, idempotency_key="key-1")
+    assert created
+    again, created = store.submit({"n": 1, "prompt": "a"}, idempotency_key="key-1")
+    assert not created
+    assert again.id == job.id
+    other, created = store.submit({"prompt": "a", "n": 1})
+    assert created
+    assert other.id != job.id
+
+
+def test_reused_key_with_another_request_conflicts(store):
+    job, _ = store.submit({"prompt": "a"}, idempotency_key="key-1")
+    with pytest.raises(IdempotencyConflict) as info:
+        store.submit({"prompt": "b"}, idempotency_key="key-1")
+    assert info.value.job_id == job.id
+
+
+def test_claim_complete_and_stale_worker(store):
+    job, _ = store.submit({"prompt": "a"})
+    claimed = store.claim("w1", lease_seconds=60)
+    assert claimed.id == job.id
+    assert claimed.status == RUNNING
+    assert claimed.attempts == 1
+    assert store.claim("w2", lease_seconds=60) is None
+    assert not store.complete(job.id, "w2", {"images": []})
+    assert store.complete(job.id, "w1", {"images": []})
+    assert store.get(job.id).status == SUCCEEDED
+
+
+def test_expired_lease_is_reclaimed_until_attempts_run_out(store, monkeypatch):
+    from agent import image_jobs
+
+    now = [1000.0]
+    monkeypatch.setattr(image_jobs.time, "time", lambda: now[0])
+    job, _ = store.submit({"prompt": "a"})
+    store.claim("w1", lease_seconds=10)
+    now[0] += 11
+    reclaimed = store.claim("w2", lease_seconds=10)
+    assert reclaimed.id == job.id
+    assert reclaimed.attempts == 2
+    assert not store.extend_lease(job.id, "w1", 10)
+    now[0] += 11
+    assert store.claim("w3", lease_seconds=10) is None
+    assert store.get(job.id).status == FAILED
+
+
+def test_retry_later_requeues_after_delay(store, monkeypatch):
+    from agent import image_jobs
+
+    now = [1000.0]
+    monkeypatch.setattr(image_jobs.time, "time", lambda: now[0])
+    job, _ = store.submit({"prompt": "a"})
+    store.claim("w1", lease_seconds=10)
+    assert store.retry_later(job.id, "w1", "busy", delay=5)
+    assert store.get(job.id).status == QUEUED
+    assert store.claim("w1", lease_seconds=10) is None
+    now[0] += 5
+    assert store.claim("w1", lease_seconds=10).id == job.id
+
+
+def test_image_jobs_endpoint_idempotency(store, monkeypatch):
+    monkeypatch.setattr(images, "_image_jobs", store)
+    client = TestClient(app_module.app)
+    headers = {"Idempotency-Key": "comic-1-page-1"}
+
+    first = client.post("/image_jobs", json={"prompt": "a red kite"}, headers=headers)
+    assert first.status_code == 202
+    repeat = client.post("/image_jobs", json={"prompt": "a red kite"}, headers=headers)
+    assert repeat.status_code == 200
+    assert repeat.json()["id"] == first.json()["id"]
+    conflict = client.post("/image_jobs", json={"prompt": "a blue kite"}, headers=headers)
+    assert conflict.status_code == 409
+    assert first.json()["id"] in conflict.json()["detail"]
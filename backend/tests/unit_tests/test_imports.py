@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+
+def _run(code: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def test_image_worker_does_not_load_the_graph_or_pillow():
+    loaded = _run(
+        "import sys, agent.image_worker, agent.images;"
+        "print(sorted(m for m in ('agent.graph', 'PIL', 'langgraph') if m in sys.modules))"
+    )
+    assert loaded == "[]"
+
+
+def test_package_exports_the_compiled_graph_after_the_submodule_is_imported():
+    assert _run(
+        "import agent.graph; from agent import graph; import agent;"
+        "print(type(graph).__name__, type(agent.graph).__name__)"
+    ) == "CompiledStateGraph CompiledStateGraph"
+    assert _run("from agent import graph; print(type(graph).__name__)") == "CompiledStateGraph"
@@ -0,0 +1,79 @@
+import pytest
+from pydantic import BaseModel
+
+from agent import llm_cache
+from agent.llm_cache import (
+    InMemoryLLMCache,
+    SQLiteLLMCache,
+    get_llm_cache,
+    llm_cache_key,
+)
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class OtherAnswer(BaseModel):
+    text: str
+    score: int
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryLLMCache(max_entries=2)
+    return SQLiteLLMCache(str(tmp_path / "llm.sqlite3"), max_entries=2)
+
+
+def test_llm_cache_key_depends_on_every_input():
+    key = llm_cache_key("m", 0.0, Answer, "prompt")
+    assert key == llm_cache_key("m", 0, Answer, "prompt")
+    assert key != llm_cache_key("other", 0.0, Answer, "prompt")
+    assert key != llm_cache_key("m", 1.0, Answer, "prompt")
+    assert key != llm_cache_key("m", 0.0, OtherAnswer, "prompt")
+    assert key != llm_cache_key("m", 0.0, "google_search", "prompt")
+    assert key != llm_cache_key("m", 0.0, Answer, "prompt ")
+
+
+def test_llm_cache_round_trip_and_counters(cache):
+    assert cache.get("k") is None
+    cache.set("k", {"text": "hi", "sources": [1, 2]})
+    assert cache.get("k") == {"text": "hi", "sources": [1, 2]}
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_llm_cache_expires_entries(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache.set("short", "a", ttl=10)
+    cache.set("forever", "b", ttl=0)
+    now[0] += 10
+    assert cache.get("short") is None
+    now[0] += 10**6
+    assert cache.get("forever") == "b"
+
+
+def test_llm_cache_evicts_least_recently_used(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache.set("a", 1)
+    now[0] += 1
+    cache.set("b", 2)
+    now[0] += 1
+    assert cache.get("a") == 1
+    now[0] += 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_get_llm_cache_backends(tmp_path):
+    assert get_llm_cache("none", "") is None
+    assert get_llm_cache("memory", "") is get_llm_cache("memory", "ignored")
+    path = str(tmp_path / "shared.sqlite3")
+    assert isinstance(get_llm_cache("sqlite", path), SQLiteLLMCache)
+    assert get_llm_cache("sqlite", path) is get_llm_cache("sqlite", path)
+    with pytest.raises(ValueError):
+        get_llm_cache("redis", "")
@@ -0,0 +1,61 @@
+from agent.query_dedup import (
+    QueryDeduplicator,
+    normalize_query,
+    query_tokens,
+    token_set_similarity,
+)
+
+
+def test_normalize_query_folds_case_width_and_punctuation():
+    assert normalize_query("  Who BUILT the  Eiffel-Tower?? ") == "who built the eiffel tower"
+    assert normalize_query("ＡＢＣ，埃菲尔铁塔！") == "abc 埃菲尔铁塔"
+
+
+def test_query_tokens_drop_stop_words_and_split_cjk_into_bigrams():
+    assert query_tokens("What is the history of the Eiffel Tower") == {
+        "history",
+        "eiffel",
+        "tower",
+    }
+    assert query_tokens("埃菲尔铁塔的历史") == {"埃菲", "菲尔", "尔铁", "铁塔", "塔历", "历史"}
+    assert query_tokens("塔") == {"塔"}
+
+
+def test_token_set_similarity_is_jaccard():
+    assert token_set_similarity(frozenset("ab"), frozenset("bc")) == 1 / 3
+    assert token_set_similarity(frozenset("ab"), frozenset("ab")) == 1.0
+    assert token_set_similarity(frozenset(), frozenset("ab")) == 0.0
+
+
+def test_dedupe_skips_queries_already_searched():
+    dedup = QueryDeduplicator()
+    kept, skipped = dedup.dedupe(
+        ["History of the Eiffel Tower", "Gustave Eiffel biography"],
+        seen_queries=["eiffel tower history?"],
+    )
+    assert kept == ["Gustave Eiffel biography"]
+    assert skipped == ["History of the Eiffel Tower"]
+
+
+def test_dedupe_merges_near_duplicates_keeping_the_longer_phrasing():
+    dedup = QueryDeduplicator(token_threshold=0.6)
+    kept, skipped = dedup.dedupe(
+        ["eiffel tower construction", "paris weather", "eiffel tower construction 1889"]
+    )
+    # The more specific phrasing takes the earlier slot
+    assert kept == ["eiffel tower construction 1889", "paris weather"]
+    assert skipped == ["eiffel tower construction"]
+
+
+def test_dedupe_drops_blank_queries_and_keeps_distinct_ones_in_order():
+    kept, skipped = QueryDeduplicator().dedupe(["b topic", "", "  ", "a topic"])
+    assert kept == ["b topic", "a topic"]
+    assert skipped == []
+
+
+def test_dedupe_uses_embeddings_when_given():
+    vectors = {"car prices": [1.0, 0.0], "automobile cost": [0.99, 0.05], "boats": [0.0, 1.0]}
+    dedup = QueryDeduplicator(embed=lambda texts: [vectors[t] for t in texts])
+    kept, skipped = dedup.dedupe(["automobile cost", "boats"], seen_queries=["car prices"])
+    assert kept == ["boats"]
+    assert skipped == ["automobile cost"]
@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+
+from agent import rate_limit
+from agent.rate_limit import LocalBuckets, ModelLimit, RateLimiter, parse_limits
+
+real_sleep = asyncio.sleep
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", fake)
+    return fake
+
+
+def test_parse_limits():
+    limits = parse_limits(" gemini-2.5-flash=1000/1000000, *=500 ,img=20/0,")
+    assert limits == {
+        "gemini-2.5-flash": ModelLimit(1000, 1_000_000),
+        "*": ModelLimit(500, 0),
+        "img": ModelLimit(20, 0),
+    }
+    assert parse_limits(None) == {}
+    assert ModelLimit().unlimited
+    assert not ModelLimit(rpm=1).unlimited
+
+
+def test_parse_limits_rejects_garbage():
+    with pytest.raises(ValueError, match="model=fast"):
+        parse_limits("model=fast")
+
+
+def test_local_bucket_takes_until_empty_then_asks_to_wait(clock):
+    buckets = LocalBuckets()
+    limit = ModelLimit(rpm=60, tpm=600)
+    assert buckets.take("m", limit, 1, 500).wait == 0
+    # 100 tokens left; 300 more refill at 10 tokens per second
+    state = buckets.take("m", limit, 1, 400)
+    assert state.wait == pytest.approx(30)
+    assert state.tokens == 100
+
+    clock.now += 30
+    state = buckets.take("m", limit, 1, 400)
+    assert state.wait == 0
+    assert state.tokens == pytest.approx(0)
+
+
+def test_local_bucket_refills_up_to_capacity(clock):
+    buckets = LocalBuckets()
+    limit = ModelLimit(rpm=2, tpm=0)
+    buckets.take("m", limit, 1, 0)
+    buckets.take("m", limit, 1, 0)
+    assert buckets.take("m", limit, 1, 0).wait == pytest.approx(30)
+    clock.now += 3600
+    assert buckets.take("m", limit, 1, 0).requests == 1
+
+
+def test_forced_take_goes_negative(clock):
+    buckets = LocalBuckets()
+    limit = ModelLimit(rpm=0, tpm=100)
+    state = buckets.take("m", limit, 0, 250, force=True)
+    assert state.wait == 0
+    assert state.tokens == -150
+
+
+def test_limit_for_falls_back_to_wildcard():
+    limiter = RateLimiter({"a": ModelLimit(1, 0), "*": ModelLimit(2, 0)})
+    assert limiter.limit_for("a") == ModelLimit(1, 0)
+    assert limiter.limit_for("b") == ModelLimit(2, 0)
+    assert RateLimiter({}).limit_for("b").unlimited
+
+
+def test_acquire_without_limit_does_not_wait():
+    limiter = RateLimiter({})
+    assert asyncio.run(limiter.acquire("m", tokens=10**9)) == 0.0
+    assert not limiter.saturated("m")
+
+
+def test_acquire_marks_model_saturated_when_bucket_is_empty(clock):
+    limiter = RateLimiter({"m": ModelLimit(rpm=2, tpm=0)})
+
+    async def main():
+        await limiter.acquire("m")
+        assert not limiter.saturated("m")
+        await limiter.acquire("m")
+
+    asyncio.run(main())
+    assert limiter.saturated("m")
+    assert limiter.stats()["models"]["m"]["requests_utilization"] == 1.0
+
+
+def test_acquire_waits_for_refill(clock, monkeypatch):
+    limiter = RateLimiter({"m": ModelLimit(rpm=60, tpm=0)})
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+        clock.now += seconds
+
+    async def main():
+        for _ in range(60):
+            await limiter.acquire("m")
+        monkeypatch.setattr(rate_limit.asyncio, "sleep", fake_sleep)
+        await limiter.acquire("m")
+
+    asyncio.run(main())
+    assert slept == [pytest.approx(rate_limit.MAX_POLL_SECONDS)]
+
+
+def test_large_calls_are_capped_at_the_bucket_size(clock):
+    limiter = RateLimiter({"m": ModelLimit(rpm=0, tpm=1000)})
+    assert asyncio.run(limiter.acquire("m", tokens=5000)) == pytest.approx(0)
+
+
+def test_settle_charges_the_difference(clock):
+    limiter = RateLimiter({"m": ModelLimit(rpm=0, tpm=1000)})
+    asyncio.run(limiter.acquire("m", tokens=100))
+    limiter.settle("m", estimated=100, actual=1100)
+    # The overdraft must refill before anything else goes through
+    assert limiter.saturated("m")
+    assert limiter._levels["m"].tokens == -100
+
+    limiter = RateLimiter({"m": ModelLimit(rpm=0, tpm=1000)})
+    asyncio.run(limiter.acquire("m", tokens=900))
+    limiter.settle("m", estimated=900, actual=100)
+    assert limiter._levels["m"].tokens == 900
+
+
+def test_settle_is_a_no_op_without_usage_or_token_limit(clock):
+    limiter = RateLimiter({"m": ModelLimit(rpm=10, tpm=0)})
+    limiter.settle("m", estimated=10, actual=10_000)
+    limiter.settle("other", estimated=10, actual=None)
+    assert limiter._levels == {}
+
+
+def test_callers_are_served_first_in_first_out(clock, monkeypatch):
+    limiter = RateLimiter({"m": ModelLimit(rpm=1, tpm=0)})
+    order = []
+
+    async def fake_sleep(seconds):
+        clock.now += seconds
+        await real_sleep(0)
+
+    async def caller(name):
+        await limiter.acquire("m")
+        order.append(name)
+
+    async def main():
+        await limiter.acquire("m")
+        monkeypatch.setattr(rate_limit.asyncio, "sleep", fake_sleep)
+        tasks = [asyncio.create_task(caller(name)) for name in "abc"]
+        await real_sleep(0)
+        assert limiter.saturated("m")
+        assert limiter.stats()["models"]["m"]["queued"] == 3
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["a", "b", "c"]
@@ -0,0 +1,245 @@
+import asyncio
+
+import httpx
+import pytest
+
+from agent import retry
+from agent.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    NoImageError,
+    RetryBudget,
+    RetryPolicy,
+    classify_error,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class ApiError(Exception):
+    def __init__(self, code, headers=None, details=None):
+        super().__init__(f"status {code}")
+        self.code = code
+        self.response = httpx.Response(code, headers=headers or {})
+        self.details = details
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(retry.time, "monotonic", fake)
+    return fake
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(retry.asyncio, "sleep", fake_sleep)
+    return slept
+
+
+def _failing(*errors, result="ok"):
+    calls = []
+
+    async def call():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return call, calls
+
+
+def test_classify_http_statuses():
+    assert classify_error(ApiError(429)) == retry.RetryDecision(True, "http_429")
+    assert classify_error(ApiError(503)).retryable
+    assert classify_error(ApiError(400)) == retry.RetryDecision(False, "http_400")
+    assert not classify_error(ApiError(404)).retryable
+
+
+def test_classify_reads_retry_delays():
+    assert classify_error(ApiError(429, headers={"retry-after": "7"})).retry_after == 7
+    details = {"error": {"details": [{"@type": "RetryInfo", "retryDelay": "12.5s"}]}}
+    assert classify_error(ApiError(429, details=details)).retry_after == 12.5
+
+
+def test_classify_ignores_malformed_retry_after():
+    details = {"error": {"details": [{"retryDelay": "3s"}]}}
+    error = ApiError(429, headers={"retry-after": "soon"}, details=details)
+    assert classify_error(error) == retry.RetryDecision(True, "http_429", 3)
+    assert classify_error(ApiError(503, headers={"retry-after": "soon"})).retry_after is None
+
+
+def test_classify_follows_the_cause_chain():
+    try:
+        try:
+            raise ApiError(400)
+        except ApiError as exc:
+            raise RuntimeError("wrapped") from exc
+    except RuntimeError as wrapped:
+        assert classify_error(wrapped) == retry.RetryDecision(False, "http_400")
+
+
+def test_classify_other_errors():
+    assert classify_error(asyncio.TimeoutError()).reason == "network"
+    assert classify_error(httpx.ConnectError("boom")).reason == "network"
+    assert classify_error(ValueError("?")) == retry.RetryDecision(True, "unknown")
+    assert classify_error(CircuitOpenError("m", 5)) == retry.RetryDecision(
+        False, "circuit_open", 5
+    )
+    assert classify_error(NoImageError({"error": "blocked"}, retryable=False)).reason == "safety"
+    assert classify_error(NoImageError({}, retryable=True)).retryable
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("m", failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_success()
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as info:
+        breaker.before_call()
+    assert info.value.retry_after == pytest.approx(30)
+
+
+def test_breaker_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("m", failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_release_frees_the_probe_without_closing(clock):
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+    breaker.release()
+    assert breaker.state == "half_open"
+    breaker.before_call()
+
+
+def test_retry_budget_caps_retries(clock):
+    budget = RetryBudget(ratio=0.5, min_per_second=0, capacity=2)
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+
+def test_retry_budget_trickles_in(clock):
+    budget = RetryBudget(ratio=0, min_per_second=1, capacity=1)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    clock.now += 1
+    assert budget.try_spend()
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=1, max_delay=5, multiplier=2)
+    for attempt in range(6):
+        assert 0 <= policy.backoff(attempt) <= min(5, 2**attempt)
+    assert policy.backoff(0, retry_after=3) == 3
+    assert policy.backoff(0, retry_after=6) is None
+
+
+def test_run_retries_transient_errors(clock, no_sleep):
+    call, calls = _failing(ApiError(503), ApiError(429, headers={"retry-after": "2"}))
+    breaker = CircuitBreaker("m")
+    assert asyncio.run(RetryPolicy(max_attempts=3).run(call, breaker=breaker)) == "ok"
+    assert len(calls) == 3
+    assert no_sleep[1] == 2
+    assert breaker.state == "closed"
+    assert breaker._failures == 0
+
+
+def test_run_gives_up_after_max_attempts(clock, no_sleep):
+    call, calls = _failing(*[ApiError(500)] * 5)
+    with pytest.raises(ApiError):
+        asyncio.run(RetryPolicy(max_attempts=3).run(call))
+    assert len(calls) == 3
+
+
+def test_run_does_not_retry_non_retryable_errors(clock, no_sleep):
+    call, calls = _failing(ApiError(400))
+    breaker = CircuitBreaker("m")
+    with pytest.raises(ApiError):
+        asyncio.run(RetryPolicy().run(call, breaker=breaker))
+    assert len(calls) == 1
+    assert no_sleep == []
+    assert breaker._failures == 0
+
+
+def test_run_non_retryable_error_keeps_the_circuit_half_open(clock, no_sleep):
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    call, _ = _failing(ApiError(400))
+    with pytest.raises(ApiError):
+        asyncio.run(RetryPolicy().run(call, breaker=breaker))
+    assert breaker.state == "half_open"
+    # The probe was released, so the next call may probe again
+    call, _ = _failing()
+    assert asyncio.run(RetryPolicy().run(call, breaker=breaker)) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_run_gives_up_on_long_retry_after(clock, no_sleep):
+    call, calls = _failing(ApiError(429, headers={"retry-after": "300"}))
+    with pytest.raises(ApiError):
+        asyncio.run(RetryPolicy(max_delay=20).run(call))
+    assert len(calls) == 1
+
+
+def test_run_stops_when_the_budget_is_spent(clock, no_sleep):
+    budget = RetryBudget(ratio=0, min_per_second=0, capacity=1)
+    budget.try_spend()
+    call, calls = _failing(ApiError(503))
+    with pytest.raises(ApiError):
+        asyncio.run(RetryPolicy().run(call, budget=budget))
+    assert len(calls) == 1
+
+
+def test_run_fails_fast_while_the_circuit_is_open(clock, no_sleep):
+    breaker = CircuitBreaker("m", failure_threshold=2, reset_timeout=30)
+    call, calls = _failing(*[ApiError(503)] * 5)
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(RetryPolicy(max_attempts=5).run(call, breaker=breaker))
+    assert len(calls) == 2
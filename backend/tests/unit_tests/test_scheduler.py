@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from agent.scheduler import FairScheduler
+
+
+def test_rejects_zero_concurrency():
+    with pytest.raises(ValueError):
+        FairScheduler(0)
+
+
+def test_free_slots_are_granted_immediately():
+    scheduler = FairScheduler(2)
+
+    async def main():
+        async with scheduler.slot("a") as first, scheduler.slot("b") as second:
+            assert first.wait_seconds < 0.1
+            assert second.granted_at is not None
+            assert scheduler.stats()["in_flight"] == 2
+        assert scheduler.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_slots_are_shared_round_robin_across_keys():
+    scheduler = FairScheduler(1)
+    order = []
+
+    async def job(key, index, release):
+        async with scheduler.slot(key):
+            order.append(f"{key}{index}")
+            await release.wait()
+
+    async def main():
+        release = asyncio.Event()
+        release.set()
+        gate = asyncio.Event()
+        holder = asyncio.create_task(job("x", 0, gate))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(job("a", i, release)) for i in range(3)]
+        tasks.append(asyncio.create_task(job("b", 0, release)))
+        tasks.append(asyncio.create_task(job("c", 0, release)))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued_by_key"] == {"a": 3, "b": 1, "c": 1}
+        gate.set()
+        await asyncio.gather(holder, *tasks)
+
+    asyncio.run(main())
+    # A key with a backlog does not keep the slot from keys that need one call
+    assert order == ["x0", "a0", "b0", "c0", "a1", "a2"]
+
+
+def test_per_key_limit_leaves_room_for_other_keys():
+    scheduler = FairScheduler(3, max_per_key=1)
+    running = []
+
+    async def job(key, release):
+        async with scheduler.slot(key):
+            running.append(key)
+            await release.wait()
+
+    async def main():
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(job(key, release)) for key in "aab"]
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert sorted(running) == ["a", "b"]
+        assert scheduler.stats()["queued"] == 1
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert sorted(running) == ["a", "a", "b"]
+
+
+def test_key_limit_overrides_max_per_key():
+    scheduler = FairScheduler(4)
+    running = []
+
+    async def job(release):
+        async with scheduler.slot("run", key_limit=2):
+            running.append(1)
+            await release.wait()
+
+    async def main():
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(job(release)) for _ in range(3)]
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert len(running) == 2
+        release.set()
+        await asyncio.gather(*tasks)
+        assert scheduler._key_limits == {}
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    scheduler = FairScheduler(1)
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("a"):
+                await gate.wait()
+
+        async def waiter():
+            async with scheduler.slot("b"):
+                pass
+
+        held = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert scheduler.stats()["queued"] == 0
+        gate.set()
+        await held
+        assert scheduler.stats()["in_flight"] == 0
+        # The slot is free again for the next caller
+        async with scheduler.slot("c"):
+            pass
+
+    asyncio.run(main())
@@ -0,0 +1,9 @@
+from agent.state import add_node_metrics
+
+
+def test_node_metrics_reducer_resets_at_run_start():
+    current = add_node_metrics([], [{"node": "generate_query", "run_start": True}])
+    current = add_node_metrics(current, [{"node": "web_research"}])
+    assert [e["node"] for e in current] == ["generate_query", "web_research"]
+    current = add_node_metrics(current, [{"node": "generate_query", "run_start": True}])
+    assert [e["node"] for e in current] == ["generate_query"]
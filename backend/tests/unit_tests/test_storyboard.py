@@ -0,0 +1,95 @@
+import json
+
+from agent.storyboard import StoryboardStreamParser, merge_storyboard
+
+PAGES = [
+    {"id": 1, "detail": "A lighthouse at dusk, {waves} crash below."},
+    {"id": 2, "detail": 'The keeper says "hello" and \\ waves.'},
+    {"id": 3, "detail": "Nested {\"braces\": [1, 2]} stay inside the string."},
+]
+
+
+def _feed_in_chunks(text: str, size: int) -> list[dict]:
+    parser = StoryboardStreamParser()
+    pages = []
+    for start in range(0, len(text), size):
+        pages.extend(parser.feed(text[start : start + size]))
+    return pages
+
+
+def test_parser_yields_pages_for_any_chunking():
+    text = json.dumps(PAGES, ensure_ascii=False)
+    for size in (1, 2, 7, len(text)):
+        assert _feed_in_chunks(text, size) == PAGES
+
+
+def test_parser_emits_each_page_as_soon_as_it_closes():
+    parser = StoryboardStreamParser()
+    assert parser.feed('[{"id": 1, "detail": "first"}, {"id": 2, ') == [
+        {"id": 1, "detail": "first"}
+    ]
+    assert parser.feed('"detail": "second"') == []
+    assert parser.feed("}]") == [{"id": 2, "detail": "second"}]
+
+
+def test_parser_skips_markdown_fence_and_text_before_the_array():
+    text = 'Here you go {not json}:\n```json\n[{"id": 1, "detail": "x"}]\n```'
+    assert _feed_in_chunks(text, 3) == [{"id": 1, "detail": "x"}]
+
+
+def test_parser_drops_objects_that_are_not_pages():
+    text = '[{"id": 1}, {"detail": "no id"}, {"id": 2, "detail": "ok"}, {"id": 3, "detail": bad}]'
+    assert _feed_in_chunks(text, 5) == [{"id": 2, "detail": "ok"}]
+
+
+def test_parser_keeps_nested_objects_inside_a_page():
+    text = '[{"id": 1, "detail": "x", "meta": {"panels": [{"n": 1}]}}]'
+    assert _feed_in_chunks(text, 4) == [
+        {"id": 1, "detail": "x", "meta": {"panels": [{"n": 1}]}}
+    ]
+
+
+def test_parser_buffer_does_not_grow_with_finished_pages():
+    parser = StoryboardStreamParser()
+    parser.feed("[")
+    for page_id in range(100):
+        parser.feed(json.dumps({"id": page_id, "detail": "x" * 100}) + ", ")
+    assert len(parser._buffer) < 200
+
+
+def test_merge_replaces_changed_pages_and_keeps_the_rest():
+    previous = [{"id": 1, "detail": "a"}, {"id": 2, "detail": "b"}, {"id": 3, "detail": "c"}]
+    pages, changed = merge_storyboard(previous, [{"id": 2, "detail": "B"}])
+    assert pages == [{"id": 1, "detail": "a"}, {"id": 2, "detail": "B"}, {"id": 3, "detail": "c"}]
+    assert changed == [2]
+
+
+def test_merge_appends_new_pages_in_page_order():
+    previous = [{"id": 1, "detail": "a"}, {"id": 3, "detail": "c"}]
+    pages, changed = merge_storyboard(previous, [{"id": "4", "detail": "d"}, {"id": 2, "detail": "b"}])
+    assert [page["id"] for page in pages] == [1, 2, 3, 4]
+    assert changed == [2, 4]
+
+
+def test_merge_ignores_whitespace_only_rewrites():
+    previous = [{"id": 1, "detail": "a  quiet\nharbor"}]
+    pages, changed = merge_storyboard(previous, [{"id": 1, "detail": " a quiet harbor "}])
+    assert pages == previous
+    assert changed == []
+
+
+def test_merge_with_allowed_ids_rejects_rewrites_of_other_pages():
+    previous = [{"id": 1, "detail": "a"}, {"id": 2, "detail": "b"}]
+    revised = [{"id": 1, "detail": "A"}, {"id": 2, "detail": "B"}, {"id": 3, "detail": "C"}]
+    pages, changed = merge_storyboard(previous, revised, allowed_ids={2})
+    assert pages == [{"id": 1, "detail": "a"}, {"id": 2, "detail": "B"}, {"id": 3, "detail": "C"}]
+    # New pages are always accepted; only existing pages outside the set are protected
+    assert changed == [2, 3]
+
+
+def test_merge_skips_malformed_pages():
+    previous = [{"id": 1, "detail": "a"}, {"id": "x", "detail": "bad id"}]
+    revised = [{"id": None, "detail": "?"}, {"detail": "no id"}, "text", {"id": 1, "detail": "A"}]
+    pages, changed = merge_storyboard(previous, revised)
+    assert pages == [{"id": 1, "detail": "A"}]
+    assert changed == [1]
@@ -3,7 +3,10 @@ import type { Message } from "@langchain/langgraph-sdk";
 import { useState, useEffect, useRef, useCallback } from "react";
 import { ProcessedEvent } from "@/components/ActivityTimeline";
 import { WelcomeScreen } from "@/components/WelcomeScreen";
-import { ChatMessagesView } from "@/components/ChatMessagesView";
+import {
+  ChatMessagesView,
+  StoryboardPage,
+} from "@/components/ChatMessagesView";
 import { Button } from "@/components/ui/button";
 
 export default function App() {
@@ -17,6 +20,8 @@ export default function App() {
     aspectRatio: "16:9",
     imageSize: "1K",
   });
+  // Pages of the storyboard being written, shown until the final message arrives
+  const [streamingPages, setStreamingPages] = useState<StoryboardPage[]>([]);
   const scrollAreaRef = useRef<HTMLDivElement>(null);
   const hasFinalizeEventOccurredRef = useRef(false);
   const [error, setError] = useState<string | null>(null);
@@ -26,6 +31,7 @@ export default function App() {
     max_research_loops: number;
     reasoning_model: string;
     language: string;
+    edit_mode?: boolean;
   }>({
     apiUrl: import.meta.env.DEV
       ? "http://localhost:2024"
@@ -63,6 +69,15 @@ export default function App() {
           data: "Composing and presenting the final answer.",
         };
         hasFinalizeEventOccurredRef.current = true;
+      } else if (event.revise_storyboard) {
+        const changed: number[] = event.revise_storyboard.changed_page_ids || [];
+        processedEvent = {
+          title: "Revise Scripts",
+          data: changed.length
+            ? `Rewrote page ${changed.join(", ")}; kept the rest.`
+            : "No page needed changes.",
+        };
+        hasFinalizeEventOccurredRef.current = true;
       }
       if (processedEvent) {
         setProcessedEventsTimeline((prevEvents) => [
@@ -71,6 +86,20 @@ export default function App() {
         ]);
       }
     },
+    onCustomEvent: (event: any) => {
+      const page = event?.storyboard_page;
+      if (
+        !page ||
+        typeof page.id !== "number" ||
+        typeof page.detail !== "string"
+      ) {
+        return;
+      }
+      setStreamingPages((prev) => [
+        ...prev.filter((p) => p.id !== page.id),
+        { id: page.id, detail: page.detail },
+      ]);
+    },
     onError: (error: any) => {
       setError(error.message);
     },
@@ -115,6 +144,7 @@ export default function App() {
     ) => {
       if (!submittedInputValue.trim()) return;
       setProcessedEventsTimeline([]);
+      setStreamingPages([]);
       hasFinalizeEventOccurredRef.current = false;
 
       // convert effort to, initial_search_query_count and max_research_loops
@@ -136,6 +166,12 @@ export default function App() {
           initial_search_query_count = 5;
           max_research_loops = 10;
           break;
+        case "revise":
+          // Edit mode rewrites the last storyboard from the thread's research;
+          // these only apply if the thread has nothing to revise yet.
+          initial_search_query_count = 1;
+          max_research_loops = 1;
+          break;
       }
 
       const newMessages: Message[] = [
@@ -155,6 +191,7 @@ export default function App() {
         language,
         aspect_ratio: aspectRatio,
         image_size: imageSize,
+        edit_mode: effort === "revise",
       });
     },
     [thread]
@@ -197,6 +234,7 @@ export default function App() {
               onCancel={handleCancel}
               liveActivityEvents={processedEventsTimeline}
               historicalActivities={historicalActivities}
+              streamingPages={streamingPages}
               aspectRatio={imageConfig.aspectRatio}
               imageSize={imageConfig.imageSize}
             />
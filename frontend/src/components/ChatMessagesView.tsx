@@ -160,6 +160,50 @@ const HumanMessageBubble: React.FC<HumanMessageBubbleProps> = ({
 };
 
 // Props for AiMessageBubble
+// Pick the first image of a /generate_image(s) response, with its thumbnail and
+// compressed full-size variants when the backend produced them.
+const toPageImage = (
+  payload: any
+): { url: string; thumbUrl: string; fullUrl: string } | null => {
+  const url = Array.isArray(payload?.images) ? payload.images[0] : null;
+  if (!url) return null;
+  const variants = Array.isArray(payload?.variants) ? payload.variants[0] : null;
+  return {
+    url,
+    thumbUrl: variants?.thumb ?? url,
+    fullUrl: variants?.web ?? url,
+  };
+};
+
+export type StoryboardPage = { id: number; detail: string };
+
+// Pages streamed by the server while the storyboard is still being written; the
+// final answer message replaces them once it arrives.
+const StreamingPages: React.FC<{
+  pages: StoryboardPage[];
+  mdComponents: typeof mdComponents;
+}> = ({ pages, mdComponents }) => (
+  <div className="space-y-3">
+    {[...pages]
+      .sort((a, b) => a.id - b.id)
+      .map((page) => (
+        <div
+          key={page.id}
+          className="rounded-xl border border-neutral-700 bg-neutral-800/80 p-3 shadow-sm space-y-2"
+        >
+          <div className="text-xs uppercase tracking-wide text-neutral-400">
+            Page {page.id}
+          </div>
+          <ReactMarkdown components={mdComponents}>{page.detail}</ReactMarkdown>
+        </div>
+      ))}
+    <div className="flex items-center text-xs text-neutral-400 gap-2">
+      <Loader2 className="h-4 w-4 animate-spin" />
+      <span>Writing remaining pages...</span>
+    </div>
+  </div>
+);
+
 interface AiMessageBubbleProps {
   message: Message;
   historicalActivity: ProcessedEvent[] | undefined;
@@ -169,6 +213,7 @@ interface AiMessageBubbleProps {
   mdComponents: typeof mdComponents;
   aspectRatio?: string;
   imageSize?: string;
+  streamingPages?: StoryboardPage[];
 }
 
 // AiMessageBubble Component
@@ -181,10 +226,12 @@ const AiMessageBubble: React.FC<AiMessageBubbleProps> = ({
   mdComponents,
   aspectRatio,
   imageSize,
+  streamingPages,
 }) => {
   type PageImageState = {
     status: "idle" | "pending" | "done" | "error";
-    images: { url: string; id: string }[];
+    // url: original; thumbUrl: card-sized preview; fullUrl: compressed full size
+    images: { url: string; thumbUrl: string; fullUrl: string; id: string }[];
     activeIndex: number;
     error?: string;
     draft: string;
@@ -286,15 +333,17 @@ const AiMessageBubble: React.FC<AiMessageBubbleProps> = ({
             number_of_images: 1,
             aspect_ratio: aspectRatio || "16:9",
             image_size: imageSize || "1K",
+            // Explicit (re)generation from a card always wants a fresh sample.
+            bypass_cache: true,
+            response_format: "url",
           }),
         });
         if (!res.ok) {
           throw new Error(await res.text());
         }
         const data = await res.json();
-        const url =
-          data?.images && Array.isArray(data.images) ? data.images[0] : null;
-        if (!url) throw new Error("No image returned");
+        const image = toPageImage(data);
+        if (!image) throw new Error("No image returned");
         setPageStates((prev) => {
           const current =
             prev[key] ||
@@ -308,7 +357,7 @@ const AiMessageBubble: React.FC<AiMessageBubbleProps> = ({
           const newImages = [
             ...(current.images || []),
             {
-              url,
+              ...image,
               id: `${Date.now()}-${Math.random().toString(36).slice(2, 8)}`,
             },
           ];
@@ -349,16 +398,158 @@ const AiMessageBubble: React.FC<AiMessageBubbleProps> = ({
     [aspectRatio, imageSize]
   );
 
+  // Initial render of a storyboard: one streamed batch request for every idle page
+  // instead of one /generate_image round trip per page.
+  const requestImageBatch = useCallback(
+    async (pages: { key: string; id: number; prompt: string }[]) => {
+      const backendBase = import.meta.env.DEV
+        ? "http://localhost:2024"
+        : "http://localhost:8123";
+      const pending = pages.filter((p) => p.prompt.trim());
+      if (pending.length === 0) return;
+      const keyById = new Map(pending.map((p) => [p.id, p.key]));
+
+      setPageStates((prev) => {
+        const next = { ...prev };
+        pending.forEach(({ key, prompt }) => {
+          const current =
+            prev[key] ||
+            ({
+              status: "idle",
+              images: [],
+              activeIndex: 0,
+              draft: prompt.trim(),
+              isEditing: false,
+            } as PageImageState);
+          next[key] = { ...current, status: "pending", error: undefined };
+        });
+        return next;
+      });
+
+      const settle = (
+        key: string,
+        image: ReturnType<typeof toPageImage>,
+        error?: string
+      ) => {
+        setPageStates((prev) => {
+          const current = prev[key];
+          if (!current) return prev;
+          if (!image) {
+            return {
+              ...prev,
+              [key]: {
+                ...current,
+                status: "error",
+                error: error || "No image returned",
+              },
+            };
+          }
+          const newImages = [
+            ...(current.images || []),
+            {
+              ...image,
+              id: `${Date.now()}-${Math.random().toString(36).slice(2, 8)}`,
+            },
+          ];
+          return {
+            ...prev,
+            [key]: {
+              ...current,
+              status: "done",
+              images: newImages,
+              activeIndex: newImages.length - 1,
+              error: undefined,
+            },
+          };
+        });
+      };
+
+      const readEvents = async (res: Response) => {
+        if (!res.body) return;
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = "";
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffered += decoder.decode(value, { stream: true });
+          const lines = buffered.split("\n");
+          buffered = lines.pop() ?? "";
+          lines.forEach((line) => {
+            if (!line.trim()) return;
+            const event = JSON.parse(line);
+            const key = keyById.get(event.id);
+            if (!key) return;
+            keyById.delete(event.id);
+            settle(
+              key,
+              toPageImage(event),
+              event.error ? JSON.stringify(event.error) : undefined
+            );
+          });
+        }
+      };
+
+      // Images the server started while the storyboard was being written; 404
+      // when the run did not generate them speculatively.
+      try {
+        const res = await fetch(
+          `${backendBase}/storyboards/${encodeURIComponent(messageKey)}/images`
+        );
+        if (res.ok) {
+          await readEvents(res);
+        }
+      } catch {
+        // Fall back to requesting the pages below
+      }
+      const remaining = pending.filter((p) => keyById.has(p.id));
+      if (remaining.length === 0) return;
+
+      try {
+        const res = await fetch(`${backendBase}/generate_images`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            pages: remaining.map((p) => ({ id: p.id, detail: p.prompt.trim() })),
+            number_of_images: 1,
+            aspect_ratio: aspectRatio || "16:9",
+            image_size: imageSize || "1K",
+            thread_id: messageKey,
+            response_format: "url",
+          }),
+        });
+        if (!res.ok || !res.body) {
+          throw new Error(await res.text());
+        }
+        await readEvents(res);
+        keyById.forEach((key) => settle(key, null, "Batch ended early"));
+      } catch (err) {
+        keyById.forEach((key) => settle(key, null, String(err)));
+      }
+    },
+    [aspectRatio, imageSize, messageKey]
+  );
+
   useEffect(() => {
     if (!parsedPages) return;
-    parsedPages.forEach((page) => {
-      const key = `${messageKey}-${page.id}`;
-      const state = pageStates[key];
-      if (!state || (state.status === "idle" && state.images.length === 0)) {
-        requestImage(key, state?.draft ?? page.detail);
-      }
-    });
-  }, [parsedPages, messageKey, pageStates, requestImage]);
+    const idlePages = parsedPages
+      .map((page) => {
+        const key = `${messageKey}-${page.id}`;
+        return { page, key, state: pageStates[key] };
+      })
+      .filter(
+        ({ state }) =>
+          !state || (state.status === "idle" && state.images.length === 0)
+      )
+      .map(({ page, key, state }) => ({
+        key,
+        id: page.id,
+        prompt: state?.draft ?? page.detail,
+      }));
+    if (idlePages.length > 0) {
+      requestImageBatch(idlePages);
+    }
+  }, [parsedPages, messageKey, pageStates, requestImageBatch]);
 
   const handlePromptChange = (key: string, value: string) => {
     setPageStates((prev) => {
@@ -498,11 +689,20 @@ const AiMessageBubble: React.FC<AiMessageBubbleProps> = ({
                 <div className="mt-1 space-y-2">
                   {activeImage ? (
                     <div className="relative">
-                      <img
-                        src={activeImage.url}
-                        alt={`Page ${page.id} illustration`}
-                        className="w-full rounded-lg border border-neutral-700"
-                      />
+                      {/* The card shows the thumbnail; full size loads on demand */}
+                      <a
+                        href={activeImage.fullUrl}
+                        target="_blank"
+                        rel="noreferrer"
+                        title="Open full size"
+                      >
+                        <img
+                          src={activeImage.thumbUrl}
+                          alt={`Page ${page.id} illustration`}
+                          loading="lazy"
+                          className="w-full rounded-lg border border-neutral-700"
+                        />
+                      </a>
                       {isPending && (
                         <div className="absolute inset-0 bg-black/40 rounded-lg flex items-center justify-center">
                           <Loader2 className="h-6 w-6 animate-spin text-white" />
@@ -540,8 +740,9 @@ const AiMessageBubble: React.FC<AiMessageBubbleProps> = ({
                           aria-label={`Show version ${idx + 1}`}
                         >
                           <img
-                            src={img.url}
+                            src={img.thumbUrl}
                             alt={`Version ${idx + 1}`}
+                            loading="lazy"
                             className="h-16 w-24 object-cover"
                           />
                           {idx === activeIndex && (
@@ -556,6 +757,11 @@ const AiMessageBubble: React.FC<AiMessageBubbleProps> = ({
             );
           })}
         </div>
+      ) : isLiveActivityForThisBubble &&
+        streamingPages &&
+        streamingPages.length > 0 ? (
+        // The answer is still streaming as raw JSON; show the finished pages
+        <StreamingPages pages={streamingPages} mdComponents={mdComponents} />
       ) : (
         <ReactMarkdown components={mdComponents}>
           {typeof message.content === "string"
@@ -584,6 +790,7 @@ interface ChatMessagesViewProps {
   historicalActivities: Record<string, ProcessedEvent[]>;
   aspectRatio?: string;
   imageSize?: string;
+  streamingPages?: StoryboardPage[];
 }
 
 export function ChatMessagesView({
@@ -596,6 +803,7 @@ export function ChatMessagesView({
   historicalActivities,
   aspectRatio,
   imageSize,
+  streamingPages = [],
 }: ChatMessagesViewProps) {
   return (
     <div className="flex flex-col h-full">
@@ -625,6 +833,7 @@ export function ChatMessagesView({
                       mdComponents={mdComponents}
                       aspectRatio={aspectRatio}
                       imageSize={imageSize}
+                      streamingPages={streamingPages}
                     />
                   )}
                 </div>
@@ -645,7 +854,15 @@ export function ChatMessagesView({
                         isLoading={true}
                       />
                     </div>
-                  ) : (
+                  ) : null}
+                  {streamingPages.length > 0 ? (
+                    <div className="mt-3">
+                      <StreamingPages
+                        pages={streamingPages}
+                        mdComponents={mdComponents}
+                      />
+                    </div>
+                  ) : liveActivityEvents.length > 0 ? null : (
                     <div className="flex items-center justify-start h-full">
                       <Loader2 className="h-5 w-5 animate-spin text-neutral-400 mr-2" />
                       <span>Processing...</span>
@@ -8,6 +8,7 @@ import {
   Zap,
   Cpu,
   Languages,
+  Sparkles,
 } from "lucide-react";
 import { Textarea } from "@/components/ui/textarea";
 import {
@@ -41,7 +42,8 @@ export const InputForm: React.FC<InputFormProps> = ({
 }) => {
   const [internalInputValue, setInternalInputValue] = useState("");
   const [effort, setEffort] = useState("low");
-  // Default to a current, broadly capable model
+  // Default to a current, broadly capable model. "auto" uses the backend's
+  // configured models, picked per step by complexity when model routing is on.
   const [model, setModel] = useState("gemini-2.5-flash");
   const [language, setLanguage] = useState("简体中文");
   const [aspectRatio, setAspectRatio] = useState("16:9");
@@ -142,6 +144,14 @@ export const InputForm: React.FC<InputFormProps> = ({
                 >
                   High
                 </SelectItem>
+                {hasHistory && (
+                  <SelectItem
+                    value="revise"
+                    className="hover:bg-neutral-600 focus:bg-neutral-600 cursor-pointer"
+                  >
+                    Revise
+                  </SelectItem>
+                )}
               </SelectContent>
             </Select>
           </div>
@@ -155,6 +165,14 @@ export const InputForm: React.FC<InputFormProps> = ({
                 <SelectValue placeholder="Model" />
               </SelectTrigger>
             <SelectContent className="bg-neutral-700 border-neutral-600 text-neutral-300 cursor-pointer">
+              <SelectItem
+                value="auto"
+                className="hover:bg-neutral-600 focus:bg-neutral-600 cursor-pointer"
+              >
+                <div className="flex items-center">
+                  <Sparkles className="h-4 w-4 mr-2 text-green-400" /> Auto
+                </div>
+              </SelectItem>
               <SelectItem
                 value="gemini-2.5-flash-lite"
                 className="hover:bg-neutral-600 focus:bg-neutral-600 cursor-pointer"